@@ -0,0 +1,169 @@
+"""
+Artifact Cache
+Content-addressed cache for detection and segmentation results. Entries are
+keyed by a hash of the video's content hash plus every input that changes the
+output (corners, detection mode, LOS position, model id/version, player
+prompts, ...), and hold the JSON result together with the rendered artifacts
+(hard-linked when possible). Least recently used entries are evicted once the
+cache grows past its size budget.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Bump when an algorithm change makes old results stale
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024 * 1024
+
+
+def make_key(kind: str, video_hash: str, **params) -> str:
+    """Stable key for one request: kind + video content hash + canonical JSON of the params"""
+    payload = json.dumps(
+        {"version": CACHE_VERSION, "kind": kind, "video": video_hash, "params": params},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _link_or_copy(src: Path, dst: Path):
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ArtifactCache:
+    """
+    One directory per entry under root: meta.json (result + bookkeeping) and the
+    artifact files. Writers of artifacts must replace files rather than rewrite
+    them in place, since entries may share inodes with the served outputs.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _load(self):
+        for entry_dir in self.root.iterdir():
+            if entry_dir.name.startswith("."):
+                # Leftover of an interrupted put()
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            meta_path = entry_dir / "meta.json"
+            try:
+                with meta_path.open() as f:
+                    meta = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            meta["last_access"] = meta_path.stat().st_mtime
+            self._entries[entry_dir.name] = meta
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(e["size"] for e in self._entries.values())
+
+    def get(self, key: str, restore_to: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+        """
+        Cached result for key, or None. With restore_to, artifacts missing from
+        that directory are put back from the cache first.
+        """
+        with self._lock:
+            meta = self._entries.get(key)
+            if meta is None:
+                return None
+            entry_dir = self.root / key
+            try:
+                if restore_to is not None:
+                    for name in meta["artifacts"]:
+                        target = Path(restore_to) / name
+                        if not target.exists():
+                            _link_or_copy(entry_dir / name, target)
+                now = time.time()
+                os.utime(entry_dir / "meta.json", (now, now))
+            except OSError:
+                # Entry damaged on disk, drop it and recompute
+                self._remove(key)
+                return None
+            meta["last_access"] = now
+            return meta["result"]
+
+    def put(self, key: str, result: Dict[str, Any], artifacts: Optional[List[Path]] = None,
+            kind: str = "", video: str = "") -> None:
+        """Store result and its artifact files (looked up by name on restore)"""
+        artifacts = [Path(a) for a in artifacts or []]
+        entry_dir = self.root / key
+        tmp_dir = self.root / f".{key}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir()
+        try:
+            size = 0
+            for artifact in artifacts:
+                _link_or_copy(artifact, tmp_dir / artifact.name)
+                size += artifact.stat().st_size
+            meta = {
+                "kind": kind, "video": video, "created_at": time.time(),
+                "artifacts": [a.name for a in artifacts], "size": size, "result": result
+            }
+            with (tmp_dir / "meta.json").open("w") as f:
+                json.dump(meta, f)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            os.replace(tmp_dir, entry_dir)
+            meta["last_access"] = time.time()
+            self._entries[key] = meta
+            self._evict()
+
+    def _remove(self, key: str):
+        """Caller holds the lock"""
+        self._entries.pop(key, None)
+        shutil.rmtree(self.root / key, ignore_errors=True)
+
+    def _evict(self):
+        """Drop least recently used entries until under budget (caller holds the lock)"""
+        total = self.total_bytes
+        for key in sorted(self._entries, key=lambda k: self._entries[k]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            total -= self._entries[key]["size"]
+            self._remove(key)
+
+    def invalidate(self, video: Optional[str] = None, kind: Optional[str] = None,
+                   key: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Remove entries matching every given filter (all entries if none); returns what was removed"""
+        removed = []
+        with self._lock:
+            for k, meta in list(self._entries.items()):
+                if key is not None and k != key:
+                    continue
+                if video is not None and meta["video"] != video:
+                    continue
+                if kind is not None and meta["kind"] != kind:
+                    continue
+                removed.append({"key": k, "kind": meta["kind"], "video": meta["video"], "artifacts": meta["artifacts"]})
+                self._remove(k)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            kinds: Dict[str, int] = {}
+            for meta in self._entries.values():
+                kinds[meta["kind"]] = kinds.get(meta["kind"], 0) + 1
+            return {"entries": len(self._entries), "bytes": self.total_bytes, "max_bytes": self.max_bytes, "kinds": kinds}
@@ -0,0 +1,216 @@
+"""
+Detection Plans
+Crop geometry for player detection compiled once per (corners, detection_mode,
+los_position, view shape) and reused across frames: region rect, LOS box and
+grid band rects are computed up front, the region is enhanced once per frame
+and grid bands are sliced out of it as views.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Any, Tuple
+
+import cv2
+import numpy as np
+
+GRID_MODES = ('grid', 'grid_1280')
+SHARPEN_KERNEL = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]], dtype=np.float32)
+
+# Plans kept around for reuse (full-video detection hits the same few every frame)
+PLAN_CACHE_SIZE = 64
+_plan_cache = OrderedDict()
+_plan_lock = threading.Lock()
+
+# cv2.CLAHE objects carry state between apply() calls, so one per thread
+_clahe_local = threading.local()
+
+
+def calculate_los_aabb(p1, p2, p3, p4, t, margin=40):
+    """
+    Calculate AABB of the LOS polygon at position t, expanded by margin.
+    Replicates frontend logic.
+    Points are dicts {'x': val, 'y': val}.
+    """
+    def lerp(a, b, t):
+        return {
+            'x': a['x'] + (b['x'] - a['x']) * t,
+            'y': a['y'] + (b['y'] - a['y']) * t
+        }
+
+    far_dist = math.sqrt((p2['x'] - p1['x'])**2 + (p2['y'] - p1['y'])**2)
+    near_dist = math.sqrt((p3['x'] - p4['x'])**2 + (p3['y'] - p4['y'])**2)
+
+    ratio = far_dist / near_dist if near_dist > 0 else 1.0
+    w_near = 11
+    w_far = 11 * ratio
+
+    l_far = lerp(p1, p2, t)
+    l_near = lerp(p4, p3, t)
+
+    dx = l_near['x'] - l_far['x']
+    dy = l_near['y'] - l_far['y']
+    length = math.sqrt(dx*dx + dy*dy)
+
+    if length == 0:
+        return None
+
+    ux = dx / length
+    uy = dy / length
+
+    nx = -uy
+    ny = ux
+
+    # calculate polygon corners
+    poly = [
+        {'x': l_far['x'] + nx * w_far / 2, 'y': l_far['y'] + ny * w_far / 2},
+        {'x': l_far['x'] - nx * w_far / 2, 'y': l_far['y'] - ny * w_far / 2},
+        {'x': l_near['x'] - nx * w_near / 2, 'y': l_near['y'] - ny * w_near / 2},
+        {'x': l_near['x'] + nx * w_near / 2, 'y': l_near['y'] + ny * w_near / 2}
+    ]
+
+    xs = [p['x'] for p in poly]
+    ys = [p['y'] for p in poly]
+
+    min_x, max_x = min(xs), max(xs)
+    min_y, max_y = min(ys), max(ys)
+
+    return {
+        'x1': min_x - margin,
+        'y1': min_y - margin,
+        'x2': max_x + margin,
+        'y2': max_y + margin
+    }
+
+
+def _clip_rect(x, y, w, h, img_w, img_h) -> Tuple[int, int, int, int]:
+    x, y = max(0, x), max(0, y)
+    return x, y, min(w, img_w - x), min(h, img_h - y)
+
+
+def enhance_crop(cropped):
+    """CLAHE on the L channel followed by a sharpening pass"""
+    clahe = getattr(_clahe_local, 'clahe', None)
+    if clahe is None:
+        clahe = _clahe_local.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+    try:
+        lab = cv2.cvtColor(cropped, cv2.COLOR_BGR2LAB)
+        l, a, b = cv2.split(lab)
+        l = clahe.apply(l)
+        enhanced = cv2.cvtColor(cv2.merge([l, a, b]), cv2.COLOR_LAB2BGR)
+        return cv2.filter2D(enhanced, -1, SHARPEN_KERNEL)
+    except cv2.error:
+        return cropped
+
+
+class DetectionPlan:
+    """Precomputed crop geometry for one view"""
+
+    def __init__(self, corners, y_offset, view_shape, view_name, detection_mode, los_position=0.5):
+        img_h, img_w = view_shape[:2]
+        self.view_name = view_name
+        self.detection_mode = detection_mode
+        self.error = None
+        self.region = None  # (x, y, w, h) inside the view
+        self.bands = []     # (x, y, w, h) inside the view, grid modes only
+        self.imgsz = 1280 if detection_mode in ['fop_1280', 'grid_1280'] else 640
+
+        # Determine detection region based on mode
+        region_corners = corners # Default to fop
+        if detection_mode == 'full':
+            region_corners = [{'x': 0, 'y': 0}, {'x': img_w, 'y': 0}, {'x': img_w, 'y': img_h}, {'x': 0, 'y': img_h}]
+        elif detection_mode == 'los' and len(corners) == 4:
+            aabb = calculate_los_aabb(corners[0], corners[1], corners[2], corners[3], los_position)
+            if aabb:
+                xl, yl, xr, yr = max(0, int(aabb['x1'])), max(0, int(aabb['y1'] - y_offset)), min(img_w, int(aabb['x2'])), min(img_h, int(aabb['y2'] - y_offset))
+                region_corners = [{'x': xl, 'y': yl}, {'x': xr, 'y': yl}, {'x': xr, 'y': yr}, {'x': xl, 'y': yr}]
+
+        if detection_mode in ['fop', 'grid', 'fop_1280', 'grid_1280']:
+            region_corners = [{'x': c['x'], 'y': c['y'] - y_offset} for c in region_corners]
+
+        points = np.array([[c["x"], c["y"]] for c in region_corners], dtype=np.int32)
+        x, y, w, h = _clip_rect(*cv2.boundingRect(points), img_w, img_h)
+        if w <= 0 or h <= 0:
+            self.error = "Invalid region"
+            return
+        self.region = (x, y, w, h)
+
+        if detection_mode in GRID_MODES and len(region_corners) == 4:
+            self.bands = self._grid_bands(region_corners, w, img_w, img_h)
+            if not self.bands:
+                self.error = "No valid bands"
+            # Use 1280 for grid_1280 bands too
+            self.imgsz = 1280 if detection_mode == 'grid_1280' else 640
+
+    def _grid_bands(self, region_corners, w, img_w, img_h):
+        p1, p2, p3, p4 = region_corners[0], region_corners[1], region_corners[2], region_corners[3]
+
+        if self.detection_mode == 'grid_1280':
+            # Dynamic bands: target 1280 width with 50px absolute overlap
+            target_w = 1280
+            overlap_px = 50
+            effective_w = target_w - overlap_px # 1230
+            num_bands = int(np.ceil(w / effective_w))
+            # Recalculate overlap T to be exactly overlap_px
+            # Total T range is 1.0. Overlap T is overlap_px / w
+            overlap_t = overlap_px / w if w > 0 else 0.2
+        else:
+            # Original grid: 10 bands, 20% overlap
+            num_bands, overlap_t = 10, 0.2
+
+        def lerp_p(a, b, t): return {'x': a['x'] + (b['x'] - a['x']) * t, 'y': a['y'] + (b['y'] - a['y']) * t}
+        bands = []
+        for i in range(num_bands):
+            t_start = max(0, (i / num_bands) - overlap_t/2)
+            t_end = min(1, ((i + 1) / num_bands) + overlap_t/2)
+            b_corners = [lerp_p(p1, p2, t_start), lerp_p(p1, p2, t_end), lerp_p(p4, p3, t_end), lerp_p(p4, p3, t_start)]
+            band = _clip_rect(*cv2.boundingRect(np.array([[c['x'], c['y']] for c in b_corners], dtype=np.int32)), img_w, img_h)
+            if band[2] > 0 and band[3] > 0:
+                bands.append(band)
+        return bands
+
+    @property
+    def is_grid(self) -> bool:
+        return bool(self.bands)
+
+    def metadata(self) -> Dict[str, Any]:
+        if self.error:
+            return {"view": self.view_name, "error": self.error}
+        if self.is_grid:
+            return {"view": self.view_name, "bands": len(self.bands), "imgsz": self.imgsz}
+        x, y, w, h = self.region
+        return {"view": self.view_name, "crop_size": f"{w}x{h}", "imgsz": self.imgsz}
+
+    def crops(self, img) -> List[Dict[str, Any]]:
+        """YOLO input crops for one frame of this view: {'image', 'x', 'y'} with offsets inside img"""
+        if self.error:
+            return []
+        x, y, w, h = self.region
+        # Enhance the region once; overlapping bands share the enhanced pixels
+        enhanced = enhance_crop(img[y:y+h, x:x+w])
+        if not self.is_grid:
+            return [{'image': enhanced, 'x': x, 'y': y}]
+        return [
+            {'image': enhanced[by-y:by-y+bh, bx-x:bx-x+bw], 'x': bx, 'y': by}
+            for bx, by, bw, bh in self.bands
+        ]
+
+
+def _corners_key(corners) -> Optional[Tuple]:
+    return tuple((float(c['x']), float(c['y'])) for c in corners or [])
+
+
+def get_detection_plan(corners, y_offset, view_shape, view_name, detection_mode, los_position=0.5) -> DetectionPlan:
+    """Return a cached DetectionPlan for this geometry, compiling it on first use"""
+    key = (_corners_key(corners), y_offset, tuple(view_shape[:2]), view_name, detection_mode, float(los_position))
+    with _plan_lock:
+        plan = _plan_cache.get(key)
+        if plan is not None:
+            _plan_cache.move_to_end(key)
+            return plan
+    plan = DetectionPlan(corners, y_offset, view_shape, view_name, detection_mode, los_position)
+    with _plan_lock:
+        _plan_cache[key] = plan
+        while len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    return plan
@@ -0,0 +1,234 @@
+"""
+Detection Store
+Full-video detection results as a Parquet table with one row per detected
+player (frame, view, box, confidence, track id, keyframe). Frame-level facts
+(fps, processed frame range and stride, detection settings) are kept as JSON in
+the file's key-value metadata, so frames without any detection need no rows.
+Rows are sorted by frame and written in small row groups, so a range query only
+reads the row groups whose frame statistics overlap the window.
+While a job runs, ResultWriter appends every frame to an NDJSON file that
+clients can follow live, and spills rows to Parquet chunks that are merged
+into the final file at the end, so memory does not grow with video length.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import polars as pl
+
+METADATA_KEY = "detection"
+# Rows per row group - the unit a range query skips or reads
+ROW_GROUP_SIZE = 16384
+# Frames returned by one query at most
+MAX_QUERY_FRAMES = 5000
+# Frames buffered by ResultWriter before they are written out as a Parquet chunk
+CHUNK_FRAMES = 2048
+NDJSON_NAME = "detections.ndjson"
+
+VIEWS = ("top", "bottom")
+# Names the frontend uses for the stereo views
+VIEW_ALIASES = {"left": "top", "right": "bottom", "top": "top", "bottom": "bottom"}
+
+SCHEMA = {
+    "frame": pl.Int32,
+    "view": pl.Utf8,
+    "x1": pl.Float32,
+    "y1": pl.Float32,
+    "x2": pl.Float32,
+    "y2": pl.Float32,
+    "confidence": pl.Float32,
+    "track_id": pl.Int32,
+    "keyframe": pl.Boolean,
+}
+
+
+def to_table(results: List[Dict[str, Any]]) -> pl.DataFrame:
+    """Per-frame records ({frame, top_players, bottom_players, keyframe}) as one row per player"""
+    columns: Dict[str, list] = {name: [] for name in SCHEMA}
+    for r in results:
+        for view in VIEWS:
+            for p in r[f"{view}_players"]:
+                columns["frame"].append(r["frame"])
+                columns["view"].append(view)
+                for c in ("x1", "y1", "x2", "y2"):
+                    columns[c].append(p[c])
+                columns["confidence"].append(p.get("confidence", 0.0))
+                columns["track_id"].append(p.get("track_id"))
+                columns["keyframe"].append(r.get("keyframe", True))
+    return pl.DataFrame(columns, schema=SCHEMA)
+
+
+def read_meta(path: Path) -> Dict[str, Any]:
+    """Metadata dict stored by write()"""
+    raw = pl.read_parquet_metadata(path).get(METADATA_KEY)
+    if raw is None:
+        raise ValueError(f"{Path(path).name} is not a detection result")
+    return json.loads(raw)
+
+
+def _player(row: Dict[str, Any]) -> Dict[str, Any]:
+    """A row (or tracker box) in the ellipse format of the exported JSON"""
+    return {
+        "centerX": int(round((row["x1"] + row["x2"]) / 2)),
+        "centerY": int(round((row["y1"] + row["y2"]) / 2)),
+        "radiusX": int(round((row["x2"] - row["x1"]) / 2)),
+        "radiusY": int(round((row["y2"] - row["y1"]) / 2)),
+        "confidence": float(f"{row['confidence']:.4f}"),
+        "trackId": row["track_id"]
+    }
+
+
+def frame_json(record: Dict[str, Any], fps: float) -> Dict[str, Any]:
+    """
+    One per-frame record as query() returns it. Boxes are rounded to float32
+    first, so live records match the ones later read back from the Parquet file.
+    """
+    def player(p):
+        row = {c: float(np.float32(p[c])) for c in ("x1", "y1", "x2", "y2")}
+        return _player({**row, "confidence": float(np.float32(p.get("confidence", 0.0))), "track_id": p.get("track_id")})
+
+    return {
+        "frameNumber": record["frame"],
+        "videoTimestamp": float(f"{record['frame'] / fps:.4f}"),
+        "left_view": [player(p) for p in record["top_players"]],
+        "right_view": [player(p) for p in record["bottom_players"]]
+    }
+
+
+def query(path: Path, start_frame: Optional[int] = None, end_frame: Optional[int] = None,
+          start_time: Optional[float] = None, end_time: Optional[float] = None,
+          view: Optional[str] = None, min_confidence: Optional[float] = None,
+          max_frames: int = MAX_QUERY_FRAMES) -> Dict[str, Any]:
+    """
+    Frames in [start, end) - by frame number or by time in seconds - in the
+    per-frame shape of the exported JSON (frameNumber, videoTimestamp,
+    left_view, right_view). Every processed frame in the window is listed, with
+    or without detections; at most max_frames of them, next_frame tells where
+    the next page starts.
+    """
+    meta = read_meta(path)
+    fps = meta["fps"]
+    first, stride, count = meta["first_frame"], meta["frame_stride"], meta["frame_count"]
+    last = first + (count - 1) * stride  # last processed frame
+
+    if start_time is not None:
+        start_frame = int(round(start_time * fps)) if start_frame is None else max(start_frame, int(round(start_time * fps)))
+    if end_time is not None:
+        end_frame = int(round(end_time * fps)) if end_frame is None else min(end_frame, int(round(end_time * fps)))
+    start_frame = first if start_frame is None else max(first, start_frame)
+    end_frame = last + 1 if end_frame is None else min(last + 1, end_frame)
+
+    # Processed frames in the window (those on the stride grid), one page of them
+    frames = list(range(first + -(-(start_frame - first) // stride) * stride, end_frame, stride))
+    next_frame = frames[max_frames] if len(frames) > max_frames else None
+    frames = frames[:max_frames]
+
+    results = []
+    if frames:
+        views = None
+        if view:
+            if view not in VIEW_ALIASES:
+                raise ValueError(f"Unknown view '{view}'")
+            views = [VIEW_ALIASES[view]]
+        lf = pl.scan_parquet(path).filter(pl.col("frame").is_between(frames[0], frames[-1]))
+        if views:
+            lf = lf.filter(pl.col("view").is_in(views))
+        if min_confidence is not None:
+            lf = lf.filter(pl.col("confidence") >= min_confidence)
+
+        by_frame: Dict[int, Dict[str, list]] = {f: {"top": [], "bottom": []} for f in frames}
+        for row in lf.collect().iter_rows(named=True):
+            if row["frame"] in by_frame:
+                by_frame[row["frame"]][row["view"]].append(_player(row))
+        results = [{
+            "frameNumber": f,
+            "videoTimestamp": float(f"{f / fps:.4f}"),
+            "left_view": by_frame[f]["top"],
+            "right_view": by_frame[f]["bottom"]
+        } for f in frames]
+
+    return {
+        "meta": meta,
+        "start_frame": start_frame,
+        "end_frame": end_frame,
+        "next_frame": next_frame,
+        "results": results
+    }
+
+
+class ResultWriter:
+    """
+    Writes the records of a running detection job into directory: each frame
+    goes to the NDJSON file at once and into a row buffer that is spilled as a
+    Parquet chunk every CHUNK_FRAMES frames. state() makes everything so far
+    durable and returns what a checkpoint needs to reopen the writer at that
+    point; finish() merges the chunks into the final result file.
+    """
+
+    def __init__(self, directory: Path, fps: float, state: Optional[Dict[str, Any]] = None):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.fps = fps
+        state = state or {}
+        self.frames = state.get("frames", 0)
+        self.chunks = state.get("chunks", 0)
+        self._pending: List[Dict[str, Any]] = []
+
+        # Drop whatever an earlier run wrote after its last checkpoint
+        for chunk in self.dir.glob("chunk_*.parquet"):
+            if int(chunk.stem.split("_")[1]) >= self.chunks:
+                chunk.unlink()
+        self.ndjson_path = self.dir / NDJSON_NAME
+        if state and self.ndjson_path.exists():
+            os.truncate(self.ndjson_path, state.get("ndjson_bytes", 0))
+            self._ndjson = self.ndjson_path.open("ab")
+        else:
+            self._ndjson = self.ndjson_path.open("wb")
+
+    def append(self, record: Dict[str, Any]):
+        """Add a frame ({frame, top_players, bottom_players, keyframe}); frames must come in order"""
+        self._ndjson.write(json.dumps(frame_json(record, self.fps)).encode() + b"\n")
+        self._ndjson.flush()  # visible to readers following the file
+        self._pending.append(record)
+        self.frames += 1
+        if len(self._pending) >= CHUNK_FRAMES:
+            self._spill()
+
+    def _spill(self):
+        if not self._pending:
+            return
+        chunk = self.dir / f"chunk_{self.chunks:05d}.parquet"
+        to_table(self._pending).write_parquet(chunk, compression="zstd")
+        self.chunks += 1
+        self._pending.clear()
+
+    def state(self) -> Dict[str, Any]:
+        """Spill and sync everything written so far; the result reopens the writer here"""
+        self._spill()
+        os.fsync(self._ndjson.fileno())
+        return {"frames": self.frames, "chunks": self.chunks, "ndjson_bytes": self._ndjson.tell()}
+
+    def finish(self, path: Path, meta: Dict[str, Any]) -> int:
+        """
+        Merge all frames into the result file at path with meta in its metadata; returns the file size.
+        meta must hold fps, first_frame, frame_stride and frame_count (frames processed).
+        """
+        self._spill()
+        self.close()
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        chunks = sorted(self.dir.glob("chunk_*.parquet"))
+        lf = pl.scan_parquet(chunks) if chunks else to_table([]).lazy()
+        lf.sink_parquet(
+            tmp_path, compression="zstd", statistics=True, row_group_size=ROW_GROUP_SIZE,
+            metadata={METADATA_KEY: json.dumps(meta)}
+        )
+        os.replace(tmp_path, path)
+        return path.stat().st_size
+
+    def close(self):
+        if not self._ndjson.closed:
+            self._ndjson.close()
@@ -1,215 +1,326 @@
 """
 Experiment Database Manager
-Handles SQLite database operations for experiment persistence
+Handles SQLite database operations for experiment persistence, through a
+pool of long-lived WAL-mode connections (see sqlite_pool). Timeline payloads
+are stored zlib-compressed next to a summary of their small fields; the
+summaries are what an experiment is served with by default.
 """
 
-import sqlite3
 import json
+import os
+import zlib
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
+
+import backend.sqlite_pool as sqlite_pool
 
 # Database file path
 DB_PATH = Path(__file__).parent / "experiments.db"
+POOL_SIZE = int(os.environ.get("EXPERIMENT_DB_POOL_SIZE", sqlite_pool.DEFAULT_POOL_SIZE))
 
+# Shared by all request threads; created by init_db()
+pool: Optional[sqlite_pool.ConnectionPool] = None
 
-def dict_factory(cursor, row):
-    """Convert SQLite rows to dictionaries"""
-    d = {}
-    for idx, col in enumerate(cursor.description):
-        d[col[0]] = row[idx]
-    return d
-
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Payload fields larger than this (as JSON) are left out of timeline summaries
+SUMMARY_FIELD_BYTES = 1024
 
-def get_connection():
-    """Get database connection with row factory"""
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.row_factory = dict_factory
-    return conn
+# Newest video of an experiment (kept in experiments.latest_video)
+LATEST_VIDEO_SQL = """
+    SELECT video_url FROM experiment_videos 
+    WHERE experiment_id = {experiment_id} 
+    ORDER BY added_at DESC, id DESC LIMIT 1
+"""
 
 
 def init_db():
     """Initialize database with schema"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Experiments table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS experiments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL
-        )
-    """)
-    
-    # Timeline entries table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS experiment_timeline (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            experiment_id INTEGER NOT NULL,
-            step_type TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
-            data TEXT,
-            FOREIGN KEY (experiment_id) REFERENCES experiments(id) ON DELETE CASCADE
-        )
-    """)
-    
-    # Videos table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS experiment_videos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            experiment_id INTEGER NOT NULL,
-            video_url TEXT NOT NULL,
-            video_type TEXT NOT NULL,
-            added_at TEXT NOT NULL,
-            FOREIGN KEY (experiment_id) REFERENCES experiments(id) ON DELETE CASCADE
-        )
-    """)
-    
-    # Create indexes for better performance
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_timeline_experiment 
-        ON experiment_timeline(experiment_id)
-    """)
-    
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_videos_experiment 
-        ON experiment_videos(experiment_id)
-    """)
-    
-    conn.commit()
-    conn.close()
+    global pool
+    pool = sqlite_pool.ConnectionPool(DB_PATH, size=POOL_SIZE)
+    with pool.transaction() as conn:
+        # Experiments table
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS experiments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                timeline_count INTEGER NOT NULL DEFAULT 0,
+                latest_video TEXT,
+                revision INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        
+        # Timeline entries table
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS experiment_timeline (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                experiment_id INTEGER NOT NULL,
+                step_type TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                data TEXT,
+                summary TEXT,
+                omitted TEXT,
+                payload BLOB,
+                payload_size INTEGER,
+                FOREIGN KEY (experiment_id) REFERENCES experiments(id) ON DELETE CASCADE
+            )
+        """)
+        
+        # Videos table
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS experiment_videos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                experiment_id INTEGER NOT NULL,
+                video_url TEXT NOT NULL,
+                video_type TEXT NOT NULL,
+                added_at TEXT NOT NULL,
+                FOREIGN KEY (experiment_id) REFERENCES experiments(id) ON DELETE CASCADE
+            )
+        """)
+        
+        # Create indexes for better performance
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_timeline_experiment 
+            ON experiment_timeline(experiment_id)
+        """)
+        
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_videos_experiment 
+            ON experiment_videos(experiment_id)
+        """)
+        
+        # Listing pages walk this index newest first
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_experiments_updated 
+            ON experiments(updated_at, id)
+        """)
+        
+        # Databases from before the summary columns: add and backfill them once
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(experiments)")}
+        if "timeline_count" not in columns:
+            conn.execute("ALTER TABLE experiments ADD COLUMN timeline_count INTEGER NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE experiments ADD COLUMN latest_video TEXT")
+            conn.execute(f"""
+                UPDATE experiments SET
+                    timeline_count = (SELECT COUNT(*) FROM experiment_timeline 
+                                      WHERE experiment_id = experiments.id),
+                    latest_video = ({LATEST_VIDEO_SQL.format(experiment_id="experiments.id")})
+            """)
+        
+        if "revision" not in columns:
+            conn.execute("ALTER TABLE experiments ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+        
+        # Databases from before compressed payloads: add the columns and convert the data once
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(experiment_timeline)")}
+        if "payload" not in columns:
+            for column in ("summary TEXT", "omitted TEXT", "payload BLOB", "payload_size INTEGER"):
+                conn.execute(f"ALTER TABLE experiment_timeline ADD COLUMN {column}")
+        legacy = conn.execute("SELECT id, data FROM experiment_timeline WHERE data IS NOT NULL").fetchall()
+        for entry in legacy:
+            try:
+                data = json.loads(entry["data"])
+            except json.JSONDecodeError:
+                data = None
+            conn.execute("""
+                UPDATE experiment_timeline 
+                SET data = NULL, summary = ?, omitted = ?, payload = ?, payload_size = ?
+                WHERE id = ?
+            """, (*_encode_payload(data), entry["id"]))
+        
+        # Triggers keep timeline_count and latest_video up to date on every insert and delete,
+        # and bump the revision the experiment's ETag is made from
+        for name in ("trg_timeline_insert", "trg_timeline_delete", "trg_videos_insert", "trg_videos_delete"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute("""
+            CREATE TRIGGER trg_timeline_insert AFTER INSERT ON experiment_timeline BEGIN
+                UPDATE experiments SET timeline_count = timeline_count + 1, revision = revision + 1 
+                WHERE id = NEW.experiment_id;
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER trg_timeline_delete AFTER DELETE ON experiment_timeline BEGIN
+                UPDATE experiments SET timeline_count = timeline_count - 1, revision = revision + 1 
+                WHERE id = OLD.experiment_id;
+            END
+        """)
+        for event, row in (("INSERT", "NEW"), ("DELETE", "OLD")):
+            conn.execute(f"""
+                CREATE TRIGGER trg_videos_{event.lower()} AFTER {event} ON experiment_videos BEGIN
+                    UPDATE experiments 
+                    SET latest_video = ({LATEST_VIDEO_SQL.format(experiment_id=f"{row}.experiment_id")}),
+                        revision = revision + 1
+                    WHERE id = {row}.experiment_id;
+                END
+            """)
 
 
 def create_experiment(name: str = "unnamed experiment") -> int:
     """Create a new experiment and return its ID"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
     now = datetime.now().isoformat()
-    cursor.execute("""
-        INSERT INTO experiments (name, created_at, updated_at)
-        VALUES (?, ?, ?)
-    """, (name, now, now))
-    
-    experiment_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    
-    return experiment_id
+    with pool.transaction() as conn:
+        cursor = conn.execute("""
+            INSERT INTO experiments (name, created_at, updated_at)
+            VALUES (?, ?, ?)
+        """, (name, now, now))
+        return cursor.lastrowid
 
 
 def get_all_experiments() -> List[Dict[str, Any]]:
     """Get all experiments with summary info"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT 
-            e.id,
-            e.name,
-            e.created_at,
-            e.updated_at,
-            COUNT(DISTINCT t.id) as timeline_count,
-            (SELECT video_url FROM experiment_videos 
-             WHERE experiment_id = e.id 
-             ORDER BY added_at DESC LIMIT 1) as latest_video
-        FROM experiments e
-        LEFT JOIN experiment_timeline t ON e.id = t.experiment_id
-        GROUP BY e.id
-        ORDER BY e.updated_at DESC
+    return pool.query("""
+        SELECT id, name, created_at, updated_at, timeline_count, latest_video
+        FROM experiments
+        ORDER BY updated_at DESC, id DESC
     """)
-    
-    experiments = cursor.fetchall()
-    conn.close()
-    
-    return experiments
 
 
-def get_experiment(experiment_id: int) -> Optional[Dict[str, Any]]:
-    """Get experiment details with full timeline"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Get experiment info
-    cursor.execute("""
-        SELECT * FROM experiments WHERE id = ?
-    """, (experiment_id,))
-    
-    experiment = cursor.fetchone()
-    if not experiment:
-        conn.close()
-        return None
-    
-    # Get timeline entries
-    cursor.execute("""
-        SELECT * FROM experiment_timeline 
-        WHERE experiment_id = ?
-        ORDER BY timestamp ASC
-    """, (experiment_id,))
-    
-    timeline = cursor.fetchall()
-    
-    # Parse JSON data in timeline entries
-    for entry in timeline:
-        if entry['data']:
-            try:
-                entry['data'] = json.loads(entry['data'])
-            except json.JSONDecodeError:
-                entry['data'] = None
-    
-    # Get videos
-    cursor.execute("""
-        SELECT * FROM experiment_videos 
-        WHERE experiment_id = ?
-        ORDER BY added_at DESC
-    """, (experiment_id,))
-    
-    videos = cursor.fetchall()
-    
-    conn.close()
-    
-    experiment['timeline'] = timeline
-    experiment['videos'] = videos
+def get_experiments_page(limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of experiments with summary info, most recently updated first.
+    Pass the returned cursor to get the next page (None when there are no more).
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        # Keyset: continue strictly after the last row of the previous page
+        updated_at, _, last_id = cursor.rpartition("|")
+        if not updated_at or not last_id.isdigit():
+            raise ValueError("Invalid cursor")
+        rows = pool.query("""
+            SELECT id, name, created_at, updated_at, timeline_count, latest_video
+            FROM experiments
+            WHERE (updated_at, id) < (?, ?)
+            ORDER BY updated_at DESC, id DESC
+            LIMIT ?
+        """, (updated_at, int(last_id), limit + 1))
+    else:
+        rows = pool.query("""
+            SELECT id, name, created_at, updated_at, timeline_count, latest_video
+            FROM experiments
+            ORDER BY updated_at DESC, id DESC
+            LIMIT ?
+        """, (limit + 1,))
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['updated_at']}|{rows[-1]['id']}"
+    return rows, next_cursor
+
+
+def _encode_payload(data: Any) -> Tuple[Optional[str], Optional[str], Optional[bytes], int]:
+    """
+    Columns stored for a timeline payload: summary (JSON of the fields up to
+    SUMMARY_FIELD_BYTES), omitted (JSON list of the other field names), the
+    compressed payload and its uncompressed size
+    """
+    if data is None:
+        return None, None, None, 0
+    full = json.dumps(data)
+    if isinstance(data, dict):
+        fields = {k: json.dumps(v) for k, v in data.items()}
+        small = {k: v for k, v in fields.items() if len(v) <= SUMMARY_FIELD_BYTES}
+        summary = "{" + ", ".join(f"{json.dumps(k)}: {v}" for k, v in small.items()) + "}"
+        large = [k for k in fields if k not in small]
+        omitted = json.dumps(large) if large else None
+    else:
+        summary, omitted = (full if len(full) <= SUMMARY_FIELD_BYTES else None), None
+    return summary, omitted, zlib.compress(full.encode()), len(full)
+
+
+def _timeline_entry(row: Any, full: bool = False) -> Dict[str, Any]:
+    """
+    A timeline row as served: data is the summary, with the names of the fields
+    left out in omitted (empty when full, where data is the whole payload)
+    """
+    entry = {
+        "id": row["id"], "experiment_id": row["experiment_id"], "step_type": row["step_type"],
+        "timestamp": row["timestamp"], "data": None, "omitted": [], "data_size": row["payload_size"] or 0
+    }
+    if full:
+        if row["payload"] is not None:
+            entry["data"] = json.loads(zlib.decompress(row["payload"]))
+    else:
+        if row["summary"] is not None:
+            entry["data"] = json.loads(row["summary"])
+        if row["omitted"]:
+            entry["omitted"] = json.loads(row["omitted"])
+    return entry
+
+
+def get_experiment_revision(experiment_id: int) -> Optional[int]:
+    """Counter that changes with every change to an experiment (None if it doesn't exist)"""
+    row = pool.query_one("SELECT revision FROM experiments WHERE id = ?", (experiment_id,))
+    return row["revision"] if row else None
+
+
+def get_experiment(experiment_id: int, full: bool = False) -> Optional[Dict[str, Any]]:
+    """Get experiment details with its timeline (entry summaries, or whole payloads if full)"""
+    payload_column = "payload" if full else "NULL AS payload"
+    # One read snapshot, so the timeline and videos match the experiment row
+    with pool.transaction(write=False) as conn:
+        experiment = conn.execute("""
+            SELECT * FROM experiments WHERE id = ?
+        """, (experiment_id,)).fetchone()
+        if not experiment:
+            return None
+        
+        timeline = conn.execute(f"""
+            SELECT id, experiment_id, step_type, timestamp, summary, omitted, payload_size, {payload_column}
+            FROM experiment_timeline 
+            WHERE experiment_id = ?
+            ORDER BY timestamp ASC, id ASC
+        """, (experiment_id,)).fetchall()
+        
+        videos = conn.execute("""
+            SELECT * FROM experiment_videos 
+            WHERE experiment_id = ?
+            ORDER BY added_at DESC
+        """, (experiment_id,)).fetchall()
+    
+    experiment = dict(experiment)
+    experiment['timeline'] = [_timeline_entry(entry, full) for entry in timeline]
+    experiment['videos'] = [dict(video) for video in videos]
     
     return experiment
 
 
+def get_timeline_entry(experiment_id: int, entry_id: int) -> Optional[Dict[str, Any]]:
+    """One timeline entry with its whole payload"""
+    with pool.connection() as conn:
+        row = conn.execute("""
+            SELECT * FROM experiment_timeline 
+            WHERE id = ? AND experiment_id = ?
+        """, (entry_id, experiment_id)).fetchone()
+    return _timeline_entry(row, full=True) if row else None
+
+
 def update_experiment_name(experiment_id: int, name: str) -> bool:
     """Update experiment name"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
     now = datetime.now().isoformat()
-    cursor.execute("""
-        UPDATE experiments 
-        SET name = ?, updated_at = ?
-        WHERE id = ?
-    """, (name, now, experiment_id))
-    
-    success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    
-    return success
+    with pool.transaction() as conn:
+        cursor = conn.execute("""
+            UPDATE experiments 
+            SET name = ?, updated_at = ?, revision = revision + 1
+            WHERE id = ?
+        """, (name, now, experiment_id))
+        return cursor.rowcount > 0
 
 
-def update_experiment_timestamp(experiment_id: int):
-    """Update experiment's updated_at timestamp"""
-    conn = get_connection()
-    cursor = conn.cursor()
+def update_experiment_timestamp(experiment_id: int, conn=None):
+    """Update experiment's updated_at timestamp (inside conn's transaction if given)"""
+    if conn is None:
+        with pool.transaction() as conn:
+            return update_experiment_timestamp(experiment_id, conn)
     
     now = datetime.now().isoformat()
-    cursor.execute("""
+    conn.execute("""
         UPDATE experiments 
-        SET updated_at = ?
+        SET updated_at = ?, revision = revision + 1
         WHERE id = ?
     """, (now, experiment_id))
-    
-    conn.commit()
-    conn.close()
 
 
 def add_timeline_entry(
@@ -219,65 +330,61 @@ def add_timeline_entry(
     replace_existing: bool = False
 ) -> int:
     """Add a timeline entry to an experiment"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    if replace_existing:
-        cursor.execute("""
-            DELETE FROM experiment_timeline 
-            WHERE experiment_id = ? AND step_type = ?
-        """, (experiment_id, step_type))
+    return add_timeline_entries(experiment_id, [{"step_type": step_type, "data": data}], replace_existing)[0]
+
+
+def add_timeline_entries(
+    experiment_id: int,
+    entries: List[Dict[str, Any]],
+    replace_existing: bool = False
+) -> List[int]:
+    """
+    Add several timeline entries ({step_type, data}) in one transaction and return their IDs.
+    With replace_existing, earlier entries of the same step types are removed first.
+    """
+    if not entries:
+        return []
     
     now = datetime.now().isoformat()
-    data_json = json.dumps(data) if data else None
-    
-    cursor.execute("""
-        INSERT INTO experiment_timeline (experiment_id, step_type, timestamp, data)
-        VALUES (?, ?, ?, ?)
-    """, (experiment_id, step_type, now, data_json))
-    
-    entry_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    
-    # Update experiment timestamp
-    update_experiment_timestamp(experiment_id)
-    
-    return entry_id
+    rows = [(experiment_id, e["step_type"], now, *_encode_payload(e.get("data") or None)) for e in entries]
+    with pool.transaction() as conn:
+        if replace_existing:
+            conn.executemany("""
+                DELETE FROM experiment_timeline 
+                WHERE experiment_id = ? AND step_type = ?
+            """, [(experiment_id, step_type) for step_type in {e["step_type"] for e in entries}])
+        
+        conn.executemany("""
+            INSERT INTO experiment_timeline (experiment_id, step_type, timestamp, summary, omitted, payload, payload_size)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        # The transaction holds the write lock, so the new rows got consecutive IDs
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        
+        # Update experiment timestamp
+        update_experiment_timestamp(experiment_id, conn)
+    
+    return list(range(last_id - len(rows) + 1, last_id + 1))
 
 
 def add_video(experiment_id: int, video_url: str, video_type: str) -> int:
     """Add a video reference to an experiment"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
     now = datetime.now().isoformat()
-    cursor.execute("""
-        INSERT INTO experiment_videos (experiment_id, video_url, video_type, added_at)
-        VALUES (?, ?, ?, ?)
-    """, (experiment_id, video_url, video_type, now))
-    
-    video_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    
-    return video_id
+    with pool.transaction() as conn:
+        cursor = conn.execute("""
+            INSERT INTO experiment_videos (experiment_id, video_url, video_type, added_at)
+            VALUES (?, ?, ?, ?)
+        """, (experiment_id, video_url, video_type, now))
+        return cursor.lastrowid
 
 
 def delete_experiment(experiment_id: int) -> bool:
     """Delete an experiment and all related data"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        DELETE FROM experiments WHERE id = ?
-    """, (experiment_id,))
-    
-    success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    
-    return success
+    with pool.transaction() as conn:
+        cursor = conn.execute("""
+            DELETE FROM experiments WHERE id = ?
+        """, (experiment_id,))
+        return cursor.rowcount > 0
 
 
 # Initialize database on module import
@@ -0,0 +1,279 @@
+"""
+Frame Service
+Random access to decoded frames of uploaded videos. A seek index (frame count,
+geometry and keyframe positions) is built once per video and kept next to the
+upload hash index; frames are served from an LRU of decoded frames under a
+memory budget. A miss costs one seek to the preceding keyframe, or just a few
+decodes when it lies shortly after the last frame read from that video.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# PyAV is optional - with it the index records real keyframe positions
+try:
+    import av
+except ImportError:
+    av = None
+
+DEFAULT_MEMORY_BUDGET = int(os.environ.get("FRAME_CACHE_BYTES", 1024 * 1024 * 1024))
+# Without a keyframe index: read forward instead of seeking when the target is at most this many frames ahead
+MAX_FORWARD_DECODE = 30
+# Open readers kept for sequential access
+MAX_OPEN_READERS = 4
+
+VIEWS = ("full", "top", "bottom")
+
+
+def split_view(frame: np.ndarray, view: str) -> np.ndarray:
+    """Stereo half of a stacked frame as a view (no copy)"""
+    if view == "full":
+        return frame
+    half = frame.shape[0] // 2
+    if view == "top":
+        return frame[:half]
+    if view == "bottom":
+        return frame[half:]
+    raise ValueError(f"Unknown view '{view}'")
+
+
+def build_index(path: Path) -> Dict[str, Any]:
+    """Frame count, fps, geometry and (with PyAV) keyframe frame indices of a video"""
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise IOError(f"Failed to open video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    index = {
+        "fps": fps,
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "frame_count": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "keyframes": None,
+    }
+    cap.release()
+
+    if av is not None:
+        # Demux only (no decoding) to find keyframes
+        try:
+            with av.open(str(path)) as container:
+                stream = container.streams.video[0]
+                pts = sorted(p.pts for p in container.demux(stream) if p.pts is not None and p.is_keyframe)
+                packets_start = stream.start_time or 0
+                index["keyframes"] = [
+                    int(round(float((p - packets_start) * stream.time_base) * fps)) for p in pts
+                ]
+        except Exception as e:
+            print(f"Keyframe scan failed for {path}: {e}")
+    return index
+
+
+class _Reader:
+    """
+    An open capture plus the index of the next frame it will return.
+    users and retired are guarded by the FrameService lock: a reader that is
+    evicted while in use is closed by its last user.
+    """
+
+    def __init__(self, path: Path):
+        self.cap = cv2.VideoCapture(str(path))
+        if not self.cap.isOpened():
+            raise IOError(f"Failed to open video: {path}")
+        self.next_index = 0
+        self.lock = threading.Lock()
+        self.users = 0
+        self.retired = False
+
+    def read(self, index: int, keyframes: Optional[List[int]]) -> Optional[np.ndarray]:
+        ahead = index - self.next_index
+        if ahead < 0 or ahead > self._forward_limit(index, keyframes):
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            self.next_index = index
+        # Frames between the current position and the target are grabbed without colour conversion
+        while self.next_index < index:
+            if not self.cap.grab():
+                return None
+            self.next_index += 1
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        self.next_index = index + 1
+        return frame
+
+    def _forward_limit(self, index: int, keyframes: Optional[List[int]]) -> int:
+        if not keyframes:
+            return MAX_FORWARD_DECODE
+        # A seek decodes from the keyframe before the target; reading forward is
+        # cheaper exactly when that keyframe is not past the current position
+        pos = int(np.searchsorted(keyframes, index, side="right")) - 1
+        key = keyframes[pos] if pos >= 0 else 0
+        return index if key <= self.next_index else 0
+
+    def close(self):
+        self.cap.release()
+
+
+class FrameService:
+    """Seek indexes, open readers and an LRU of decoded frames for the videos in video_dir"""
+
+    def __init__(self, video_dir: Path, index_dir: Optional[Path] = None,
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        self.video_dir = Path(video_dir)
+        self.index_dir = Path(index_dir) if index_dir else self.video_dir / ".meta"
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.memory_budget = memory_budget
+        self.bytes_cached = 0
+        self._frames: "OrderedDict[Tuple[str, int], np.ndarray]" = OrderedDict()
+        self._indexes: Dict[str, Dict[str, Any]] = {}
+        self._readers: "OrderedDict[str, _Reader]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, filename: str) -> Path:
+        path = self.video_dir / filename
+        if not path.exists():
+            raise FileNotFoundError(filename)
+        return path
+
+    def index(self, filename: str) -> Dict[str, Any]:
+        """Seek index of a video, built on first use and persisted"""
+        path = self._path(filename)
+        stat = path.stat()
+        signature = {"size": stat.st_size, "mtime": stat.st_mtime}
+        with self._lock:
+            cached = self._indexes.get(filename)
+        if cached and cached["signature"] == signature:
+            return cached
+
+        index_path = self.index_dir / f"{filename}.index.json"
+        index = None
+        if index_path.exists():
+            try:
+                with index_path.open() as f:
+                    index = json.load(f)
+                if index.get("signature") != signature:
+                    index = None
+            except (OSError, json.JSONDecodeError):
+                index = None
+        if index is None:
+            index = {**build_index(path), "signature": signature}
+            with index_path.open("w") as f:
+                json.dump(index, f)
+
+        stale = []
+        with self._lock:
+            if filename in self._indexes and self._indexes[filename]["signature"] != signature:
+                stale = self._drop_video(filename)
+            self._indexes[filename] = index
+        for reader in stale:
+            reader.close()
+        return index
+
+    def _retire(self, reader: _Reader) -> List[_Reader]:
+        """Mark a reader dropped from _readers; returns it if nobody uses it, to be closed (caller holds the lock)"""
+        reader.retired = True
+        return [reader] if reader.users == 0 else []
+
+    def _checkout(self, filename: str) -> _Reader:
+        """Open reader of a video, held until _checkin so eviction can't close it mid-read"""
+        with self._lock:
+            reader = self._readers.get(filename)
+            if reader is not None:
+                self._readers.move_to_end(filename)
+                reader.users += 1
+                return reader
+
+        # Opening a capture is slow; other videos are served meanwhile
+        opened = _Reader(self._path(filename))
+        stale = []
+        with self._lock:
+            reader = self._readers.get(filename)
+            if reader is None:
+                reader, opened = opened, None
+                self._readers[filename] = reader
+                while len(self._readers) > MAX_OPEN_READERS:
+                    _, old = self._readers.popitem(last=False)
+                    stale += self._retire(old)
+            else:
+                # Lost a race with another request for the same video
+                self._readers.move_to_end(filename)
+            reader.users += 1
+        if opened is not None:
+            stale.append(opened)
+        for old in stale:
+            old.close()
+        return reader
+
+    def _checkin(self, reader: _Reader):
+        with self._lock:
+            reader.users -= 1
+            unused = reader.retired and reader.users == 0
+        if unused:
+            reader.close()
+
+    def frame(self, filename: str, index: int = 0, view: str = "full") -> Optional[np.ndarray]:
+        """
+        Decoded BGR frame (or stereo half, see VIEWS), None if index is past the end.
+        The array is shared with the cache and read-only; copy it before drawing on it.
+        """
+        meta = self.index(filename)
+        if index < 0 or (meta["frame_count"] and index >= meta["frame_count"]):
+            return None
+
+        key = (filename, index)
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                return split_view(frame, view)
+
+        reader = self._checkout(filename)
+        try:
+            with reader.lock:
+                frame = reader.read(index, meta.get("keyframes"))
+        finally:
+            self._checkin(reader)
+        if frame is None:
+            return None
+        frame.flags.writeable = False
+
+        with self._lock:
+            if key not in self._frames and frame.nbytes <= self.memory_budget:
+                self._frames[key] = frame
+                self.bytes_cached += frame.nbytes
+                while self.bytes_cached > self.memory_budget:
+                    _, old = self._frames.popitem(last=False)
+                    self.bytes_cached -= old.nbytes
+        return split_view(frame, view)
+
+    def _drop_video(self, filename: str) -> List[_Reader]:
+        """
+        Forget frames, reader and index of a video (caller holds the lock).
+        Returns the reader to close once the lock is released, if it is not in use.
+        """
+        for key in [k for k in self._frames if k[0] == filename]:
+            self.bytes_cached -= self._frames.pop(key).nbytes
+        self._indexes.pop(filename, None)
+        reader = self._readers.pop(filename, None)
+        return self._retire(reader) if reader is not None else []
+
+    def invalidate(self, filename: str):
+        with self._lock:
+            stale = self._drop_video(filename)
+        for reader in stale:
+            reader.close()
+        index_path = self.index_dir / f"{filename}.index.json"
+        if index_path.exists():
+            index_path.unlink()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "frames": len(self._frames), "bytes": self.bytes_cached, "memory_budget": self.memory_budget,
+                "videos_indexed": len(self._indexes), "open_readers": len(self._readers)
+            }
@@ -0,0 +1,134 @@
+"""
+In-memory frame sources for SAM 2 video propagation
+Decodes a video once and hands the frames straight to a SAM 2 inference state
+as a normalized tensor, instead of round-tripping them through a JPEG folder.
+The original BGR frames can be kept for the render pass (keep_frames); callers
+that render long clips decode the video again instead, so memory does not grow
+with full-resolution frames.
+"""
+
+import threading
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+from backend.video_decoder import VideoDecoder
+
+# SAM 2 is optional during dev, same as in main.py
+try:
+    import sam2.sam2_video_predictor as sam2_video_module
+except ImportError:
+    sam2_video_module = None
+
+# Normalization SAM 2 applies in sam2.utils.misc.load_video_frames
+SAM2_IMG_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+SAM2_IMG_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# init_state looks up load_video_frames at call time, so it is swapped under a lock
+_loader_lock = threading.Lock()
+
+
+class FrameSource:
+    """
+    Frames of one view, stored both as SAM 2 input (N, 3, S, S) float32 and,
+    optionally, as the original BGR images for rendering.
+    """
+
+    def __init__(self, image_size: int, capacity: int = 0, keep_frames: bool = True):
+        self.image_size = image_size
+        self.keep_frames = keep_frames
+        self.frames: List[np.ndarray] = []
+        self.height = 0
+        self.width = 0
+        self._count = 0
+        self._buffer = np.empty((max(capacity, 1), 3, image_size, image_size), dtype=np.float32)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, frame_bgr: np.ndarray):
+        """Convert a BGR frame to SAM 2's normalized layout and store it"""
+        if self._count == 0:
+            self.height, self.width = frame_bgr.shape[:2]
+        if self._count == len(self._buffer):
+            # Frame count from the container was short, grow geometrically
+            grown = np.empty((len(self._buffer) * 2,) + self._buffer.shape[1:], dtype=np.float32)
+            grown[:self._count] = self._buffer[:self._count]
+            self._buffer = grown
+
+        rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+        resized = cv2.resize(rgb, (self.image_size, self.image_size), interpolation=cv2.INTER_LINEAR)
+        normalized = (resized.astype(np.float32) * (1.0 / 255.0) - SAM2_IMG_MEAN) / SAM2_IMG_STD
+        self._buffer[self._count] = normalized.transpose(2, 0, 1)
+        self._count += 1
+
+        if self.keep_frames:
+            self.frames.append(frame_bgr)
+
+    def images(self) -> torch.Tensor:
+        """SAM 2 input tensor, sharing memory with the internal buffer"""
+        return torch.from_numpy(self._buffer[:self._count])
+
+    def frame(self, idx: int) -> np.ndarray:
+        """Original BGR frame (a copy, so callers can draw on it)"""
+        return self.frames[idx].copy()
+
+
+def init_state_from_source(predictor, source: FrameSource, **init_kwargs):
+    """
+    Build a SAM 2 video inference state from an in-memory FrameSource.
+    Goes through predictor.init_state so every other field of the state is
+    set up exactly as SAM 2 does it; only the frame loader is replaced.
+    """
+    if sam2_video_module is None:
+        raise RuntimeError("SAM 2 is not installed")
+    if len(source) == 0:
+        raise ValueError("Frame source is empty")
+
+    def load_from_memory(*args, **kwargs):
+        images = source.images()
+        if not kwargs.get("offload_video_to_cpu", False):
+            device = kwargs.get("compute_device", getattr(predictor, "device", None))
+            if device is not None:
+                images = images.to(device)
+        return images, source.height, source.width
+
+    with _loader_lock:
+        original_loader = sam2_video_module.load_video_frames
+        sam2_video_module.load_video_frames = load_from_memory
+        try:
+            return predictor.init_state(video_path="<memory>", **init_kwargs)
+        finally:
+            sam2_video_module.load_video_frames = original_loader
+
+
+def load_stereo_sources(
+    decoder: VideoDecoder,
+    image_size: int,
+    keep_frames: bool = True,
+    progress_callback: Optional[Callable[[int, int], None]] = None
+) -> Tuple[FrameSource, FrameSource]:
+    """Decode a stacked stereo video once, splitting each frame into top/bottom sources"""
+    height = decoder.height
+    top = FrameSource(image_size, capacity=len(decoder), keep_frames=keep_frames)
+    bottom = FrameSource(image_size, capacity=len(decoder), keep_frames=keep_frames)
+
+    frame_count = 0
+    for _, frame in decoder:
+        top.append(frame[0:height//2, :])
+        bottom.append(frame[height//2:, :])
+        frame_count += 1
+        if progress_callback and frame_count % 50 == 0:
+            progress_callback(frame_count, decoder.frame_count)
+
+    return top, bottom
+
+
+def load_source(decoder: VideoDecoder, image_size: int, keep_frames: bool = True) -> FrameSource:
+    """Decode a (non-split) video once into a single FrameSource"""
+    source = FrameSource(image_size, capacity=len(decoder), keep_frames=keep_frames)
+    for _, frame in decoder:
+        source.append(frame)
+    return source
@@ -0,0 +1,86 @@
+"""
+Inference Pools
+Bounded executors for the blocking model work of request handlers (single-frame
+YOLO detection, first-frame SAM 2 segmentation), one per model, so it runs off
+the event loop with an explicit concurrency limit per model. Requests beyond
+the workers wait in a queue of limited depth; once that is full new requests
+are refused with PoolSaturated (served as 429) instead of piling up.
+Threads rather than processes: the models live in this process (see
+model_registry) and release the GIL while they run.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class PoolSaturated(Exception):
+    """All workers busy and the queue full; retry_after is a hint in seconds"""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"'{name}' inference is at capacity, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    """workers concurrent calls, up to max_queue more waiting"""
+
+    def __init__(self, name: str, workers: int = 1, max_queue: int = 4):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"infer-{name}")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self._avg_seconds = 1.0  # moving average of call duration, for the retry hint
+
+    def _admit(self):
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                # Roughly when the queue will have moved up by one batch of workers
+                raise PoolSaturated(self.name, max(1, round(self._avg_seconds * (1 + self._in_flight // self.workers))))
+            self._in_flight += 1
+
+    def _call(self, fn: Callable[..., Any], args: tuple, kwargs: Dict[str, Any]) -> Any:
+        with self._lock:
+            self._running += 1
+        start = time.time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self.completed += 1
+                self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.time() - start)
+
+    def _release(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on a worker and return its result; raises PoolSaturated when full"""
+        self._admit()
+        try:
+            future = self._executor.submit(self._call, fn, args, kwargs)
+        except BaseException:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        # Frees the slot once the call is done, or when it is cancelled while still queued
+        # (the awaiting request went away) and so never runs
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers, "max_queue": self.max_queue, "running": self._running,
+                "queued": self._in_flight - self._running, "completed": self.completed, "rejected": self.rejected,
+                "avg_seconds": round(self._avg_seconds, 3)
+            }
@@ -0,0 +1,551 @@
+"""
+Job Scheduler
+Runs long video tasks (full-video detection, segmentation, processing) as jobs
+with ids and priorities on bounded worker pools, one pool per resource class
+(YOLO vs SAM 2), so concurrent requests queue instead of oversubscribing the
+device. Job state, progress and logs are kept in SQLite next to experiments.db
+so they outlive the process, and every job gets its own scratch directory.
+Running jobs also keep a change counter and their recent frame rate, from
+which progress events (stage, frame, fps, ETA, per-view status) are built.
+Handlers checkpoint partial results into their scratch directory and stop
+cooperatively when cancelled; a failed, cancelled or interrupted job resumes
+from its last checkpoint.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Any
+
+# Database file path (next to experiments.db)
+DB_PATH = Path(__file__).parent / "jobs.db"
+
+# Seconds between progress snapshots of running jobs written to the database
+FLUSH_INTERVAL = 1.0
+# Finished jobs older than this are removed at startup
+RETENTION_DAYS = 30
+# Seconds between checkpoints of a running job's partial results
+CHECKPOINT_INTERVAL = float(os.environ.get("JOB_CHECKPOINT_SECONDS", 30))
+# Jobs cut off by a restart are resumed automatically until they have been started this many times
+MAX_AUTO_RESUME_ATTEMPTS = int(os.environ.get("JOB_AUTO_RESUME_ATTEMPTS", 3))
+CHECKPOINT_NAME = "checkpoint.pkl"
+
+# Seconds of frame progress the fps / ETA estimate is based on
+THROUGHPUT_WINDOW = 5.0
+
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("completed", "error", "cancelled", "interrupted")
+
+
+class JobError(Exception):
+    """Invalid job request; status_code is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class JobCancelled(BaseException):
+    """
+    Raised in a handler by job.raise_if_cancelled(). A BaseException, so the
+    handlers' own `except Exception` blocks let it through to the scheduler.
+    """
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+class Job:
+    """
+    Handle passed to a job's handler. The handler reports through update() /
+    set_progress() and log(); each call bumps version so listeners see the change.
+    Progress fields with a meaning to listeners: stage, current_frame, total_frames,
+    percent, message, views. In-place changes to job.progress are only seen with the next call.
+    Long handlers save_checkpoint() whenever checkpoint_due() (and once more when
+    cancelled), and start from load_checkpoint() when it returns one.
+    """
+
+    def __init__(self, row: Dict[str, Any], scratch_root: Path):
+        self.id = row["id"]
+        self.kind = row["kind"]
+        self.resource = row["resource"]
+        self.filename = row["filename"]
+        self.priority = row["priority"]
+        self.params = json.loads(row["params"] or "{}")
+        self.progress: Dict[str, Any] = json.loads(row["progress"] or "{}")
+        self.logs: List[str] = json.loads(row["logs"] or "[]")
+        self.scratch_dir = Path(scratch_root) / self.id
+        self.attempts = row.get("attempts", 1)
+        self.version = 0
+        self._cancel = threading.Event()
+        self._last_checkpoint = time.time()
+        self._stage = None
+        self._samples: "deque[tuple]" = deque()  # (time, frame) of the current stage
+
+    def set_progress(self, progress: Dict[str, Any]):
+        self.progress = progress
+        self._changed()
+
+    def update(self, **fields):
+        self.progress.update(fields)
+        self._changed()
+
+    def log(self, message: str):
+        self.logs.append(message)
+        self._changed()
+        print(f"[{self.filename}] {message}")
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def raise_if_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    @property
+    def checkpoint_path(self) -> Path:
+        return self.scratch_dir / CHECKPOINT_NAME
+
+    def checkpoint_due(self) -> bool:
+        return time.time() - self._last_checkpoint >= CHECKPOINT_INTERVAL
+
+    def save_checkpoint(self, state: Dict[str, Any]):
+        """Atomically replace the job's checkpoint with state (any picklable dict)"""
+        tmp = self.checkpoint_path.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+        self._last_checkpoint = time.time()
+
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        """State of the last checkpoint of an earlier run of this job, None if there is none"""
+        if not self.checkpoint_path.exists():
+            return None
+        try:
+            with self.checkpoint_path.open("rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            # Also covers checkpoints pickled by an older version of the code (renamed classes
+            # or modules); the job then starts over
+            print(f"Ignoring unreadable checkpoint of job {self.id}: {e!r}")
+            return None
+
+    def _changed(self):
+        self.version += 1
+        stage, frame = self.progress.get("stage"), self.progress.get("current_frame")
+        if stage != self._stage:
+            # Frame counters restart with each stage, so does the rate estimate
+            self._stage = stage
+            self._samples.clear()
+        if frame is None or (self._samples and self._samples[-1][1] == frame):
+            return
+        now = time.time()
+        self._samples.append((now, frame))
+        while len(self._samples) > 2 and now - self._samples[0][0] > THROUGHPUT_WINDOW:
+            self._samples.popleft()
+
+    def throughput(self) -> Dict[str, Optional[float]]:
+        """Frames per second over the last few seconds of the current stage, and the stage's ETA"""
+        if len(self._samples) < 2:
+            return {"fps": None, "eta_seconds": None}
+        (t0, f0), (t1, f1) = self._samples[0], self._samples[-1]
+        if t1 <= t0 or f1 <= f0:
+            return {"fps": None, "eta_seconds": None}
+        fps = (f1 - f0) / (t1 - t0)
+        total = self.progress.get("total_frames")
+        eta = max(0.0, (total - f1) / fps) if total else None
+        return {"fps": round(fps, 2), "eta_seconds": round(eta, 1) if eta is not None else None}
+
+
+class JobScheduler:
+    """
+    register(kind, handler, resource) then submit(kind, filename, params).
+    A handler is called as handler(job, **params) on a worker of its resource class.
+    workers: threads per resource class, e.g. {"yolo": 1, "sam2": 1}.
+    """
+
+    def __init__(self, scratch_root: Path, workers: Dict[str, int], db_path: Path = DB_PATH):
+        self.db_path = Path(db_path)
+        self.scratch_root = Path(scratch_root)
+        self.scratch_root.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self._handlers: Dict[str, Callable[..., None]] = {}
+        self._resources: Dict[str, str] = {}
+        self._queues: Dict[str, list] = {resource: [] for resource in workers}
+        self._conditions = {resource: threading.Condition() for resource in workers}
+        self._running: Dict[str, Job] = {}
+        self._order = itertools.count()
+        # Bumped on every job status change, so listeners know when to re-read the database
+        self._status_version = 0
+        self._db_lock = threading.Lock()
+        self._started = False
+        self._init_db()
+
+    # --- database ---
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    resource TEXT NOT NULL,
+                    filename TEXT,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    params TEXT,
+                    progress TEXT,
+                    logs TEXT,
+                    error TEXT,
+                    dedupe_key TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            """)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "attempts" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_filename ON jobs(filename, kind, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+            conn.commit()
+            conn.close()
+
+    def _execute(self, sql: str, args: tuple = ()) -> List[Dict[str, Any]]:
+        with self._db_lock:
+            conn = self._connect()
+            try:
+                rows = [dict(r) for r in conn.execute(sql, args).fetchall()]
+                conn.commit()
+                return rows
+            finally:
+                conn.close()
+
+    def _save(self, job: Job, **columns):
+        """Persist a job's progress and logs plus any given columns"""
+        try:
+            progress, logs = json.dumps(job.progress, default=str), json.dumps(job.logs)
+        except RuntimeError:
+            # The handler mutated the progress dict mid-dump; the next flush will catch up
+            return
+        fields = {"progress": progress, "logs": logs, **columns}
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job.id))
+
+    def _info(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        job = self._running.get(row["id"])
+        progress = job.progress if job is not None else json.loads(row["progress"] or "{}")
+        return {
+            "job_id": row["id"], "kind": row["kind"], "resource": row["resource"], "filename": row["filename"],
+            "priority": row["priority"], "status": row["status"], "error": row["error"], "attempts": row["attempts"],
+            "resumable": (self.scratch_root / row["id"] / CHECKPOINT_NAME).exists(),
+            "params": json.loads(row["params"] or "{}"), "progress": progress,
+            "created_at": row["created_at"], "started_at": row["started_at"], "finished_at": row["finished_at"],
+            "queue_position": self._queue_position(row) if row["status"] == "queued" else None
+        }
+
+    def _queue_position(self, row: Dict[str, Any]) -> Optional[int]:
+        queue = self._queues.get(row["resource"], [])
+        ordered = sorted(queue)
+        for position, (_, _, job_id) in enumerate(ordered):
+            if job_id == row["id"]:
+                return position
+        return None
+
+    # --- lifecycle ---
+
+    def register(self, kind: str, handler: Callable[..., None], resource: str):
+        if resource not in self.workers:
+            raise ValueError(f"Unknown resource class '{resource}'")
+        self._handlers[kind] = handler
+        self._resources[kind] = resource
+
+    def start(self):
+        """Recover state left by a previous process and start the workers"""
+        if self._started:
+            return
+        self._started = True
+
+        # Jobs that were running when the process died continue from their last checkpoint,
+        # unless they keep getting cut off (e.g. they take the process down with them)
+        self._execute(
+            "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND attempts < ?", (MAX_AUTO_RESUME_ATTEMPTS,)
+        )
+        self._execute(
+            "UPDATE jobs SET status = 'interrupted', error = 'Server restarted while the job was running', "
+            "finished_at = ? WHERE status = 'running'", (_now(),)
+        )
+        cutoff = (datetime.now() - timedelta(days=RETENTION_DAYS)).isoformat()
+        for row in self._execute("SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)):
+            shutil.rmtree(self.scratch_root / row["id"], ignore_errors=True)
+        self._execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+        for job_dir in self.scratch_root.iterdir():
+            # Scratch space (and checkpoints) of jobs that can't be resumed any more
+            if not self._execute("SELECT 1 FROM jobs WHERE id = ? AND status != 'completed'", (job_dir.name,)):
+                shutil.rmtree(job_dir, ignore_errors=True)
+
+        for row in self._execute("SELECT id, kind, resource, priority FROM jobs WHERE status = 'queued' ORDER BY created_at"):
+            if row["kind"] in self._handlers:
+                self._enqueue(row["id"], row["resource"], row["priority"])
+
+        for resource, count in self.workers.items():
+            for n in range(count):
+                threading.Thread(target=self._worker, args=(resource,), name=f"jobs-{resource}-{n}", daemon=True).start()
+        threading.Thread(target=self._flusher, name="jobs-flush", daemon=True).start()
+
+    def _enqueue(self, job_id: str, resource: str, priority: int):
+        condition = self._conditions[resource]
+        self._status_version += 1
+        with condition:
+            # Highest priority first, then first come first served
+            heapq.heappush(self._queues[resource], (-priority, next(self._order), job_id))
+            condition.notify()
+
+    def _worker(self, resource: str):
+        condition = self._conditions[resource]
+        while True:
+            with condition:
+                while not self._queues[resource]:
+                    condition.wait()
+                _, _, job_id = heapq.heappop(self._queues[resource])
+            row = self._claim(job_id)
+            if row is not None:
+                self._run(Job(row, self.scratch_root))
+
+    def _claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Mark a queued job as running; None if it was cancelled meanwhile"""
+        with self._db_lock:
+            conn = self._connect()
+            try:
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 "
+                    "WHERE id = ? AND status = 'queued'", (_now(), job_id)
+                ).rowcount
+                conn.commit()
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                return dict(row) if claimed and row else None
+            finally:
+                conn.close()
+
+    def _run(self, job: Job):
+        job.scratch_dir.mkdir(parents=True, exist_ok=True)
+        self._running[job.id] = job
+        self._status_version += 1
+        status, error = "completed", None
+        try:
+            self._handlers[job.kind](job, **job.params)
+            if job.progress.get("status") == "error":
+                status, error = "error", job.progress.get("message")
+        except JobCancelled:
+            status, error = "cancelled", "Cancelled"
+            job.set_progress({**job.progress, "status": "cancelled", "message": "Cancelled"})
+        except Exception as e:
+            traceback.print_exc()
+            status, error = "error", str(e)
+            job.set_progress({**job.progress, "status": "error", "message": f"Error: {e}", "error": str(e)})
+        finally:
+            self._save(job, status=status, error=error, finished_at=_now())
+            self._running.pop(job.id, None)
+            self._status_version += 1
+            if status == "completed":
+                # Anything else keeps its checkpoint for resume()
+                shutil.rmtree(job.scratch_dir, ignore_errors=True)
+
+    def _flusher(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            for job in list(self._running.values()):
+                try:
+                    self._save(job)
+                except sqlite3.Error as e:
+                    print(f"Failed to save progress of job {job.id}: {e}")
+
+    # --- API ---
+
+    def submit(self, kind: str, filename: str, params: Dict[str, Any], priority: int = 0,
+               dedupe_key: Optional[str] = None, progress: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Queue a job; params must be JSON serializable. With dedupe_key, an identical
+        job that is still queued or running is returned instead of starting another.
+        """
+        if kind not in self._handlers:
+            raise JobError(f"Unknown job kind '{kind}'")
+        if dedupe_key:
+            active = self._execute(
+                f"SELECT * FROM jobs WHERE dedupe_key = ? AND status IN {ACTIVE_STATUSES} ORDER BY created_at LIMIT 1",
+                (dedupe_key,)
+            )
+            if active:
+                return self._info(active[0])
+
+        job_id = uuid.uuid4().hex
+        resource = self._resources[kind]
+        self._execute(
+            "INSERT INTO jobs (id, kind, resource, filename, priority, status, params, progress, logs, dedupe_key, created_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, '[]', ?, ?)",
+            (job_id, kind, resource, filename, int(priority), json.dumps(params), json.dumps(progress or {}),
+             dedupe_key, _now())
+        )
+        self._enqueue(job_id, resource, int(priority))
+        return self.get(job_id)
+
+    def record(self, kind: str, filename: str, progress: Dict[str, Any], params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Store an already finished job (e.g. a result served from the artifact cache)"""
+        job_id = uuid.uuid4().hex
+        now = _now()
+        self._execute(
+            "INSERT INTO jobs (id, kind, resource, filename, priority, status, params, progress, logs, created_at, started_at, finished_at) "
+            "VALUES (?, ?, ?, ?, 0, 'completed', ?, ?, '[]', ?, ?, ?)",
+            (job_id, kind, self._resources.get(kind, ""), filename, json.dumps(params or {}),
+             json.dumps(progress, default=str), now, now, now)
+        )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._info(rows[0]) if rows else None
+
+    def latest(self, kind: str, filename: str) -> Optional[Dict[str, Any]]:
+        """Most recently submitted job of a kind for a video"""
+        rows = self._execute(
+            "SELECT * FROM jobs WHERE kind = ? AND filename = ? ORDER BY created_at DESC LIMIT 1", (kind, filename)
+        )
+        return self._info(rows[0]) if rows else None
+
+    def list(self, filename: Optional[str] = None, kind: Optional[str] = None, status: Optional[str] = None,
+             limit: int = 50) -> List[Dict[str, Any]]:
+        clauses, args = [], []
+        for column, value in (("filename", filename), ("kind", kind), ("status", status)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                args.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._execute(f"SELECT * FROM jobs {where} ORDER BY created_at DESC LIMIT ?", (*args, int(limit)))
+        return [self._info(row) for row in rows]
+
+    def logs(self, job_id: str) -> Optional[List[str]]:
+        job = self._running.get(job_id)
+        if job is not None:
+            return list(job.logs)
+        rows = self._execute("SELECT logs FROM jobs WHERE id = ?", (job_id,))
+        return json.loads(rows[0]["logs"] or "[]") if rows else None
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        """
+        Cancel a job. A queued job is dropped at once; a running one is asked to stop
+        and becomes 'cancelled' (keeping its checkpoint) at the handler's next check.
+        """
+        info = self.get(job_id)
+        if info is None:
+            raise JobError("Job not found", status_code=404)
+        job = self._running.get(job_id)
+        if job is not None:
+            job._cancel.set()
+            return {**self.get(job_id), "cancel_requested": True}
+        if info["status"] != "queued":
+            raise JobError(f"Job is {info['status']}", status_code=409)
+        self._execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'", (_now(), job_id)
+        )
+        condition = self._conditions[info["resource"]]
+        with condition:
+            queue = self._queues[info["resource"]]
+            queue[:] = [item for item in queue if item[2] != job_id]
+            heapq.heapify(queue)
+        self._status_version += 1
+        return self.get(job_id)
+
+    def resume(self, job_id: str) -> Dict[str, Any]:
+        """Queue a failed, cancelled or interrupted job again; it continues from its last checkpoint"""
+        info = self.get(job_id)
+        if info is None:
+            raise JobError("Job not found", status_code=404)
+        if info["status"] in ACTIVE_STATUSES or info["status"] == "completed":
+            raise JobError(f"Job is {info['status']}", status_code=409)
+        if info["kind"] not in self._handlers:
+            raise JobError(f"Unknown job kind '{info['kind']}'")
+        self._execute(
+            "UPDATE jobs SET status = 'queued', error = NULL, finished_at = NULL WHERE id = ?", (job_id,)
+        )
+        self._enqueue(job_id, info["resource"], info["priority"])
+        return self.get(job_id)
+
+    def scratch_dir(self, job_id: str) -> Path:
+        """Where the job's handler keeps checkpoints and partial output (may not exist)"""
+        return self.scratch_root / job_id
+
+    def version(self, job_id: str) -> tuple:
+        """Changes whenever the job's progress or any job's status changes (cheap, no database access)"""
+        job = self._running.get(job_id)
+        return (self._status_version, job.version if job is not None else -1)
+
+    def event(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Progress event of a job: the handler's progress fields plus job_id, job_status,
+        stage, frame, fps, eta_seconds and views. None if the job doesn't exist.
+        """
+        job = self._running.get(job_id)
+        progress = None
+        for _ in range(3) if job is not None else ():
+            try:
+                progress = json.loads(json.dumps(job.progress, default=str))
+                break
+            except RuntimeError:
+                # Mutated by the worker mid-copy, try again
+                continue
+        if progress is not None:
+            status, throughput = "running", job.throughput()
+        else:
+            info = self.get(job_id)
+            if info is None:
+                return None
+            progress, status = info["progress"], info["status"]
+            throughput = {"fps": None, "eta_seconds": None}
+            if status == "queued":
+                progress = {**progress, "status": "queued", "stage": "queued",
+                            "message": f"Queued (position {info['queue_position']})"}
+            elif status in ("interrupted", "cancelled") or (status == "error" and progress.get("status") != "error"):
+                progress = {**progress, "status": "error", "message": info["error"] or status}
+        return {
+            **progress,
+            "job_id": job_id,
+            "job_status": status,
+            "stage": progress.get("stage", progress.get("status")),
+            "frame": progress.get("current_frame"),
+            "total_frames": progress.get("total_frames"),
+            "views": progress.get("views"),
+            **throughput
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            resource: {
+                "workers": count,
+                "queued": len(self._queues[resource]),
+                "running": sum(1 for job in self._running.values() if job.resource == resource)
+            }
+            for resource, count in self.workers.items()
+        }
@@ -1,6 +1,9 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+import asyncio
 import shutil
 import os
 import time
@@ -12,6 +15,22 @@ import numpy as np
 from ultralytics import YOLO
 from pydantic import BaseModel
 import backend.experiment_db as experiment_db
+import backend.nms as nms
+import backend.frame_source as frame_source
+import backend.video_decoder as video_decoder
+import backend.video_encoder as video_encoder
+import backend.tracker as tracker
+import backend.detection_plan as detection_plan
+import backend.compositor as compositor
+import backend.mask_store as mask_store
+import backend.propagation as propagation
+import backend.upload_store as upload_store
+import backend.artifact_cache as artifact_cache
+import backend.frame_service as frame_service
+import backend.model_registry as model_registry
+import backend.job_scheduler as job_scheduler
+import backend.detection_store as detection_store
+import backend.inference_pool as inference_pool
 # Try importing SAM 2, handle if not installed yet (during dev)
 try:
     from sam2.build_sam import build_sam2_video_predictor, build_sam2
@@ -39,98 +58,162 @@ PROCESSED_DIR = Path("backend/processed")
 UPLOAD_DIR.mkdir(exist_ok=True)
 PROCESSED_DIR.mkdir(exist_ok=True)
 
+# Chunked/resumable uploads and content hashes of uploaded videos
+uploads = upload_store.UploadStore(UPLOAD_DIR)
+
+# Random access to decoded frames of uploaded videos (seek index + LRU of frames)
+frames = frame_service.FrameService(UPLOAD_DIR)
+
+# Results and rendered artifacts keyed by video content + request inputs
+results_cache = artifact_cache.ArtifactCache(
+    PROCESSED_DIR / "cache",
+    max_bytes=int(os.environ.get("ARTIFACT_CACHE_MAX_BYTES", artifact_cache.DEFAULT_MAX_BYTES))
+)
+
+# Threads used to composite masks onto frames when rendering output videos
+RENDER_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# Packed mask bytes kept in memory per view before spilling to PROCESSED_DIR
+MASK_STORE_BUDGET = int(os.environ.get("MASK_STORE_BUDGET", mask_store.DEFAULT_MEMORY_BUDGET))
+
+# Frames a concurrently propagating view may run ahead of the render loop
+PROPAGATION_QUEUE_SIZE = 8
+
 # Load models (lazy loading recommended but for simplicity here)
 device = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
 print(f"Using device: {device}")
 
-# YOLO model - lazy loaded
-yolo_model = None
+# YOLO model - lazy loaded through the model registry
+YOLO_MODEL_ID = "yolov8m.pt"
+# Minimum YOLO confidence; also the score below which soft-NMS drops decayed boxes
+DETECTION_CONFIDENCE = 0.05
 
 def get_yolo_model():
-    global yolo_model
-    if yolo_model is None:
-        print("Loading YOLO model...")
-        yolo_model = YOLO("yolov8m.pt")
-    return yolo_model
+    return models.get("yolo")
 
-def apply_nms(boxes, iou_threshold=0.45):
+def apply_nms(boxes, iou_threshold=0.45, method="hard", score_threshold=DETECTION_CONFIDENCE):
     """
     Apply Non-Maximum Suppression to a list of player boxes.
     Each box is a dict with x1, y1, x2, y2, confidence.
+    method: 'hard', 'soft' or 'merge' (weighted merge, useful at grid band seams)
     """
     if not boxes:
         return []
-        
-    # Pick top quality first
-    boxes = sorted(boxes, key=lambda x: x['confidence'], reverse=True)
-    keep = []
-    
-    while boxes:
-        best = boxes.pop(0)
-        keep.append(best)
-        
-        remaining = []
-        for box in boxes:
-            # Intersection
-            ix1 = max(best['x1'], box['x1'])
-            iy1 = max(best['y1'], box['y1'])
-            ix2 = min(best['x2'], box['x2'])
-            iy2 = min(best['y2'], box['y2'])
-            
-            iw = max(0, ix2 - ix1)
-            ih = max(0, iy2 - iy1)
-            inter = iw * ih
-            
-            # Union
-            area1 = (best['x2'] - best['x1']) * (best['y2'] - best['y1'])
-            area2 = (box['x2'] - box['x1']) * (box['y2'] - box['y1'])
-            union = area1 + area2 - inter
-            
-            iou = inter / union if union > 0 else 0
-            if iou < iou_threshold:
-                remaining.append(box)
-        boxes = remaining
-        
-    return keep
+    kept = nms.nms(nms.boxes_to_array(boxes), iou_threshold=iou_threshold, method=method, score_threshold=score_threshold)
+    return nms.array_to_boxes(kept)
 
 # SAM 2 models
 sam2_checkpoint = "sam2_hiera_large.pt"
 model_cfg = "sam2_hiera_l.yaml"  # Use model_cfg consistently
-predictor = None
-image_predictor = None  # For single frame segmentation
-
-# Logging storage
-processing_logs = {} # filename -> list of log strings
-
-# Progress tracking for full video segmentation
-segmentation_progress = {}  # filename -> {status, current_frame, total_frames, message, error}
-player_detection_progress = {} # filename -> {status, current_frame, total_frames, message, error}
-
-def log_event(filename: str, message: str):
-    if filename not in processing_logs:
-        processing_logs[filename] = []
-    processing_logs[filename].append(message)
-    print(f"[{filename}] {message}")
-
-def init_sam2():
-    '''Initialize SAM 2 models'''
-    global predictor, image_predictor
-    if predictor is None:
-        if build_sam2_video_predictor is None or build_sam2 is None or SAM2ImagePredictor is None:
-            print("SAM 2 modules not imported, skipping initialization.")
-            return
 
-        try:
-            # Video predictor for potential future use
-            predictor = build_sam2_video_predictor(model_cfg, sam2_checkpoint, device=device)
-            print("SAM 2 video predictor initialized")
-            
-            # Image predictor for single-frame segmentation
-            sam2_model = build_sam2(model_cfg, sam2_checkpoint, device=device)
-            image_predictor = SAM2ImagePredictor(sam2_model)
-            print("SAM 2 image predictor initialized")
-        except Exception as e:
-            print(f"Failed to initialize SAM 2: {e}")
+def load_yolo():
+    print("Loading YOLO model...")
+    return YOLO(YOLO_MODEL_ID)
+
+def warm_yolo(model):
+    model(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+
+def load_sam2_video():
+    if build_sam2_video_predictor is None:
+        raise RuntimeError("SAM 2 modules not imported")
+    return build_sam2_video_predictor(model_cfg, sam2_checkpoint, device=device)
+
+def load_sam2_image(video_predictor):
+    # The video predictor is a SAM2Base itself, so the image predictor shares its weights
+    # instead of loading a second copy of the checkpoint
+    if SAM2ImagePredictor is None:
+        raise RuntimeError("SAM 2 modules not imported")
+    return SAM2ImagePredictor(video_predictor)
+
+def warm_sam2_image(image_predictor):
+    image_predictor.set_image(np.zeros((512, 512, 3), dtype=np.uint8))
+    image_predictor.predict(box=np.array([[128, 128, 384, 384]]), multimask_output=False)
+    image_predictor.reset_predictor()
+
+# Models are loaded on first use (or at startup, see WARM_MODELS) and idle ones are
+# unloaded when resident weights exceed MODEL_MEMORY_BUDGET or free host memory
+# drops below MODEL_MIN_AVAILABLE_BYTES
+models = model_registry.ModelRegistry(
+    memory_budget=int(os.environ.get("MODEL_MEMORY_BUDGET", 0)),
+    min_available=int(os.environ.get("MODEL_MIN_AVAILABLE_BYTES", 0))
+)
+models.register("yolo", load_yolo, warmup=warm_yolo)
+models.register("sam2_video", load_sam2_video)
+models.register("sam2_image", load_sam2_image, depends_on=["sam2_video"], warmup=warm_sam2_image)
+
+# Models loaded and warmed up when the server starts; /ready reports 503 until they are
+WARM_MODELS = [m for m in os.environ.get("WARM_MODELS", "yolo,sam2_image").split(",") if m]
+MODEL_IDLE_SECONDS = float(os.environ.get("MODEL_IDLE_SECONDS", 300))
+
+# Long running tasks run as jobs with progress and logs persisted in backend/jobs.db,
+# at most JOB_WORKERS_<CLASS> of them at a time per resource class
+jobs = job_scheduler.JobScheduler(
+    PROCESSED_DIR / "jobs",
+    workers={"yolo": int(os.environ.get("JOB_WORKERS_YOLO", 1)), "sam2": int(os.environ.get("JOB_WORKERS_SAM2", 1))}
+)
+
+# Request-time inference (single-frame detection and segmentation) runs on one bounded
+# executor per model, off the event loop: INFER_WORKERS_<MODEL> calls at a time and at
+# most INFER_QUEUE_<MODEL> more waiting before requests are refused with 429
+inference = {
+    name: inference_pool.InferencePool(
+        name, workers=int(os.environ.get(f"INFER_WORKERS_{name.upper()}", 1)),
+        max_queue=int(os.environ.get(f"INFER_QUEUE_{name.upper()}", 4))
+    )
+    for name in ("yolo", "sam2")
+}
+
+async def run_inference(model: str, fn, *args, **kwargs):
+    """Run fn on the inference executor of model, 429 with Retry-After when it is saturated"""
+    try:
+        return await inference[model].run(fn, *args, **kwargs)
+    except inference_pool.PoolSaturated as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def cache_key(kind: str, filename: str, **params):
+    """Artifact cache key for a request on an uploaded video (hashes the video on first use)"""
+    video_hash = uploads.content_hash(filename)
+    return artifact_cache.make_key(kind, video_hash, **params) if video_hash else None
+
+def read_video_frame(filename: str, frame_index: int = 0):
+    """Decoded frame from the frame service (read-only, shared with its cache)"""
+    try:
+        frame = frames.frame(filename, frame_index)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Video not found")
+    except IOError:
+        raise HTTPException(status_code=500, detail="Failed to read video")
+    if frame is None:
+        raise HTTPException(status_code=400, detail=f"Frame {frame_index} is out of range")
+    return frame
+
+def sam2_model_id():
+    return f"{sam2_checkpoint}:{model_cfg}"
+
+def check_render_modes(color_mode: str, render_mode: str):
+    """400 unless the mask compositor supports both modes"""
+    if color_mode not in compositor.COLOR_MODES:
+        raise HTTPException(status_code=400, detail=f"color_mode must be one of {compositor.COLOR_MODES}")
+    if render_mode not in compositor.RENDER_MODES:
+        raise HTTPException(status_code=400, detail=f"render_mode must be one of {compositor.RENDER_MODES}")
+
+def job_progress(kind: str, filename: str, job_id: Optional[str] = None):
+    """Progress event of a job (the latest of its kind for the video unless job_id is given), None if there is none"""
+    if not job_id:
+        latest = jobs.latest(kind, filename)
+        if latest is None:
+            return None
+        job_id = latest["job_id"]
+    return jobs.event(job_id)
+
+@app.on_event("startup")
+def warm_models():
+    models.warm(WARM_MODELS, background=True)
+    models.start_reaper(idle_seconds=MODEL_IDLE_SECONDS)
+
+@app.on_event("startup")
+def start_jobs():
+    jobs.start()
 
 @app.get("/")
 async def root():
@@ -140,16 +223,116 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """200 once the startup models are loaded and warmed up, 503 before"""
+    ready = models.ready(WARM_MODELS)
+    body = {"ready": ready, "models": {name: models.status()["models"][name] for name in WARM_MODELS}}
+    if not ready:
+        return Response(content=json.dumps(body), status_code=503, media_type="application/json")
+    return body
+
+@app.get("/models")
+async def list_models():
+    return {**models.status(), "inference": {name: pool.stats() for name, pool in inference.items()}}
+
+@app.post("/models/{name}/load")
+async def load_model(name: str):
+    try:
+        model = await run_in_threadpool(models.get, name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model '{name}'")
+    if model is None:
+        raise HTTPException(status_code=500, detail=models.status()["models"][name]["error"])
+    return models.status()["models"][name]
+
+@app.delete("/models/{name}")
+async def unload_model(name: str):
+    try:
+        unloaded = await run_in_threadpool(models.unload, name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model '{name}'")
+    if not unloaded:
+        raise HTTPException(status_code=409, detail=f"Model '{name}' is in use")
+    return {"status": "unloaded", "name": name}
+
 @app.post("/upload")
 async def upload_video(file: UploadFile = File(...)):
     try:
-        file_path = UPLOAD_DIR / file.filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        return {"filename": file.filename, "url": f"http://localhost:8000/video/{file.filename}"}
+        # Copy in large chunks on the threadpool so the event loop keeps serving other requests
+        result = await run_in_threadpool(uploads.write_stream, file.filename, file.file)
+        return {**result, "url": f"http://localhost:8000/video/{result['filename']}"}
+    except upload_store.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/uploads")
+async def create_upload(request: dict):
+    """Start a chunked upload: {filename, size, part_size?} -> upload_id and part layout"""
+    try:
+        return await run_in_threadpool(
+            uploads.create_session, request.get('filename'), request.get('size'), request.get('part_size')
+        )
+    except upload_store.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """Parts received so far - clients resume by sending the missing ones"""
+    try:
+        return await run_in_threadpool(uploads.status, upload_id)
+    except upload_store.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.put("/uploads/{upload_id}/parts/{index}")
+async def upload_part(upload_id: str, index: int, request: Request, sha256: Optional[str] = None):
+    """
+    Raw request body is part `index`. Parts may arrive in any order and in parallel;
+    an optional sha256 query param is checked against the received bytes.
+    """
+    try:
+        writer = await run_in_threadpool(uploads.open_part, upload_id, index)
+    except upload_store.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    try:
+        # Gather network chunks into large writes, hashed and written off the event loop
+        buffer = bytearray()
+        async for chunk in request.stream():
+            buffer += chunk
+            if len(buffer) >= upload_store.CHUNK_SIZE:
+                await run_in_threadpool(writer.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(writer.write, bytes(buffer))
+        result = await run_in_threadpool(writer.commit, sha256)
+    except upload_store.UploadError as e:
+        writer.discard()
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except BaseException:
+        # Client went away mid-part: drop it, the part is re-sent on resume
+        writer.discard()
+        raise
+    return {"upload_id": upload_id, "index": index, **result}
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    """Assemble the parts into the uploaded video"""
+    try:
+        result = await run_in_threadpool(uploads.complete, upload_id)
+    except upload_store.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return {**result, "url": f"http://localhost:8000/video/{result['filename']}"}
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    try:
+        await run_in_threadpool(uploads.abort, upload_id)
+    except upload_store.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return {"status": "aborted"}
+
 @app.get("/video/{filename}")
 async def get_video(filename: str):
     file_path = UPLOAD_DIR / filename
@@ -161,122 +344,119 @@ async def get_video(filename: str):
     
     return FileResponse(file_path)
 
-def process_video_task(filename: str):
-    init_sam2()
-    if not predictor:
-        log_event(filename, "SAM 2 not ready/installed")
-        return
+@app.get("/frame/{filename}/{index}")
+def get_frame(filename: str, index: int, view: str = "full", quality: int = 90):
+    """One decoded frame (or stereo half: view=top/bottom) as JPEG"""
+    if view not in frame_service.VIEWS:
+        raise HTTPException(status_code=400, detail=f"view must be one of {frame_service.VIEWS}")
+    frame = frame_service.split_view(read_video_frame(filename, index), view)
+    ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, max(1, min(100, quality))])
+    if not ok:
+        raise HTTPException(status_code=500, detail="Failed to encode frame")
+    return Response(content=jpeg.tobytes(), media_type="image/jpeg", headers={"Cache-Control": "max-age=3600"})
+
+@app.get("/frame-index/{filename}")
+def get_frame_index(filename: str):
+    """Frame count, fps, geometry and keyframe positions of a video"""
+    try:
+        index = frames.index(filename)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Video not found")
+    return {k: v for k, v in index.items() if k != "signature"}
 
-    video_path = UPLOAD_DIR / filename
-    output_path = PROCESSED_DIR / f"processed_{filename}"
-    
-    log_event(filename, f"Processing video: {video_path}")
-    
-    # 1. Extract frames
-    frames_dir = Path("temp_frames") / filename.split('.')[0]
-    if frames_dir.exists():
-        shutil.rmtree(frames_dir, ignore_errors=True)
-    frames_dir.mkdir(parents=True, exist_ok=True)
-
-    cap = cv2.VideoCapture(str(video_path))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+def process_video_task(job, filename: str, color_mode: str = "single", render_mode: str = "fill"):
+    with models.use("sam2_video") as predictor:
+        if not predictor:
+            job.log("SAM 2 not ready/installed")
+            job.set_progress({"status": "error", "message": "SAM 2 not ready/installed"})
+            return
+
+        video_path = UPLOAD_DIR / filename
+        output_path = PROCESSED_DIR / f"processed_{filename}"
+        # Rendered in the job's scratch dir and moved into place once complete
+        scratch_path = job.scratch_dir / output_path.name
     
-    frame_names = []
-    frame_idx = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frame_name = f"{frame_idx:05d}.jpg"
-        cv2.imwrite(str(frames_dir / frame_name), frame)
-        frame_names.append(frame_name)
-        frame_idx += 1
-    cap.release()
+        job.log(f"Processing video: {video_path}")
     
-    cap.release()
+        # 1. Decode frames once into memory (SAM 2 input + originals for rendering)
+        decoder = video_decoder.open_video(video_path)
+        fps, width, height = decoder.fps, decoder.width, decoder.height
+        source = frame_source.load_source(decoder, predictor.image_size)
+
+        job.log(f"Extracted {len(source)} frames")
+        job.raise_if_cancelled()
+
+        # 2. Detect people on the first frame (or periodic)
+        # For simplicity, detect on frame 0 and propagate
+        model = get_yolo_model()
+        results = model(source.frames[0])
     
-    log_event(filename, f"Extracted {len(frame_names)} frames")
-
-    # 2. Detect people on the first frame (or periodic)
-    # For simplicity, detect on frame 0 and propagate
-    first_frame_path = frames_dir / frame_names[0]
-    model = get_yolo_model()
-    results = model(first_frame_path)
+        bboxes = []
+        for result in results:
+            for box in result.boxes:
+                if int(box.cls) == 0: # 0 is person in COCO
+                    # xyxy
+                    bboxes.append(box.xyxy[0].cpu().numpy())
     
-    bboxes = []
-    for result in results:
-        for box in result.boxes:
-            if int(box.cls) == 0: # 0 is person in COCO
-                # xyxy
-                bboxes.append(box.xyxy[0].cpu().numpy())
-    
-    log_event(filename, f"Detected {len(bboxes)} people on first frame using YOLO")
-
-    if not bboxes:
-        log_event(filename, "No people detected, copying original video")
-        # Just copy original
-        shutil.copy(video_path, output_path)
-        return
-
-    # 3. Initialize SAM 2 state
-    inference_state = predictor.init_state(video_path=str(frames_dir))
-    predictor.reset_state(inference_state)
-
-    # 4. Add prompts (boxes)
-    for i, box in enumerate(bboxes):
-        predictor.add_new_points_or_box(
-            inference_state=inference_state,
-            frame_idx=0,
-            obj_id=i+1,
-            box=box
-        )
+        job.log(f"Detected {len(bboxes)} people on first frame using YOLO")
+
+        if not bboxes:
+            job.log("No people detected, copying original video")
+            # Just copy original
+            shutil.copy(video_path, scratch_path)
+            os.replace(scratch_path, output_path)
+            job.set_progress({"status": "completed", "message": "No people detected", "output_filename": output_path.name})
+            return
 
-    # 5. Propagate and visualize
-    # Create video writer
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(str(output_path), fourcc, fps, (width, height))
+        # 3. Initialize SAM 2 state
+        inference_state = frame_source.init_state_from_source(predictor, source)
+        predictor.reset_state(inference_state)
+
+        # 4. Add prompts (boxes)
+        for i, box in enumerate(bboxes):
+            predictor.add_new_points_or_box(
+                inference_state=inference_state,
+                frame_idx=0,
+                obj_id=i+1,
+                box=box
+            )
+
+        # 5. Propagate and visualize
+        # Create video writer
+        out = video_encoder.open_writer(scratch_path, fps, width, height)
+
+        # frame_idx -> {obj_id -> mask}, bit-packed and spilled to disk past the budget;
+        # the store and the writer are closed even if propagation or rendering fails
+        with mask_store.MaskStore(MASK_STORE_BUDGET, spill_dir=str(job.scratch_dir)) as video_segments, out:
+            for out_frame_idx, out_obj_ids, out_mask_logits in predictor.propagate_in_video(inference_state):
+                if out_frame_idx % 10 == 0:
+                    job.log(f"Propagating masks for frame {out_frame_idx}")
+                video_segments.add_frame(out_frame_idx, out_obj_ids, out_mask_logits)
+                job.update(status="processing", stage="tracking", current_frame=out_frame_idx, total_frames=len(source),
+                           percent=int((out_frame_idx + 1) / max(len(source), 1) * 80))
+                job.raise_if_cancelled()
+
+            # Render - all masks of a frame composited in one pass, frames spread over a thread pool
+            mask_compositor = compositor.MaskCompositor(compositor.GREEN, alpha=0.5, color_mode=color_mode, render_mode=render_mode)
+        
+            def render_frame(i):
+                return mask_compositor.render(source.frame(i), video_segments.get(i))
+        
+            for i, frame in enumerate(compositor.render_ordered(render_frame, range(len(source)), workers=RENDER_WORKERS)):
+                out.write(frame)
+                job.update(stage="rendering", current_frame=i, percent=80 + int((i + 1) / max(len(source), 1) * 20))
+                job.raise_if_cancelled()
+        os.replace(scratch_path, output_path)
 
-    video_segments = {} # frame_idx -> {obj_id -> mask}
-    
-    for out_frame_idx, out_obj_ids, out_mask_logits in predictor.propagate_in_video(inference_state):
-        if out_frame_idx % 10 == 0:
-            log_event(filename, f"Propagating masks for frame {out_frame_idx}")
-        video_segments[out_frame_idx] = {
-            out_obj_id: (out_mask_logits[i] > 0.0).cpu().numpy()
-            for i, out_obj_id in enumerate(out_obj_ids)
-        }
+        job.log(f"Processed video saved to {output_path}")
+        job.set_progress({"status": "completed", "message": "Processing complete", "output_filename": output_path.name})
 
-    # Render
-    for i, frame_name in enumerate(frame_names):
-        frame = cv2.imread(str(frames_dir / frame_name))
-        if i in video_segments:
-            for obj_id, mask in video_segments[i].items():
-                # mask is (1, H, W)
-                mask = mask[0]
-                # Paint green
-                # Create green overlay
-                green_overlay = np.zeros_like(frame)
-                green_overlay[:, :] = [0, 255, 0] # BGR
-                
-                # Apply mask
-                # alpha blend
-                alpha = 0.5
-                mask_indices = mask > 0
-                frame[mask_indices] = cv2.addWeighted(frame[mask_indices], 1-alpha, green_overlay[mask_indices], alpha, 0)
-        
-        out.write(frame)
+jobs.register("process-video", process_video_task, resource="sam2")
 
-    out.release()
-    out.release()
-    # Cleanup frames
-    if frames_dir.exists():
-        shutil.rmtree(frames_dir, ignore_errors=True)
-    log_event(filename, f"Processed video saved to {output_path}")
 
 @app.post("/process-video")
-async def process_video(filename: str, background_tasks: BackgroundTasks):
+async def process_video(filename: str, color_mode: str = "single", render_mode: str = "fill", priority: int = 0):
+    check_render_modes(color_mode, render_mode)
     # Check if file exists
     if not (UPLOAD_DIR / filename).exists():
         raise HTTPException(status_code=404, detail="Video not found")
@@ -286,25 +466,44 @@ async def process_video(filename: str, background_tasks: BackgroundTasks):
     if output_path.exists():
         os.remove(output_path)
     
-    # Clear logs
-    processing_logs[filename] = []
-    log_event(filename, "Starting processing task")
-    
-    background_tasks.add_task(process_video_task, filename)
-    return {"status": "processing", "message": "Video processing started", "output_filename": f"processed_{filename}"}
+    job = await run_in_threadpool(
+        jobs.submit, "process-video", filename, {"filename": filename, "color_mode": color_mode, "render_mode": render_mode},
+        priority=priority, progress={"status": "starting", "message": "Starting processing task"}
+    )
+    return {"status": "processing", "message": "Video processing started", "output_filename": f"processed_{filename}",
+            "job_id": job["job_id"]}
 
 @app.get("/logs/{filename}")
-async def get_logs(filename: str):
-    if filename in processing_logs:
-        return {"logs": processing_logs[filename]}
-    return {"logs": []}
+async def get_logs(filename: str, job_id: Optional[str] = None):
+    """Logs of a processing job (the latest one for the video unless job_id is given)"""
+    info = await run_in_threadpool(jobs.get, job_id) if job_id else await run_in_threadpool(jobs.latest, "process-video", filename)
+    return {"logs": await run_in_threadpool(jobs.logs, info["job_id"]) if info else []}
+
+@app.get("/cache")
+async def get_cache_stats():
+    return results_cache.stats()
+
+@app.delete("/cache")
+async def invalidate_cache(filename: Optional[str] = None, kind: Optional[str] = None, key: Optional[str] = None):
+    """Drop cached results matching every given filter (everything if none is given)"""
+    removed = await run_in_threadpool(results_cache.invalidate, filename, kind, key)
+    return {"status": "deleted" if removed else "not_found", "removed": removed}
 
 @app.delete("/cache/{filename}")
 async def delete_cache(filename: str):
-    output_path = PROCESSED_DIR / f"processed_{filename}"
-    if output_path.exists():
-        os.remove(output_path)
-        return {"status": "deleted"}
+    """Drop every cached result and rendered output derived from a video"""
+    removed = await run_in_threadpool(results_cache.invalidate, filename)
+    await run_in_threadpool(frames.invalidate, filename)
+    outputs = [f"processed_{filename}", f"segmented_full_{filename}", f"segmented_{filename.replace('.mp4', '.jpg')}"]
+    outputs += [p.name for p in PROCESSED_DIR.glob(f"segmented_{filename.replace('.mp4', '')}_frame*.jpg")]
+    deleted = []
+    for name in outputs:
+        output_path = PROCESSED_DIR / name
+        if output_path.exists():
+            os.remove(output_path)
+            deleted.append(name)
+    if removed or deleted:
+        return {"status": "deleted", "removed": removed, "deleted_files": deleted}
     return {"status": "not_found"}
 
 @app.get("/status/{filename}")
@@ -315,20 +514,9 @@ async def get_status(filename: str):
     return {"status": "processing"}
 
 @app.post("/detect-field-corners")
-def detect_field_corners(filename: str):
+def detect_field_corners(filename: str, frame_index: int = 0):
     """Detect 4 corners of soccer field for both top and bottom stereo views"""
-    video_path = UPLOAD_DIR / filename
-    
-    if not video_path.exists():
-        raise HTTPException(status_code=404, detail="Video not found")
-    
-    # Extract first frame
-    cap = cv2.VideoCapture(str(video_path))
-    ret, frame = cap.read()
-    cap.release()
-    
-    if not ret:
-        raise HTTPException(status_code=500, detail="Failed to read video")
+    frame = read_video_frame(filename, frame_index)
     
     height, width = frame.shape[:2]
     
@@ -355,160 +543,72 @@ def detect_field_corners(filename: str):
     }
 
 
-def calculate_los_aabb(p1, p2, p3, p4, t, margin=40):
-    """
-    Calculate AABB of the LOS polygon at position t, expanded by margin.
-    Replicates frontend logic.
-    Points are dicts {'x': val, 'y': val}.
-    """
-    import math
-
-    def lerp(a, b, t):
-        return {
-            'x': a['x'] + (b['x'] - a['x']) * t,
-            'y': a['y'] + (b['y'] - a['y']) * t
-        }
-
-    far_dist = math.sqrt((p2['x'] - p1['x'])**2 + (p2['y'] - p1['y'])**2)
-    near_dist = math.sqrt((p3['x'] - p4['x'])**2 + (p3['y'] - p4['y'])**2)
-
-    ratio = far_dist / near_dist if near_dist > 0 else 1.0
-    w_near = 11
-    w_far = 11 * ratio
-
-    l_far = lerp(p1, p2, t)
-    l_near = lerp(p4, p3, t)
-
-    dx = l_near['x'] - l_far['x']
-    dy = l_near['y'] - l_far['y']
-    length = math.sqrt(dx*dx + dy*dy)
-    
-    if length == 0:
-        return None
-        
-    ux = dx / length
-    uy = dy / length
-
-    nx = -uy
-    ny = ux
-
-    # calculate polygon corners
-    poly = [
-        {'x': l_far['x'] + nx * w_far / 2, 'y': l_far['y'] + ny * w_far / 2},
-        {'x': l_far['x'] - nx * w_far / 2, 'y': l_far['y'] - ny * w_far / 2},
-        {'x': l_near['x'] - nx * w_near / 2, 'y': l_near['y'] - ny * w_near / 2},
-        {'x': l_near['x'] + nx * w_near / 2, 'y': l_near['y'] + ny * w_near / 2}
+def result_to_players(result, x_offset, y_offset):
+    """Person boxes from one YOLO result, shifted back into full-frame coordinates"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return []
+    cls = boxes.cls.cpu().numpy()
+    xyxy = boxes.xyxy.cpu().numpy()[cls == 0]
+    conf = boxes.conf.cpu().numpy()[cls == 0]
+    return [
+        {"x1": float(b[0] + x_offset), "y1": float(b[1] + y_offset), "x2": float(b[2] + x_offset), "y2": float(b[3] + y_offset), "confidence": float(c)}
+        for b, c in zip(xyxy, conf)
     ]
 
-    xs = [p['x'] for p in poly]
-    ys = [p['y'] for p in poly]
-
-    min_x, max_x = min(xs), max(xs)
-    min_y, max_y = min(ys), max(ys)
-
-    return {
-        'x1': min_x - margin,
-        'y1': min_y - margin,
-        'x2': max_x + margin,
-        'y2': max_y + margin
-    }
-
-def execute_detection(img, corners, y_offset, view_name, detection_mode, los_position=0.5):
-    # Determine detection region based on mode
-    region_corners = corners # Default to fop
-    
-    if detection_mode == 'full':
-        h, w = img.shape[:2]
-        region_corners = [{'x': 0, 'y': 0}, {'x': w, 'y': 0}, {'x': w, 'y': h}, {'x': 0, 'y': h}]
-    elif detection_mode == 'los' and len(corners) == 4:
-        aabb = calculate_los_aabb(corners[0], corners[1], corners[2], corners[3], los_position)
-        if aabb:
-            xl, yl, xr, yr = max(0, int(aabb['x1'])), max(0, int(aabb['y1'] - y_offset)), min(img.shape[1], int(aabb['x2'])), min(img.shape[0], int(aabb['y2'] - y_offset))
-            region_corners = [{'x': xl, 'y': yl}, {'x': xr, 'y': yl}, {'x': xr, 'y': yr}, {'x': xl, 'y': yr}]
-    
-    if detection_mode in ['fop', 'grid', 'fop_1280', 'grid_1280']:
-        region_corners = [{'x': c['x'], 'y': c['y'] - y_offset} for c in region_corners]
-
-    # Convert simple list to numpy for boundingRect
-    points = np.array([[c["x"], c["y"]] for c in region_corners], dtype=np.int32)
-    x, y, w, h = cv2.boundingRect(points)
-    x, y = max(0, x), max(0, y)
-    w, h = min(w, img.shape[1] - x), min(h, img.shape[0] - y)
-    if w <= 0 or h <= 0: return [], {"view": view_name, "error": "Invalid region"}
-
-    cropped = img[y:y+h, x:x+w]
-    # No changes to image enhancement
-    try:
-        lab = cv2.cvtColor(cropped, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        l = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8)).apply(l)
-        enhanced = cv2.cvtColor(cv2.merge([l, a, b]), cv2.COLOR_LAB2BGR)
-        sharpened = cv2.filter2D(enhanced, -1, np.array([[-1,-1,-1], [-1, 9,-1], [-1,-1,-1]]))
-    except: sharpened = cropped
-
-    # Grid logic
-    if detection_mode in ['grid', 'grid_1280'] and len(region_corners) == 4:
-        p1, p2, p3, p4 = region_corners[0], region_corners[1], region_corners[2], region_corners[3]
-        
-        if detection_mode == 'grid_1280':
-            # Dynamic bands: target 1280 width with 50px absolute overlap
-            target_w = 1280
-            overlap_px = 50
-            effective_w = target_w - overlap_px # 1230
-            num_bands = int(np.ceil(w / effective_w))
-            # Recalculate overlap T to be exactly overlap_px
-            # Total T range is 1.0. Overlap T is overlap_px / w
-            overlap_t = overlap_px / w if w > 0 else 0.2
-        else:
-            # Original grid: 10 bands, 20% overlap
-            num_bands, overlap_t = 10, 0.2
-            
-        band_crops, band_metadata = [], []
-        def lerp_p(a, b, t): return {'x': a['x'] + (b['x'] - a['x']) * t, 'y': a['y'] + (b['y'] - a['y']) * t}
-        for i in range(num_bands):
-            t_start = max(0, (i / num_bands) - overlap_t/2)
-            t_end = min(1, ((i + 1) / num_bands) + overlap_t/2)
-            b_corners = [lerp_p(p1, p2, t_start), lerp_p(p1, p2, t_end), lerp_p(p4, p3, t_end), lerp_p(p4, p3, t_start)]
-            bx, by, bw, bh = cv2.boundingRect(np.array([[c['x'], c['y']] for c in b_corners], dtype=np.int32))
-            bx, by = max(0, bx), max(0, by)
-            bw, bh = min(bw, img.shape[1] - bx), min(bh, img.shape[0] - by)
-            if bw > 0 and bh > 0:
-                bcrop = img[by:by+bh, bx:bx+bw]
-                # Light enhance for bands too
-                try:
-                    blab = cv2.cvtColor(bcrop, cv2.COLOR_BGR2LAB); bl, ba, bb = cv2.split(blab)
-                    bl = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8)).apply(bl)
-                    benh = cv2.cvtColor(cv2.merge([bl, ba, bb]), cv2.COLOR_LAB2BGR)
-                    band_crops.append(cv2.filter2D(benh, -1, np.array([[-1,-1,-1], [-1, 9,-1], [-1,-1,-1]])))
-                except: band_crops.append(bcrop)
-                band_metadata.append({'x': bx, 'y': by})
-        
-        if band_crops:
-            # Use 1280 for grid_1280 bands too
-            yolo_imgsz = 1280 if detection_mode == 'grid_1280' else 640
-            batch_results = get_yolo_model()(band_crops, conf=0.05, imgsz=yolo_imgsz, verbose=False)
-            band_players = []
-            for idx, result in enumerate(batch_results):
-                meta = band_metadata[idx]
-                for box in result.boxes:
-                    if int(box.cls) == 0:
-                        b_xyxy = box.xyxy[0].cpu().numpy()
-                        band_players.append({'x1': float(b_xyxy[0] + meta['x']), 'y1': float(b_xyxy[1] + meta['y'] + y_offset), 'x2': float(b_xyxy[2] + meta['x']), 'y2': float(b_xyxy[3] + meta['y'] + y_offset), 'confidence': float(box.conf[0].cpu().item())})
-            return apply_nms(band_players), {"view": view_name, "bands": len(band_crops), "imgsz": yolo_imgsz}
-        return [], {"view": view_name, "error": "No valid bands"}
-
-    # Single shot logic
-    yolo_imgsz = 1280 if detection_mode in ['fop_1280', 'grid_1280'] else 640
-    model = get_yolo_model()
-    results = model(sharpened, conf=0.05, imgsz=yolo_imgsz, verbose=False)
-    players = []
-    for result in results:
-        for box in result.boxes:
-            if int(box.cls) == 0:
-                xyxy = box.xyxy[0].cpu().numpy()
-                players.append({"x1": float(xyxy[0] + x), "y1": float(xyxy[1] + y + y_offset), "x2": float(xyxy[2] + x), "y2": float(xyxy[3] + y + y_offset), "confidence": float(box.conf[0])})
-    players.sort(key=lambda p: p["x1"])
-    return players, {"view": view_name, "crop_size": f"{w}x{h}", "detections": len(players), "imgsz": yolo_imgsz}
+def execute_detection_batch(views, detection_mode, los_position=0.5, nms_method='hard', batch_size=None):
+    """
+    Detect players on many views (e.g. K frames x top/bottom) with batched YOLO calls.
+    views: list of (img, corners, y_offset, view_name)
+    batch_size: max crops per model call (None = everything in one call per imgsz)
+    Returns a list of (players, metadata), one per view, in input order.
+    """
+    # Geometry is compiled once per (corners, mode, view shape) and reused across frames
+    plans = [detection_plan.get_detection_plan(corners, y_offset, img.shape, view_name, detection_mode, los_position)
+             for img, corners, y_offset, view_name in views]
+
+    # Flatten every crop of every view, remembering where it came from
+    jobs = []  # (view index, crop)
+    for vi, (plan, view) in enumerate(zip(plans, views)):
+        for crop in plan.crops(view[0]):
+            jobs.append((vi, crop))
+
+    view_players = [[] for _ in views]
+    if jobs:
+        # All crops of one mode share an imgsz, so they can go through the model together
+        yolo_imgsz = plans[jobs[0][0]].imgsz
+        step = batch_size or len(jobs)
+        with models.use("yolo") as model:
+            if model is None:
+                raise RuntimeError("YOLO model not available")
+            for start in range(0, len(jobs), step):
+                chunk = jobs[start:start + step]
+                results = model([crop['image'] for _, crop in chunk], conf=DETECTION_CONFIDENCE, imgsz=yolo_imgsz, verbose=False)
+                for (vi, crop), result in zip(chunk, results):
+                    y_offset = views[vi][2]
+                    view_players[vi].extend(result_to_players(result, crop['x'], crop['y'] + y_offset))
+
+    # Band seams produce duplicates - suppress every grid view in one batched call
+    grid_views = [vi for vi, plan in enumerate(plans) if plan.is_grid]
+    if grid_views:
+        suppressed = nms.nms_per_group([view_players[vi] for vi in grid_views], method=nms_method,
+                                       score_threshold=DETECTION_CONFIDENCE)
+        for vi, players in zip(grid_views, suppressed):
+            view_players[vi] = players
+
+    outputs = []
+    for plan, players in zip(plans, view_players):
+        metadata = plan.metadata()
+        if not plan.is_grid:
+            players.sort(key=lambda p: p["x1"])
+            if not plan.error:
+                metadata["detections"] = len(players)
+        outputs.append((players, metadata))
+    return outputs
+
+def execute_detection(img, corners, y_offset, view_name, detection_mode, los_position=0.5, nms_method='hard'):
+    """Detect players on a single view"""
+    return execute_detection_batch([(img, corners, y_offset, view_name)], detection_mode, los_position, nms_method)[0]
 
 @app.post("/detect-players")
 async def detect_players(request: dict):
@@ -518,47 +618,82 @@ async def detect_players(request: dict):
     top_corners, bottom_corners = request.get('top_corners', []), request.get('bottom_corners', [])
     detection_mode = request.get('detection_mode', 'fop')
     los_position = request.get('los_position', 0.5)
+    nms_method = request.get('nms_method', 'hard')
+    frame_index = int(request.get('frame_index', 0))
+    use_cache = bool(request.get('use_cache', True))
 
+    if nms_method not in nms.NMS_METHODS:
+        raise HTTPException(status_code=400, detail=f"nms_method must be one of {nms.NMS_METHODS}")
     video_path = UPLOAD_DIR / filename
     if not video_path.exists(): raise HTTPException(status_code=404, detail="Video not found")
-    cap = cv2.VideoCapture(str(video_path))
-    ret, frame = cap.read(); cap.release()
-    if not ret: raise HTTPException(status_code=500, detail="Failed to read video")
+    
+    key = None
+    if use_cache:
+        key = await run_in_threadpool(
+            cache_key, "detect-players", filename, top_corners=top_corners, bottom_corners=bottom_corners,
+            detection_mode=detection_mode, los_position=los_position, nms_method=nms_method, model=YOLO_MODEL_ID,
+            frame_index=frame_index
+        )
+        cached = await run_in_threadpool(results_cache.get, key) if key else None
+        if cached:
+            return {**cached, "metadata": {**cached["metadata"], "cache_hit": True}}
+    
+    frame = await run_in_threadpool(read_video_frame, filename, frame_index)
     
     height, width = frame.shape[:2]
-    top_players, top_metadata = execute_detection(frame[0:height//2, :], top_corners, 0, "Top", detection_mode, los_position)
-    bottom_players, bottom_metadata = execute_detection(frame[height//2:, :], bottom_corners, height//2, "Bottom", detection_mode, los_position)
+    (top_players, top_metadata), (bottom_players, bottom_metadata) = await run_inference(
+        "yolo", execute_detection_batch,
+        [(frame[0:height//2, :], top_corners, 0, "Top"), (frame[height//2:, :], bottom_corners, height//2, "Bottom")],
+        detection_mode, los_position, nms_method
+    )
     
     similarity = 1.0 - abs(len(top_players) - len(bottom_players)) / max(len(top_players), len(bottom_players), 1)
-    return {
+    result = {
         "top_players": top_players, "bottom_players": bottom_players, "similarity": similarity,
         "metadata": {
-            "model": "yolov8m", "detection_mode": detection_mode, "confidence_threshold": 0.05,
+            "model": "yolov8m", "detection_mode": detection_mode, "nms_method": nms_method, "confidence_threshold": DETECTION_CONFIDENCE,
+            "frame_index": frame_index,
             "top_view": top_metadata, "bottom_view": bottom_metadata, "execution_time": time.time() - start_time
         }
     }
+    if key:
+        await run_in_threadpool(results_cache.put, key, result, kind="detect-players", video=filename)
+    return result
 @app.post("/segment-first-frame")
-def segment_first_frame(request: dict):
+async def segment_first_frame(request: dict):
     """Segment players on first frame using SAM 2"""
     filename = request.get('filename')
     top_players = request.get('top_players')
     bottom_players = request.get('bottom_players')
-    
-    init_sam2()
-    if not predictor:
-        raise HTTPException(status_code=500, detail="SAM 2 not initialized")
+    color_mode = request.get('color_mode', 'single')
+    render_mode = request.get('render_mode', 'fill')
+    frame_index = int(request.get('frame_index', 0))
+    use_cache = bool(request.get('use_cache', True))
+    check_render_modes(color_mode, render_mode)
     
     video_path = UPLOAD_DIR / filename
     if not video_path.exists():
         raise HTTPException(status_code=404, detail="Video not found")
     
-    # Extract first frame
-    cap = cv2.VideoCapture(str(video_path))
-    ret, frame = cap.read()
-    cap.release()
+    key = None
+    if use_cache:
+        key = await run_in_threadpool(
+            cache_key, "segment-first-frame", filename, top_players=top_players, bottom_players=bottom_players,
+            color_mode=color_mode, render_mode=render_mode, model=sam2_model_id(), frame_index=frame_index
+        )
+        cached = await run_in_threadpool(results_cache.get, key, restore_to=PROCESSED_DIR) if key else None
+        if cached:
+            return {**cached, "cache_hit": True}
     
-    if not ret:
-        raise HTTPException(status_code=500, detail="Failed to read video")
+    # Requested frame (the first one by default)
+    frame = await run_in_threadpool(read_video_frame, filename, frame_index)
+    return await run_inference(
+        "sam2", segment_frame, filename, frame, frame_index, top_players, bottom_players, color_mode, render_mode, key
+    )
+
+def segment_frame(filename: str, frame, frame_index: int, top_players: list, bottom_players: list,
+                  color_mode: str, render_mode: str, key: Optional[str] = None):
+    """Segment the players of both views of one frame and save the composited image (cached under key)"""
     
     # Save frame temporarily
     temp_frame_path = PROCESSED_DIR / "temp_first_frame.jpg"
@@ -569,322 +704,445 @@ def segment_first_frame(request: dict):
     top_frame = frame[0:height//2, :].copy()
     bottom_frame = frame[height//2:, :].copy()
     
-    def segment_view(img, players, color, y_offset=0):
-        """Segment players in one view using SAM 2 image predictor"""
+    # Bright orange for all players (or one colour per player), 40% frame / 60% colour
+    mask_compositor = compositor.MaskCompositor(compositor.ORANGE, alpha=0.6, color_mode=color_mode, render_mode=render_mode)
+    
+    def segment_view(img, players, y_offset=0):
+        """
+        Segment players in one view using SAM 2 image predictor: all valid boxes go
+        through the mask decoder as one batched prompt. Returns (image, timings in ms).
+        """
+        timings = {"embedding_ms": 0.0, "decoding_ms": 0.0, "blending_ms": 0.0, "boxes": 0}
         if not players:
             print("No players to segment")
-            return img
-        
-        print(f"Segmenting {len(players)} players with y_offset={y_offset}...")
-        result_img = img.copy()
-        
-        # Set the image for SAM 2
-        image_predictor.set_image(result_img)
+            return img, timings
         
+        # Validate boxes - adjust y-coordinates for offset
+        boxes, obj_ids = [], []
         for idx, player in enumerate(players):
-            # Get bounding box - adjust y-coordinates for offset
             x1, y1, x2, y2 = player['x1'], player['y1'] - y_offset, player['x2'], player['y2'] - y_offset
-            
-            print(f"  Player {idx + 1}: bbox ({x1}, {y1}, {x2}, {y2})")
-            
-            # Validate bbox
             if x2 <= x1 or y2 <= y1 or x1 < 0 or y1 < 0 or x2 > img.shape[1] or y2 > img.shape[0]:
-                print(f"    ⚠️  Invalid or out-of-bounds bbox, skipping")
-                continue
-                
-            # Use SAM 2 with bbox prompt
-            print(f"    Running SAM 2...")
-            try:
-                masks, scores, _ = image_predictor.predict(
-                    box=np.array([x1, y1, x2, y2]),
-                    multimask_output=False
-                )
-                
-                if masks is None or len(masks) == 0:
-                    print(f"    ⚠️  No masks generated")
-                    continue
-                    
-                # Convert mask to boolean (SAM 2 returns float/int masks)
-                mask = masks[0].astype(bool)
-                print(f"    ✓ Mask generated (shape={mask.shape}, score={scores[0]:.3f}, type={mask.dtype})")
-                
-                # Create colored overlay
-                overlay = np.zeros_like(result_img)
-                overlay[mask] = color
-                
-                # Blend - safe indexing
-                try:
-                    if mask.any():
-                        result_img[mask] = cv2.addWeighted(result_img[mask], 0.4, overlay[mask], 0.6, 0)
-                        print(f"    ✓ Orange overlay applied")
-                    else:
-                        print(f"    ⚠️  Empty mask")
-                except Exception as blend_error:
-                    print(f"    ❌ Blend error: {str(blend_error)}")
-                    
-            except Exception as e:
-                print(f"    ❌ SAM 2 error: {str(e)}")
-                import traceback
-                traceback.print_exc()
+                print(f"  ⚠️  Player {idx + 1}: invalid or out-of-bounds bbox ({x1}, {y1}, {x2}, {y2}), skipping")
                 continue
+            boxes.append([x1, y1, x2, y2])
+            obj_ids.append(idx + 1)
+        if not boxes:
+            return img, timings
         
-        return result_img
-    
-    # Bright orange color for all players
-    orange_color = [0, 165, 255]  # BGR format: bright orange
-    
-    # Segment both views
-    print(f"Segmenting top view with {len(top_players)} players...")
-    top_result = segment_view(top_frame, top_players, orange_color, y_offset=0)
+        print(f"Segmenting {len(boxes)} players with y_offset={y_offset}...")
+        
+        # Image embedding (once per view)
+        start = time.time()
+        image_predictor.set_image(img)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        timings["embedding_ms"] = (time.time() - start) * 1000
+        
+        # One decoder call for every box of the view
+        start = time.time()
+        view_masks = {}
+        try:
+            masks, scores, _ = image_predictor.predict(box=np.array(boxes, dtype=np.float32), multimask_output=False)
+            # (N, 1, H, W) for several boxes, (1, H, W) for one
+            masks = masks.reshape(len(boxes), -1, *masks.shape[-2:])[:, 0]
+            scores = np.asarray(scores).reshape(len(boxes), -1)[:, 0]
+            for obj_id, mask, score in zip(obj_ids, masks, scores):
+                view_masks[obj_id] = mask.astype(bool)
+            print(f"  ✓ {len(view_masks)} masks generated (mean score={scores.mean():.3f})")
+        except Exception as e:
+            print(f"  ❌ SAM 2 error: {str(e)}")
+            import traceback
+            traceback.print_exc()
+        timings["decoding_ms"] = (time.time() - start) * 1000
+        timings["boxes"] = len(boxes)
+        
+        # Composite every mask of the view in one pass
+        start = time.time()
+        result_img = mask_compositor.render(img.copy(), view_masks)
+        timings["blending_ms"] = (time.time() - start) * 1000
+        return result_img, {k: round(v, 1) if isinstance(v, float) else v for k, v in timings.items()}
     
-    print(f"Segmenting bottom view with {len(bottom_players)} players...")
-    bottom_result = segment_view(bottom_frame, bottom_players, orange_color, y_offset=height//2)
+    # Segment both views (the model can't be unloaded while in use)
+    image_predictor = models.acquire("sam2_image")
+    try:
+        if not image_predictor:
+            raise HTTPException(status_code=500, detail="SAM 2 not initialized")
+
+        print(f"Segmenting top view with {len(top_players)} players...")
+        top_result, top_timings = segment_view(top_frame, top_players, y_offset=0)
+        
+        print(f"Segmenting bottom view with {len(bottom_players)} players...")
+        bottom_result, bottom_timings = segment_view(bottom_frame, bottom_players, y_offset=height//2)
+    finally:
+        models.release("sam2_image")
     
     # Combine
     result_frame = np.vstack([top_result, bottom_result])
     
     # Save result
-    result_path = PROCESSED_DIR / f"segmented_{filename.replace('.mp4', '.jpg')}"
+    result_name = f"segmented_{filename.replace('.mp4', '.jpg')}"
+    if frame_index:
+        result_name = result_name.replace('.jpg', f'_frame{frame_index}.jpg')
+    result_path = PROCESSED_DIR / result_name
+    if result_path.exists():
+        # Replace rather than overwrite: the old file may be shared with a cache entry
+        result_path.unlink()
     cv2.imwrite(str(result_path), result_frame)
     
-    return {
+    result = {
         "result_url": f"http://localhost:8000/video/{result_path.name}",
         "top_player_count": len(top_players),
-        "bottom_player_count": len(bottom_players)
+        "bottom_player_count": len(bottom_players),
+        "frame_index": frame_index,
+        "timings": {
+            "top": top_timings,
+            "bottom": bottom_timings,
+            **{k: round(top_timings[k] + bottom_timings[k], 1) for k in ("embedding_ms", "decoding_ms", "blending_ms")}
+        }
     }
+    if key:
+        results_cache.put(key, result, artifacts=[result_path], kind="segment-first-frame", video=filename)
+    return result
 
-def segment_full_video_task(filename: str, top_players: list, bottom_players: list):
-    """Background task to segment all frames of a video using SAM 2 Video Propagation"""
-    global segmentation_progress
-    
+def segment_full_video_task(job, filename: str, top_players: list, bottom_players: list,
+                            color_mode: str = "single", render_mode: str = "fill", stream: bool = True,
+                            concurrent_views: bool = True, result_key: Optional[str] = None):
+    """
+    Background task to segment all frames of a video using SAM 2 Video Propagation.
+    With stream=True frames are rendered and written while the views propagate;
+    otherwise the views are propagated to completion before rendering.
+    With concurrent_views=True the top and bottom views propagate on separate threads.
+    result_key: artifact cache key the finished video is stored under.
+    The masks of every propagated frame go to a log in the job's scratch dir that is
+    checkpointed periodically; a resumed job re-prompts SAM 2 with the masks of the
+    last checkpointed frame and only propagates the frames after it.
+    """
+    predictor = models.acquire("sam2_video")
+    mask_log = None
     try:
-        init_sam2()
         if not predictor:
-            segmentation_progress[filename] = {
+            job.set_progress({
                 "status": "error",
                 "message": "SAM 2 Video Predictor not initialized",
                 "current_frame": 0,
                 "total_frames": 0
-            }
+            })
             return
         
         video_path = UPLOAD_DIR / filename
         output_filename = f"segmented_full_{filename}"
         output_path = PROCESSED_DIR / output_filename
+        # Rendered in the job's scratch dir and moved into place once complete
+        scratch_path = job.scratch_dir / output_filename
         
-        # 1. Extract frames
-        frames_dir = Path("temp_frames") / filename.split('.')[0]
-        top_dir = frames_dir / "top"
-        bottom_dir = frames_dir / "bottom"
+        # Masks propagated by an earlier run of this job, up to its last checkpoint
+        checkpoint = job.load_checkpoint()
+        mask_log = mask_store.MaskLog(str(job.scratch_dir / "masks.log"),
+                                      truncate_to=checkpoint["log_bytes"] if checkpoint else 0)
+        resume = mask_log.last_frame  # (frame_idx, {view: masks}) to continue tracking from
+        resume_from = resume[0] + 1 if resume else 0
+        if resume:
+            job.log(f"Resuming from checkpoint at frame {resume_from}")
         
-        if frames_dir.exists():
-            shutil.rmtree(frames_dir, ignore_errors=True)
-        top_dir.mkdir(parents=True, exist_ok=True)
-        bottom_dir.mkdir(parents=True, exist_ok=True)
+        # 1. Decode frames into SAM 2's input buffers, split into the two stereo views. The
+        # originals are not kept: rendering decodes the video again as it goes, so only the
+        # frames in flight are held at full resolution
+        decoder = video_decoder.open_video(video_path)
+        fps, width, height = decoder.fps, decoder.width, decoder.height
+        total_frames = decoder.frame_count
         
-        cap = cv2.VideoCapture(str(video_path))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        
-        segmentation_progress[filename] = {
+        job.set_progress({
             "status": "processing",
+            "stage": "extracting",
             "message": f"Extracting {total_frames} frames...",
             "current_frame": 0,
             "total_frames": total_frames,
             "percent": 0
-        }
+        })
         
-        frame_idx = 0
-        frame_names = []
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame_name = f"{frame_idx:05d}.jpg"
-            frame_names.append(frame_name)
-            
-            # Split and save
-            top_frame = frame[0:height//2, :]
-            bottom_frame = frame[height//2:, :]
-            
-            cv2.imwrite(str(top_dir / frame_name), top_frame)
-            cv2.imwrite(str(bottom_dir / frame_name), bottom_frame)
-            
-            frame_idx += 1
-            if frame_idx % 50 == 0:
-                percent = int((frame_idx / total_frames) * 10) # Extraction is 10% of work
-                segmentation_progress[filename]["percent"] = percent
-                segmentation_progress[filename]["current_frame"] = frame_idx
+        def on_extract_progress(frame_idx, total):
+            percent = int((frame_idx / max(total, 1)) * 10) # Extraction is 10% of work
+            job.update(percent=percent, current_frame=frame_idx)
+            job.raise_if_cancelled()
+        
+        top_source, bottom_source = frame_source.load_stereo_sources(
+            decoder, predictor.image_size, keep_frames=False, progress_callback=on_extract_progress
+        )
         
-        cap.release()
+        view_progress = {
+            "Top": {"status": "pending", "current_frame": 0, "percent": 0},
+            "Bottom": {"status": "pending", "current_frame": 0, "percent": 0},
+        }
+        job.update(views=view_progress)
         
-        # Helper to run propagation
-        def run_view_propagation(view_dir, players, view_name, y_offset=0):
+        # Helper to run propagation: yields (frame_idx, {obj_id: (crop, x0, y0)}) as SAM 2 produces them
+        def propagate_view(source, players, view_name, y_offset=0):
+            progress = view_progress[view_name]
             if not players:
-                return {}
+                progress.update({"status": "skipped", "percent": 100})
+                job.update()
+                return
             
-            segmentation_progress[filename]["message"] = f"Initializing SAM 2 for {view_name} view..."
+            progress["status"] = "initializing"
+            job.update()
             
-            # Init state
-            inference_state = predictor.init_state(video_path=str(view_dir))
+            # Init state - each view has its own inference state, the model is shared
+            inference_state = frame_source.init_state_from_source(predictor, source)
             predictor.reset_state(inference_state)
             
-            # Add prompts to frame 0
-            for i, player in enumerate(players):
-                # Adjust y for bottom view if needed (though we cropped, so y is relative to crop)
-                # If players come from detection on full frame, we need to adjust
-                # If players come from detection on split frame (which they do in detect_players),
-                # top players are relative to top frame.
-                # bottom players are relative to full frame (y + height//2).
-                # Since we cropped bottom_frame, we need to subtract offset for bottom players.
-                
-                x1, y1, x2, y2 = player['x1'], player['y1'] - y_offset, player['x2'], player['y2'] - y_offset
-                
-                predictor.add_new_points_or_box(
-                    inference_state=inference_state,
-                    frame_idx=0,
-                    obj_id=i+1,
-                    box=np.array([x1, y1, x2, y2])
-                )
+            start_idx = 0
+            if resume is None:
+                # Add prompts to frame 0
+                for i, player in enumerate(players):
+                    # Adjust y for bottom view if needed (though we cropped, so y is relative to crop)
+                    # If players come from detection on full frame, we need to adjust
+                    # If players come from detection on split frame (which they do in detect_players),
+                    # top players are relative to top frame.
+                    # bottom players are relative to full frame (y + height//2).
+                    # Since we cropped bottom_frame, we need to subtract offset for bottom players.
+                    
+                    x1, y1, x2, y2 = player['x1'], player['y1'] - y_offset, player['x2'], player['y2'] - y_offset
+                    
+                    predictor.add_new_points_or_box(
+                        inference_state=inference_state,
+                        frame_idx=0,
+                        obj_id=i+1,
+                        box=np.array([x1, y1, x2, y2])
+                    )
+            else:
+                # Prompt with every object's mask on the last checkpointed frame (empty if it was lost)
+                start_idx, view_masks = resume[0], resume[1][view_name]
+                for i in range(len(players)):
+                    mask = np.zeros((source.height, source.width), dtype=bool)
+                    if i + 1 in view_masks:
+                        crop, x0, y0 = view_masks[i + 1]
+                        mask[y0:y0 + crop.shape[0], x0:x0 + crop.shape[1]] = crop
+                    predictor.add_new_mask(inference_state=inference_state, frame_idx=start_idx, obj_id=i+1, mask=mask)
             
             # Propagate
-            masks_per_frame = {}
-            for out_frame_idx, out_obj_ids, out_mask_logits in predictor.propagate_in_video(inference_state):
-                masks_per_frame[out_frame_idx] = {
-                    out_obj_id: (out_mask_logits[i] > 0.0).cpu().numpy()
-                    for i, out_obj_id in enumerate(out_obj_ids)
-                }
-                
-                # Update progress (propagation is 40% of work per view)
-                # Base percent: 10% (extraction)
-                # Top view: 10-50%
-                # Bottom view: 50-90%
-                base_pct = 10 if view_name == "Top" else 50
-                curr_pct = base_pct + int((out_frame_idx / total_frames) * 40)
-                
-                segmentation_progress[filename].update({
-                    "message": f"Tracking {view_name} view: Frame {out_frame_idx}/{total_frames}",
+            progress["status"] = "tracking"
+            for out_frame_idx, out_obj_ids, out_mask_logits in predictor.propagate_in_video(inference_state, start_frame_idx=start_idx):
+                if out_frame_idx < resume_from:
+                    # The prompt frame itself is already in the mask log
+                    continue
+                progress.update({
                     "current_frame": out_frame_idx,
-                    "percent": curr_pct
+                    "percent": int(((out_frame_idx + 1) / max(len(source), 1)) * 100)
                 })
-                
-            return masks_per_frame
+                job.update()
+                yield out_frame_idx, mask_store.logits_to_crops(out_obj_ids, out_mask_logits)
+            progress["status"] = "done"
+            job.update()
 
-        # Run Top View
-        top_masks = run_view_propagation(top_dir, top_players, "Top", y_offset=0)
+        def resumed_view(view_name, live):
+            """Frames of a view from the mask log, then the ones propagated now"""
+            try:
+                yield from mask_log.view_items(view_name)
+                yield from live
+            finally:
+                live.close()
         
-        # Run Bottom View
-        bottom_masks = run_view_propagation(bottom_dir, bottom_players, "Bottom", y_offset=height//2)
+        def log_masks(joined):
+            """Append newly propagated frames to the mask log, checkpointing it periodically and on cancel"""
+            for i, masks in joined:
+                if i >= resume_from:
+                    mask_log.append(i, masks)
+                if job.checkpoint_due() or job.cancelled:
+                    job.save_checkpoint({"log_bytes": mask_log.flush(), "frames": mask_log.frames})
+                job.raise_if_cancelled()
+                yield i, masks
         
-        # Render Video
-        segmentation_progress[filename]["message"] = "Rendering final video..."
+        active_views = int(bool(top_players)) + int(bool(bottom_players))
+        workers = active_views if concurrent_views else 1
         
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(str(output_path), fourcc, fps, (width, height))
-        orange_color = [0, 165, 255]
+        views = {
+            "Top": propagate_view(top_source, top_players, "Top", y_offset=0),
+            "Bottom": propagate_view(bottom_source, bottom_players, "Bottom", y_offset=height//2),
+        }
+        if workers > 1:
+            # Propagate both views at once, each on its own thread
+            views = {
+                name: propagation.background_stream(frames, maxsize=PROPAGATION_QUEUE_SIZE,
+                                                    name=f"propagate-{name.lower()}", share_cores=True)
+                for name, frames in views.items()
+            }
+        if resume:
+            views = {name: resumed_view(name, live) for name, live in views.items()}
         
-        for i, frame_name in enumerate(frame_names):
-            # Read original split frames
-            t_frame = cv2.imread(str(top_dir / frame_name))
-            b_frame = cv2.imread(str(bottom_dir / frame_name))
-            
-            # Apply Top Masks
-            if i in top_masks:
-                for obj_id, mask in top_masks[i].items():
-                    mask = mask[0] # (1, H, W) -> (H, W)
-                    overlay = np.zeros_like(t_frame)
-                    overlay[mask] = orange_color
-                    if mask.any():
-                        t_frame[mask] = cv2.addWeighted(t_frame[mask], 0.4, overlay[mask], 0.6, 0)
-            
-            # Apply Bottom Masks
-            if i in bottom_masks:
-                for obj_id, mask in bottom_masks[i].items():
-                    mask = mask[0]
-                    overlay = np.zeros_like(b_frame)
-                    overlay[mask] = orange_color
-                    if mask.any():
-                        b_frame[mask] = cv2.addWeighted(b_frame[mask], 0.4, overlay[mask], 0.6, 0)
-            
-            # Combine
-            final_frame = np.vstack([t_frame, b_frame])
-            out.write(final_frame)
-            
-            # Update progress (Rendering is last 10%)
-            pct = 90 + int((i / total_frames) * 10)
-            segmentation_progress[filename].update({
-                "message": f"Rendering video: Frame {i}/{total_frames}",
-                "current_frame": i,
-                "percent": pct
-            })
-            
-        out.release()
+        stores = []
+        if not stream:
+            # Propagate the views to completion first, keeping the masks packed (and spilled past the budget)
+            top_store = mask_store.MaskStore(MASK_STORE_BUDGET, spill_dir=str(job.scratch_dir))
+            bottom_store = mask_store.MaskStore(MASK_STORE_BUDGET, spill_dir=str(job.scratch_dir))
+            stores = [top_store, bottom_store]
+            try:
+                for i, masks in log_masks(propagation.join_views(views, len(top_source))):
+                    top_store.add_crops(i, masks["Top"])
+                    bottom_store.add_crops(i, masks["Bottom"])
+                    job.update(**{
+                        "stage": "tracking",
+                        "message": f"Tracking: Frame {i}/{total_frames}",
+                        "current_frame": i,
+                        "percent": 10 + int((i / total_frames) * 80)
+                    })
+            except BaseException:
+                # The rendering block below closes them otherwise
+                for store in stores:
+                    store.close()
+                raise
+            views = {"Top": top_store.items(), "Bottom": bottom_store.items()}
+        
+        # Render Video - in streaming mode frames are composited and written as soon as both views have them
+        out = video_encoder.open_writer(scratch_path, fps, width, height)
+        mask_compositor = compositor.MaskCompositor(compositor.ORANGE, alpha=0.6, color_mode=color_mode, render_mode=render_mode)
+        
+        render_decoder = video_decoder.open_video(video_path)
+        
+        def with_frames(items):
+            """Pair each frame's masks with the frame decoded again for rendering"""
+            decoded = iter(render_decoder)
+            for i, masks in items:
+                for idx, frame in decoded:
+                    if idx == i:
+                        break
+                else:
+                    raise RuntimeError(f"Video ended before frame {i} while rendering")
+                yield i, masks, frame
         
-        # Cleanup
-        if frames_dir.exists():
-            shutil.rmtree(frames_dir, ignore_errors=True)
+        def render_frame(item):
+            i, masks, final_frame = item
+            # Composite each view in place in the stacked frame
+            split = top_source.height
+            mask_compositor.render(final_frame[:split], masks["Top"])
+            mask_compositor.render(final_frame[split:], masks["Bottom"])
+            return final_frame
+        
+        joined = propagation.join_views(views, len(top_source))
+        try:
+            frames_to_render = with_frames(log_masks(joined) if stream else joined)
+            for i, final_frame in enumerate(compositor.render_ordered(render_frame, frames_to_render, workers=RENDER_WORKERS)):
+                out.write(final_frame)
+                job.raise_if_cancelled()
+                
+                if stream:
+                    # Tracking and rendering run together after extraction (10-100%)
+                    stage = "tracking_rendering"
+                    message = f"Tracking and rendering: Frame {i}/{total_frames}"
+                    pct = 10 + int((i / total_frames) * 90)
+                else:
+                    # Rendering is last 10%
+                    stage = "rendering"
+                    message = f"Rendering video: Frame {i}/{total_frames}"
+                    pct = 90 + int((i / total_frames) * 10)
+                job.update(**{
+                    "stage": stage,
+                    "message": message,
+                    "current_frame": i,
+                    "percent": pct
+                })
+        finally:
+            joined.close()
+            render_decoder.close()
+            for store in stores:
+                store.close()
+            out.release()
+        os.replace(scratch_path, output_path)
             
         # Complete
-        segmentation_progress[filename] = {
+        job.set_progress({
             "status": "completed",
             "message": f"Segmentation complete! Processed {total_frames} frames.",
             "current_frame": total_frames,
             "total_frames": total_frames,
             "percent": 100,
+            "views": view_progress,
             "result_url": f"http://localhost:8000/video/{output_filename}"
-        }
+        })
+        if result_key:
+            results_cache.put(result_key, job.progress, artifacts=[output_path],
+                              kind="segment-full-video", video=filename)
         
     except Exception as e:
         print(f"Error in full video segmentation: {e}")
         import traceback
         traceback.print_exc()
-        segmentation_progress[filename] = {
+        job.set_progress({
             "status": "error",
             "message": f"Error: {str(e)}",
             "current_frame": 0,
             "total_frames": 0,
             "error": str(e)
-        }
+        })
+    finally:
+        if mask_log is not None:
+            mask_log.close()
+        models.release("sam2_video")
+
+jobs.register("segment-full-video", segment_full_video_task, resource="sam2")
 
 # Force reload comment
 
 @app.post("/segment-full-video")
-async def segment_full_video(request: dict, background_tasks: BackgroundTasks):
-    """Start full video segmentation in background"""
+async def segment_full_video(request: dict):
+    """Start full video segmentation as a background job"""
     filename = request.get('filename')
     top_players = request.get('top_players', [])
     bottom_players = request.get('bottom_players', [])
+    color_mode = request.get('color_mode', 'single')
+    render_mode = request.get('render_mode', 'fill')
+    stream = bool(request.get('stream', True))
+    concurrent_views = bool(request.get('concurrent_views', True))
+    use_cache = bool(request.get('use_cache', True))
+    priority = int(request.get('priority', 0))
+    check_render_modes(color_mode, render_mode)
     
     video_path = UPLOAD_DIR / filename
     if not video_path.exists():
         raise HTTPException(status_code=404, detail="Video not found")
     
-    # Initialize progress
-    segmentation_progress[filename] = {
+    params = {
+        "filename": filename, "top_players": top_players, "bottom_players": bottom_players,
+        "color_mode": color_mode, "render_mode": render_mode, "stream": stream, "concurrent_views": concurrent_views
+    }
+    key = None
+    if use_cache:
+        key = await run_in_threadpool(
+            cache_key, "segment-full-video", filename, top_players=top_players, bottom_players=bottom_players,
+            color_mode=color_mode, render_mode=render_mode, model=sam2_model_id()
+        )
+        cached = await run_in_threadpool(results_cache.get, key, restore_to=PROCESSED_DIR) if key else None
+        if cached:
+            job = await run_in_threadpool(jobs.record, "segment-full-video", filename, {**cached, "cache_hit": True}, params=params)
+            return {
+                "status": "completed",
+                "message": "Segmentation loaded from cache",
+                "output_filename": f"segmented_full_{filename}",
+                "result_url": cached.get("result_url"),
+                "job_id": job["job_id"]
+            }
+    
+    # Queue the job (an identical one already queued or running is reused)
+    job = await run_in_threadpool(jobs.submit, "segment-full-video", filename, {**params, "result_key": key}, priority=priority, dedupe_key=key, progress={
         "status": "starting",
         "message": "Initializing full video segmentation...",
         "current_frame": 0,
         "total_frames": 0,
         "percent": 0
-    }
-    
-    # Start background task
-    background_tasks.add_task(segment_full_video_task, filename, top_players, bottom_players)
+    })
     
     return {
         "status": "processing",
         "message": "Full video segmentation started",
-        "output_filename": f"segmented_full_{filename}"
+        "output_filename": f"segmented_full_{filename}",
+        "job_id": job["job_id"]
     }
 
 @app.get("/segment-progress/{filename}")
-async def get_segment_progress(filename: str):
-    """Get progress of full video segmentation"""
-    if filename in segmentation_progress:
-        return segmentation_progress[filename]
+async def get_segment_progress(filename: str, job_id: Optional[str] = None):
+    """Get progress of full video segmentation (the latest job for the video unless job_id is given)"""
+    progress = await run_in_threadpool(job_progress, "segment-full-video", filename, job_id)
+    if progress is not None:
+        return progress
     return {
         "status": "not_found",
         "message": "No segmentation in progress for this video",
@@ -893,44 +1151,125 @@ async def get_segment_progress(filename: str):
         "percent": 0
     }
 
-def detect_players_full_video_task(filename, experiment_id, top_corners, bottom_corners, detection_mode, los_position):
+def detect_players_full_video_task(job, filename, experiment_id, top_corners, bottom_corners, detection_mode, los_position, nms_method='hard', batch_size=4,
+                                   start_frame=0, end_frame=None, frame_stride=1, keyframe_interval=1, redetect_confidence=0.3,
+                                   result_key=None):
+    writer = None
     try:
+        # Pick up after the last checkpoint of an earlier run of this job
+        checkpoint = job.load_checkpoint() or {}
+        frames_done = checkpoint.get("frames_done", 0)
+        if frames_done:
+            job.log(f"Resuming from checkpoint at frame {frames_done}")
+        
         video_path = UPLOAD_DIR / filename
-        cap = cv2.VideoCapture(str(video_path))
-        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        decoder = video_decoder.open_video(video_path, start=start_frame + frames_done * frame_stride, end=end_frame, stride=frame_stride)
+        fps = decoder.fps
+        total_frames = frames_done + len(decoder)
         
-        all_frames_results = []
-        frame_idx = 0
-        start_time = time.time()
+        # Finished frames go straight to disk (and to clients following the job), not into memory
+        writer = detection_store.ResultWriter(job.scratch_dir, fps, state=checkpoint.get("writer"))
+        frame_idx = frames_done
+        start_time = time.time() - checkpoint.get("elapsed", 0)
+        trackers = checkpoint.get("trackers") or {"Top": tracker.PlayerTracker(), "Bottom": tracker.PlayerTracker()}
         
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret: break
-            
-            h, w = frame.shape[:2]
-            top_players, _ = execute_detection(frame[:h//2, :], top_corners, 0, "Top", detection_mode, los_position)
-            bottom_players, _ = execute_detection(frame[h//2:, :], bottom_corners, h//2, "Bottom", detection_mode, los_position)
-            
-            timestamp = frame_idx / fps
-            all_frames_results.append({
-                "frame": frame_idx,
-                "timestamp": timestamp,
+        def save_checkpoint(**state):
+            """Everything needed to continue after the frame_idx frames processed so far"""
+            job.save_checkpoint({
+                "frames_done": frame_idx, "writer": writer.state(), "trackers": trackers,
+                "elapsed": time.time() - start_time, **state
+            })
+        
+        def split_views(frame):
+            h = frame.shape[0]
+            return [(frame[:h//2, :], top_corners, 0, "Top"), (frame[h//2:, :], bottom_corners, h//2, "Bottom")]
+        
+        def record(idx, top_players, bottom_players, keyframe=True):
+            writer.append({
+                "frame": idx,
                 "top_players": top_players,
-                "bottom_players": bottom_players
+                "bottom_players": bottom_players,
+                "keyframe": keyframe
             })
-            
-            frame_idx += 1
-            if frame_idx % 10 == 0:
-                player_detection_progress[filename] = {
-                    "status": "processing",
-                    "percent": int((frame_idx / total_frames) * 100),
-                    "message": f"Processing frame {frame_idx}/{total_frames}...",
-                    "current_frame": frame_idx,
-                    "total_frames": total_frames
-                }
         
-        cap.release()
+        def report_progress():
+            # Cheap in-memory update; listeners are sent at most a few snapshots a second
+            job.set_progress({
+                "status": "processing",
+                "stage": "detecting",
+                "percent": int((frame_idx / max(total_frames, 1)) * 100),
+                "message": f"Processing frame {frame_idx}/{total_frames}...",
+                "current_frame": frame_idx,
+                "total_frames": total_frames
+            })
+        
+        if keyframe_interval <= 1:
+            # Detect on every frame, K frames x 2 views per model call
+            pending = [] # frames waiting for the next batched model call
+            
+            def flush_batch():
+                views = []
+                for _, frame in pending:
+                    views.extend(split_views(frame))
+                outputs = execute_detection_batch(views, detection_mode, los_position, nms_method)
+                for i, (idx, _) in enumerate(pending):
+                    for t in trackers.values():
+                        t.predict()
+                    record(idx, trackers["Top"].update(outputs[2 * i][0]), trackers["Bottom"].update(outputs[2 * i + 1][0]))
+                pending.clear()
+            
+            for idx, frame in decoder:
+                pending.append((idx, frame))
+                if len(pending) >= batch_size or job.cancelled:
+                    flush_batch()
+                frame_idx += 1
+                report_progress()
+                # Checkpoints are taken between batches, when every frame so far has its result
+                if not pending and (job.checkpoint_due() or job.cancelled):
+                    save_checkpoint()
+                job.raise_if_cancelled()
+            
+            if pending:
+                flush_batch()
+        else:
+            # Detect every keyframe_interval frames, the tracker fills the frames in between.
+            # A keyframe comes sooner when the expected IoU of the predictions (extrapolated
+            # from how well they matched at the last keyframe) drops below redetect_confidence
+            gap = checkpoint.get("gap", []) # (idx, top_players, bottom_players) since the last keyframe
+            last_key = checkpoint.get("last_key", {"Top": [], "Bottom": []})
+            since_key = checkpoint.get("since_key")
+            
+            for idx, frame in decoder:
+                predicted = {name: t.predict() for name, t in trackers.items()}
+                needs_detection = (
+                    since_key is None or since_key + 1 >= keyframe_interval
+                    or min(t.confidence() for t in trackers.values()) < redetect_confidence
+                )
+                
+                if needs_detection:
+                    outputs = execute_detection_batch(split_views(frame), detection_mode, los_position, nms_method)
+                    key = {"Top": trackers["Top"].update(outputs[0][0]), "Bottom": trackers["Bottom"].update(outputs[1][0])}
+                    # Now that both ends are known, interpolate the frames in between
+                    tracker.interpolate_gap([g[1] for g in gap], last_key["Top"], key["Top"])
+                    tracker.interpolate_gap([g[2] for g in gap], last_key["Bottom"], key["Bottom"])
+                    for g in gap:
+                        record(*g, keyframe=False)
+                    gap.clear()
+                    record(idx, key["Top"], key["Bottom"])
+                    last_key, since_key = key, 0
+                else:
+                    gap.append((idx, predicted["Top"], predicted["Bottom"]))
+                    since_key += 1
+                
+                frame_idx += 1
+                report_progress()
+                if job.checkpoint_due() or job.cancelled:
+                    save_checkpoint(gap=gap, last_key=last_key, since_key=since_key)
+                job.raise_if_cancelled()
+            
+            # Trailing frames after the last keyframe keep their Kalman predictions
+            for g in gap:
+                record(*g, keyframe=False)
         
         # Format labels to match frontend
         method_labels = {
@@ -940,28 +1279,10 @@ def detect_players_full_video_task(filename, experiment_id, top_corners, bottom_
             'grid': 'FOP using Grid'
         }
         
-        def transform_player(p):
-            return {
-                "centerX": int(round((p['x1'] + p['x2']) / 2)),
-                "centerY": int(round((p['y1'] + p['y2']) / 2)),
-                "radiusX": int(round((p['x2'] - p['x1']) / 2)),
-                "radiusY": int(round((p['y2'] - p['y1']) / 2)),
-                "confidence": float(f"{p.get('confidence', 0):.4f}")
-            }
-
-        transformed_results = []
-        for r in all_frames_results:
-            transformed_results.append({
-                "frameNumber": r["frame"],
-                "videoTimestamp": float(f"{r['timestamp']:.4f}"),
-                "left_view": [transform_player(p) for p in r["top_players"]],
-                "right_view": [transform_player(p) for p in r["bottom_players"]]
-            })
-
-        output_filename = f"detection_results_{filename}_{int(time.time())}.json"
-        output_path = Path("backend/uploads") / output_filename
-        
-        final_data = {
+        # One row per detected player; frame-level settings go into the file's metadata
+        output_filename = f"detection_results_{filename}_{int(time.time())}.parquet"
+        output_path = UPLOAD_DIR / output_filename
+        file_size = writer.finish(output_path, {
             "timestamp": int(time.time()),
             "method": method_labels.get(detection_mode, detection_mode),
             "fop_corners": {
@@ -971,44 +1292,255 @@ def detect_players_full_video_task(filename, experiment_id, top_corners, bottom_
             "experiment_id": experiment_id,
             "filename": filename,
             "detection_mode": detection_mode,
+            "keyframe_interval": keyframe_interval,
             "total_frames": total_frames,
-            "results": transformed_results,
+            "fps": fps,
+            "first_frame": start_frame,
+            "frame_stride": frame_stride,
+            "frame_count": frame_idx,
             "execution_time": time.time() - start_time
-        }
-        
-        with open(output_path, 'w') as f:
-            json.dump(final_data, f)
-            
-        file_size = output_path.stat().st_size
+        })
         execution_time = time.time() - start_time
             
-        player_detection_progress[filename] = {
+        job.set_progress({
             "status": "completed",
             "percent": 100,
             "message": "Detection complete!",
             "result_url": f"http://localhost:8000/video/{output_filename}",
+            "query_url": f"http://localhost:8000/detections/{output_filename}",
             "filename": output_filename,
             "total_frames": total_frames,
             "file_size": file_size,
             "execution_time": execution_time
-        }
+        })
+        if result_key:
+            results_cache.put(result_key, job.progress, artifacts=[output_path],
+                              kind="detect-players-full-video", video=filename)
     except Exception as e:
-        player_detection_progress[filename] = {"status": "error", "message": f"Error: {str(e)}"}
+        job.set_progress({"status": "error", "message": f"Error: {str(e)}"})
+    finally:
+        if writer is not None:
+            writer.close()
+
+jobs.register("detect-players-full-video", detect_players_full_video_task, resource="yolo")
 
 @app.post("/detect-players-full-video")
-async def detect_players_full_video(request: dict, background_tasks: BackgroundTasks):
+async def detect_players_full_video(request: dict):
     filename = request.get('filename')
     experiment_id = request.get('experiment_id')
     top_corners, bottom_corners = request.get('top_corners', []), request.get('bottom_corners', [])
     detection_mode, los_position = request.get('detection_mode', 'fop'), request.get('los_position', 0.5)
+    nms_method = request.get('nms_method', 'hard')
+    batch_size = max(1, int(request.get('batch_size', 4))) # frames per YOLO call
+    start_frame, end_frame = int(request.get('start_frame', 0)), request.get('end_frame')
+    end_frame = int(end_frame) if end_frame is not None else None
+    frame_stride = max(1, int(request.get('frame_stride', 1)))
+    keyframe_interval = max(1, int(request.get('keyframe_interval', 1))) # 1 = detect on every frame
+    redetect_confidence = float(request.get('redetect_confidence', 0.3))
+    use_cache = bool(request.get('use_cache', True))
+    priority = int(request.get('priority', 0))
+    if nms_method not in nms.NMS_METHODS:
+        raise HTTPException(status_code=400, detail=f"nms_method must be one of {nms.NMS_METHODS}")
+    
+    params = {
+        "filename": filename, "experiment_id": experiment_id, "top_corners": top_corners, "bottom_corners": bottom_corners,
+        "detection_mode": detection_mode, "los_position": los_position, "nms_method": nms_method, "batch_size": batch_size,
+        "start_frame": start_frame, "end_frame": end_frame, "frame_stride": frame_stride,
+        "keyframe_interval": keyframe_interval, "redetect_confidence": redetect_confidence
+    }
+    key = None
+    if use_cache and (UPLOAD_DIR / filename).exists():
+        key = await run_in_threadpool(
+            cache_key, "detect-players-full-video", filename, top_corners=top_corners, bottom_corners=bottom_corners,
+            detection_mode=detection_mode, los_position=los_position, nms_method=nms_method,
+            start_frame=start_frame, end_frame=end_frame, frame_stride=frame_stride,
+            keyframe_interval=keyframe_interval, redetect_confidence=redetect_confidence, model=YOLO_MODEL_ID,
+            output_format="parquet"
+        )
+        cached = await run_in_threadpool(results_cache.get, key, restore_to=UPLOAD_DIR) if key else None
+        if cached:
+            job = await run_in_threadpool(jobs.record, "detect-players-full-video", filename, {**cached, "cache_hit": True}, params=params)
+            return {"status": "completed", "message": "Detection loaded from cache", "result_url": cached.get("result_url"),
+                    "query_url": cached.get("query_url"), "job_id": job["job_id"]}
     
-    player_detection_progress[filename] = {"status": "starting", "percent": 0, "message": "Starting video detection..."}
-    background_tasks.add_task(detect_players_full_video_task, filename, experiment_id, top_corners, bottom_corners, detection_mode, los_position)
-    return {"status": "processing", "message": "Started full video detection"}
+    job = await run_in_threadpool(
+        jobs.submit, "detect-players-full-video", filename, {**params, "result_key": key}, priority=priority, dedupe_key=key,
+        progress={"status": "starting", "percent": 0, "message": "Starting video detection..."}
+    )
+    return {"status": "processing", "message": "Started full video detection", "job_id": job["job_id"]}
 
 @app.get("/detection-progress/{filename}")
-async def get_detection_progress(filename: str):
-    return player_detection_progress.get(filename, {"status": "not_found"})
+async def get_detection_progress(filename: str, job_id: Optional[str] = None):
+    progress = await run_in_threadpool(job_progress, "detect-players-full-video", filename, job_id)
+    return progress or {"status": "not_found"}
+
+@app.get("/detections/{result_name}")
+async def query_detections(result_name: str, start_frame: Optional[int] = None, end_frame: Optional[int] = None,
+                           start_time: Optional[float] = None, end_time: Optional[float] = None,
+                           view: Optional[str] = None, min_confidence: Optional[float] = None,
+                           max_frames: int = detection_store.MAX_QUERY_FRAMES):
+    """
+    A window of a full-video detection result: frames [start_frame, end_frame) or
+    [start_time, end_time) seconds, optionally one view (left/top, right/bottom)
+    and detections of at least min_confidence
+    """
+    path = UPLOAD_DIR / Path(result_name).name
+    if path.suffix != ".parquet" or not path.exists():
+        raise HTTPException(status_code=404, detail="Detection result not found")
+    try:
+        return await run_in_threadpool(
+            detection_store.query, path, start_frame=start_frame, end_frame=end_frame, start_time=start_time,
+            end_time=end_time, view=view, min_confidence=min_confidence,
+            max_frames=max(1, min(max_frames, detection_store.MAX_QUERY_FRAMES))
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ===== JOB ENDPOINTS =====
+
+@app.get("/jobs")
+async def list_jobs(filename: Optional[str] = None, kind: Optional[str] = None, status: Optional[str] = None, limit: int = 50):
+    return {"jobs": await run_in_threadpool(jobs.list, filename, kind, status, limit), "workers": jobs.stats()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/logs")
+async def get_job_logs(job_id: str):
+    logs = await run_in_threadpool(jobs.logs, job_id)
+    if logs is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"logs": logs}
+
+# Seconds between checks for new progress on an event stream, and between keep-alive comments
+PROGRESS_EVENT_INTERVAL = 0.25
+PROGRESS_KEEPALIVE_SECONDS = 15
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-sent progress events (see JobScheduler.event) until the job has finished"""
+    if await run_in_threadpool(jobs.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        last_version, last_sent = None, time.time()
+        while not await request.is_disconnected():
+            version = jobs.version(job_id)
+            if version != last_version:
+                event = await run_in_threadpool(jobs.event, job_id)
+                if event is not None:
+                    last_version, last_sent = version, time.time()
+                    yield f"data: {json.dumps(event, default=str)}\n\n"
+                    if event["job_status"] not in job_scheduler.ACTIVE_STATUSES:
+                        return
+            elif time.time() - last_sent > PROGRESS_KEEPALIVE_SECONDS:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(PROGRESS_EVENT_INTERVAL)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Seconds between checks for new frames on a detection stream
+DETECTION_STREAM_INTERVAL = 0.25
+# Bytes of the NDJSON file read per step, so catching up on a long job keeps memory flat
+DETECTION_STREAM_BLOCK = 1024 * 1024
+FRAME_PREFIX = b'{"frameNumber": '
+
+def read_new_lines(path: Path, position: int, limit: int = DETECTION_STREAM_BLOCK):
+    """
+    Complete lines appended to path since byte position (about limit bytes of
+    them at most), and the position after them
+    """
+    try:
+        with path.open("rb") as f:
+            if f.seek(0, os.SEEK_END) < position:
+                position = 0  # truncated back to a checkpoint by a resumed run
+            f.seek(position)
+            data = f.read(limit)
+            # A line longer than the block is read to its end
+            while data and b"\n" not in data[-limit:]:
+                more = f.read(limit)
+                if not more:
+                    break
+                data += more
+    except FileNotFoundError:
+        return [], position
+    end = data.rfind(b"\n") + 1
+    return data[:end].splitlines(), position + end
+
+def line_frame(line: bytes) -> int:
+    """frameNumber of an NDJSON frame record, read off its first key without parsing the line"""
+    if line.startswith(FRAME_PREFIX):
+        return int(line[len(FRAME_PREFIX):line.index(b",")])
+    return json.loads(line)["frameNumber"]
+
+@app.get("/jobs/{job_id}/detections")
+async def stream_detections(job_id: str, request: Request, from_frame: int = 0):
+    """
+    Per-frame detections of a full-video detection job as NDJSON (one
+    /detections-style frame record per line), starting at from_frame. Follows
+    the job while it runs and ends once every frame has been sent, so a client
+    can reconnect with from_frame set past the last frame it received.
+    """
+    info = await run_in_threadpool(jobs.get, job_id)
+    if info is None or info["kind"] != "detect-players-full-video":
+        raise HTTPException(status_code=404, detail="Detection job not found")
+    path = jobs.scratch_dir(job_id) / detection_store.NDJSON_NAME
+
+    async def stream():
+        next_frame, position = from_frame, 0
+        # Live part: frames as the job appends them to its scratch file
+        while not await request.is_disconnected():
+            lines, position = await run_in_threadpool(read_new_lines, path, position)
+            for line in lines:
+                frame = line_frame(line)
+                if frame >= next_frame:
+                    next_frame = frame + 1
+                    yield line + b"\n"
+            if lines:
+                continue
+            status = (await run_in_threadpool(jobs.get, job_id))["status"]
+            if status not in job_scheduler.ACTIVE_STATUSES:
+                break
+            await asyncio.sleep(DETECTION_STREAM_INTERVAL)
+        else:
+            return
+
+        # Finished: the rest comes from the result file (the scratch file is gone by now)
+        info = await run_in_threadpool(jobs.get, job_id)
+        result_name = ""
+        if info["status"] == "completed":
+            result_name = info["progress"].get("filename") or ""
+        result_path = UPLOAD_DIR / result_name if result_name.endswith(".parquet") else None
+        while next_frame is not None and result_path is not None and result_path.exists():
+            page = await run_in_threadpool(detection_store.query, result_path, start_frame=next_frame)
+            for record in page["results"]:
+                yield json.dumps(record).encode() + b"\n"
+            next_frame = page["next_frame"]
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued job, or ask a running one to checkpoint and stop"""
+    try:
+        return await run_in_threadpool(jobs.cancel, job_id)
+    except job_scheduler.JobError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.post("/jobs/{job_id}/resume")
+async def resume_job(job_id: str):
+    """Re-queue a failed, cancelled or interrupted job; it continues from its last checkpoint"""
+    try:
+        return await run_in_threadpool(jobs.resume, job_id)
+    except job_scheduler.JobError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
 # ===== EXPERIMENT MANAGEMENT ENDPOINTS =====
 
@@ -1016,23 +1548,60 @@ async def get_detection_progress(filename: str):
 async def create_experiment(request: dict):
     """Create a new experiment"""
     name = request.get('name', 'unnamed experiment')
-    experiment_id = experiment_db.create_experiment(name)
-    experiment = experiment_db.get_experiment(experiment_id)
+    experiment_id = await run_in_threadpool(experiment_db.create_experiment, name)
+    experiment = await run_in_threadpool(experiment_db.get_experiment, experiment_id)
     return experiment
 
 @app.get("/experiments")
-async def list_experiments():
-    """List all experiments"""
-    experiments = experiment_db.get_all_experiments()
-    return {"experiments": experiments}
+async def list_experiments(limit: int = experiment_db.DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    """List experiments, most recently updated first, one page at a time (pass next_cursor back as cursor)"""
+    try:
+        experiments, next_cursor = await run_in_threadpool(experiment_db.get_experiments_page, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"experiments": experiments, "next_cursor": next_cursor}
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already names etag (weak comparison)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
 
 @app.get("/experiments/{experiment_id}")
-async def get_experiment(experiment_id: int):
-    """Get experiment details with full timeline"""
-    experiment = experiment_db.get_experiment(experiment_id)
+async def get_experiment(experiment_id: int, request: Request, full: bool = False):
+    """
+    Get experiment details with its timeline. Entries carry summaries of their
+    data (fields too large to summarize are listed in omitted) unless full is set.
+    Answers 304 when the client's If-None-Match matches the current revision.
+    """
+    revision = await run_in_threadpool(experiment_db.get_experiment_revision, experiment_id)
+    if revision is None:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    variant = "full" if full else "summary"
+    etag = f'"{experiment_id}-{revision}-{variant}"'
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    
+    experiment = await run_in_threadpool(experiment_db.get_experiment, experiment_id, full=full)
     if not experiment:
         raise HTTPException(status_code=404, detail="Experiment not found")
-    return experiment
+    # Tagged with the revision the snapshot was read at, which may be newer than the one checked above
+    etag = f'"{experiment_id}-{experiment["revision"]}-{variant}"'
+    return JSONResponse(experiment, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@app.get("/experiments/{experiment_id}/timeline/{entry_id}")
+async def get_timeline_entry(experiment_id: int, entry_id: int, request: Request):
+    """One timeline entry with its whole data (entries never change, so the ETag is just the id)"""
+    etag = f'"{experiment_id}-entry-{entry_id}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    entry = await run_in_threadpool(experiment_db.get_timeline_entry, experiment_id, entry_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Timeline entry not found")
+    return JSONResponse(entry, headers=headers)
 
 @app.put("/experiments/{experiment_id}/name")
 async def update_experiment_name(experiment_id: int, request: dict):
@@ -1041,7 +1610,7 @@ async def update_experiment_name(experiment_id: int, request: dict):
     if not name:
         raise HTTPException(status_code=400, detail="Name is required")
     
-    success = experiment_db.update_experiment_name(experiment_id, name)
+    success = await run_in_threadpool(experiment_db.update_experiment_name, experiment_id, name)
     if not success:
         raise HTTPException(status_code=404, detail="Experiment not found")
     
@@ -1050,7 +1619,7 @@ async def update_experiment_name(experiment_id: int, request: dict):
 @app.delete("/experiments/{experiment_id}")
 async def delete_experiment(experiment_id: int):
     """Delete an experiment"""
-    success = experiment_db.delete_experiment(experiment_id)
+    success = await run_in_threadpool(experiment_db.delete_experiment, experiment_id)
     if not success:
         raise HTTPException(status_code=404, detail="Experiment not found")
     return {"success": True}
@@ -1065,9 +1634,21 @@ async def add_timeline_entry(experiment_id: int, request: dict):
     if not step_type:
         raise HTTPException(status_code=400, detail="step_type is required")
     
-    entry_id = experiment_db.add_timeline_entry(experiment_id, step_type, data, replace_existing=replace)
+    entry_id = await run_in_threadpool(experiment_db.add_timeline_entry, experiment_id, step_type, data, replace_existing=replace)
     return {"success": True, "entry_id": entry_id}
 
+@app.post("/experiments/{experiment_id}/timeline/bulk")
+async def add_timeline_entries(experiment_id: int, request: dict):
+    """Add several timeline entries ({step_type, data}) to an experiment in one transaction"""
+    entries = request.get('entries', [])
+    replace = request.get('replace', False)
+    
+    if not isinstance(entries, list) or any(not isinstance(e, dict) or not e.get('step_type') for e in entries):
+        raise HTTPException(status_code=400, detail="entries must be a list of objects with a step_type")
+    
+    entry_ids = await run_in_threadpool(experiment_db.add_timeline_entries, experiment_id, entries, replace_existing=replace)
+    return {"success": True, "entry_ids": entry_ids}
+
 @app.post("/experiments/{experiment_id}/video")
 async def add_experiment_video(experiment_id: int, request: dict):
     """Add a video reference to an experiment"""
@@ -1077,6 +1658,6 @@ async def add_experiment_video(experiment_id: int, request: dict):
     if not video_url:
         raise HTTPException(status_code=400, detail="video_url is required")
     
-    video_id = experiment_db.add_video(experiment_id, video_url, video_type)
+    video_id = await run_in_threadpool(experiment_db.add_video, experiment_id, video_url, video_type)
     return {"success": True, "video_id": video_id}
 
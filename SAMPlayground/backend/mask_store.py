@@ -0,0 +1,268 @@
+"""
+Compact Mask Store
+Keeps propagated SAM 2 masks as bit-packed crops of each object's bounding
+box instead of full-resolution boolean frames. Once the in-memory payload
+passes a budget, payloads are spilled to a temporary file and read back
+lazily, one frame at a time, during rendering. A MaskLog appends the masks of
+every frame to a durable file so interrupted jobs can pick up where they were.
+"""
+
+import os
+import pickle
+import struct
+import tempfile
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Default in-memory budget for packed mask bytes before spilling to disk
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# (obj_id, x0, y0, h, w, payload) where payload is bytes in memory or (offset, length) on disk
+_Entry = Tuple[int, int, int, int, int, object]
+
+
+def encode_mask(mask: np.ndarray) -> Optional[Tuple[int, int, int, int, bytes]]:
+    """Crop a boolean (H, W) mask to its bounding box and bit-pack it; None if empty"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    y0, y1 = int(rows[0]), int(rows[-1]) + 1
+    cols = np.flatnonzero(mask[y0:y1].any(axis=0))
+    x0, x1 = int(cols[0]), int(cols[-1]) + 1
+    crop = mask[y0:y1, x0:x1]
+    return x0, y0, y1 - y0, x1 - x0, np.packbits(crop, axis=None).tobytes()
+
+
+def decode_mask(h: int, w: int, payload: bytes) -> np.ndarray:
+    """Inverse of encode_mask's packing: (h, w) boolean crop"""
+    bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8), count=h * w)
+    return bits.reshape(h, w).view(bool)
+
+
+def logits_to_crops(obj_ids, mask_logits) -> Dict[int, Tuple[np.ndarray, int, int]]:
+    """
+    Threshold SAM 2 mask logits (N, 1, H, W) of one frame and crop every object
+    to its bounding box: {obj_id: (crop bool (h, w), x0, y0)}, empty masks dropped.
+    All objects are moved to the host in one transfer.
+    """
+    if len(obj_ids) == 0:
+        return {}
+    masks = (mask_logits > 0.0).cpu().numpy().reshape(len(obj_ids), *mask_logits.shape[-2:])
+    # Bounding boxes of every object at once
+    rows_any = masks.any(axis=2)
+    cols_any = masks.any(axis=1)
+    crops = {}
+    for i, obj_id in enumerate(obj_ids):
+        rows = np.flatnonzero(rows_any[i])
+        if rows.size == 0:
+            continue
+        cols = np.flatnonzero(cols_any[i])
+        y0, y1, x0, x1 = int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+        crops[int(obj_id)] = (masks[i, y0:y1, x0:x1], x0, y0)
+    return crops
+
+
+class MaskStore:
+    """frame_idx -> {obj_id: (crop, x0, y0)} with bit-packed, disk-spillable storage"""
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET, spill_dir: Optional[str] = None):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.frames: Dict[int, List[_Entry]] = {}
+        self.bytes_in_memory = 0
+        self.bytes_spilled = 0
+        self._spill_file = None
+        self._spill_path = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __contains__(self, frame_idx):
+        return frame_idx in self.frames
+
+    def add_frame(self, frame_idx: int, obj_ids, mask_logits):
+        """
+        Store the masks SAM 2 yielded for one frame.
+        mask_logits is the (N, 1, H, W) tensor from propagate_in_video.
+        """
+        self.add_crops(frame_idx, logits_to_crops(obj_ids, mask_logits))
+
+    def add_crops(self, frame_idx: int, crops: Dict[int, Tuple[np.ndarray, int, int]]):
+        """Store {obj_id: (crop, x0, y0)} masks for one frame"""
+        entries = [
+            (int(obj_id), x0, y0, crop.shape[0], crop.shape[1], np.packbits(crop, axis=None).tobytes())
+            for obj_id, (crop, x0, y0) in crops.items()
+        ]
+        self._put(frame_idx, entries)
+
+    def add_masks(self, frame_idx: int, masks: Dict[int, np.ndarray]):
+        """Store boolean masks ((H, W) or (1, H, W)) for one frame"""
+        entries = []
+        for obj_id, mask in masks.items():
+            encoded = encode_mask(mask[0] if mask.ndim == 3 else mask)
+            if encoded is not None:
+                entries.append((int(obj_id),) + encoded)
+        self._put(frame_idx, entries)
+
+    def _put(self, frame_idx: int, entries: List[_Entry]):
+        with self._lock:
+            self.frames[frame_idx] = entries
+            self.bytes_in_memory += sum(len(e[5]) for e in entries)
+            if self.bytes_in_memory > self.memory_budget:
+                self._spill()
+
+    def _spill(self):
+        """Move every in-memory payload to the spill file (caller holds the lock)"""
+        if self._spill_file is None:
+            fd, self._spill_path = tempfile.mkstemp(prefix="masks_", suffix=".bin", dir=self.spill_dir)
+            self._spill_file = os.fdopen(fd, "w+b")
+        self._spill_file.seek(0, os.SEEK_END)
+        for frame_idx, entries in self.frames.items():
+            if not any(isinstance(e[5], bytes) for e in entries):
+                continue
+            spilled = []
+            for obj_id, x0, y0, h, w, payload in entries:
+                if isinstance(payload, bytes):
+                    offset = self._spill_file.tell()
+                    self._spill_file.write(payload)
+                    self.bytes_spilled += len(payload)
+                    payload = (offset, len(payload))
+                spilled.append((obj_id, x0, y0, h, w, payload))
+            self.frames[frame_idx] = spilled
+        self._spill_file.flush()
+        self.bytes_in_memory = 0
+
+    def _read(self, location) -> bytes:
+        offset, length = location
+        with self._lock:
+            self._spill_file.seek(offset)
+            return self._spill_file.read(length)
+
+    def get(self, frame_idx: int) -> Dict[int, Tuple[np.ndarray, int, int]]:
+        """Decode one frame: {obj_id: (crop bool (h, w), x0, y0)}"""
+        out = {}
+        for obj_id, x0, y0, h, w, payload in self.frames.get(frame_idx, []):
+            if not isinstance(payload, bytes):
+                payload = self._read(payload)
+            out[obj_id] = (decode_mask(h, w, payload), x0, y0)
+        return out
+
+    def items(self) -> Iterator[Tuple[int, Dict[int, Tuple[np.ndarray, int, int]]]]:
+        """(frame_idx, masks) for every stored frame in frame order, decoded lazily"""
+        for frame_idx in sorted(self.frames):
+            yield frame_idx, self.get(frame_idx)
+
+    def close(self):
+        """Drop all masks and delete the spill file"""
+        with self._lock:
+            self.frames.clear()
+            if self._spill_file is not None:
+                self._spill_file.close()
+                os.remove(self._spill_path)
+                self._spill_file = None
+                self._spill_path = None
+            self.bytes_in_memory = 0
+            self.bytes_spilled = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class MaskLog:
+    """
+    Append-only file of (frame_idx, {view: {obj_id: (crop, x0, y0)}}) records,
+    bit-packed like MaskStore. flush() makes everything appended so far durable
+    and returns the file size to checkpoint; reopening with truncate_to drops
+    whatever was appended after that checkpoint.
+    """
+
+    _HEADER = struct.Struct("<I")
+
+    def __init__(self, path: str, truncate_to: int = 0):
+        self.path = path
+        self.frames = 0
+        self.last_frame = None  # (frame_idx, views) of the last record
+        self._lock = threading.Lock()
+        mode = "r+b" if truncate_to and os.path.exists(path) else "w+b"
+        self._file = open(path, mode)
+        if mode == "r+b":
+            last = None
+            for last in self._records(truncate_to):
+                self.frames += 1
+            self._file.truncate(self._file.tell())
+            if last is not None:
+                self.last_frame = (last[0], self._unpack(last[1]))
+        self.size = self._file.tell()
+
+    @staticmethod
+    def _unpack(packed) -> Dict[str, Dict[int, Tuple[np.ndarray, int, int]]]:
+        return {
+            view: {obj_id: (decode_mask(h, w, payload), x0, y0) for obj_id, x0, y0, h, w, payload in entries}
+            for view, entries in packed.items()
+        }
+
+    def _records(self, limit: int) -> Iterator[Tuple[int, Dict[str, list]]]:
+        """Packed records stored before byte `limit`; leaves the file positioned after the last complete one"""
+        self._file.seek(0)
+        while True:
+            start = self._file.tell()
+            header = self._file.read(self._HEADER.size)
+            if len(header) < self._HEADER.size:
+                self._file.seek(start)
+                return
+            (length,) = self._HEADER.unpack(header)
+            data = self._file.read(length)
+            if len(data) < length or self._file.tell() > limit:
+                self._file.seek(start)
+                return
+            yield pickle.loads(data)
+
+    def append(self, frame_idx: int, views: Dict[str, Dict[int, Tuple[np.ndarray, int, int]]]):
+        packed = {
+            view: [(int(obj_id), x0, y0, crop.shape[0], crop.shape[1], np.packbits(crop, axis=None).tobytes())
+                   for obj_id, (crop, x0, y0) in crops.items()]
+            for view, crops in views.items()
+        }
+        data = pickle.dumps((frame_idx, packed), protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(self._HEADER.pack(len(data)) + data)
+            self.frames += 1
+            self.last_frame = (frame_idx, views)
+            self.size = self._file.tell()
+
+    def flush(self) -> int:
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            return self.size
+
+    def view_items(self, view: str) -> Iterator[Tuple[int, Dict[int, Tuple[np.ndarray, int, int]]]]:
+        """(frame_idx, masks) of one view for the frames logged so far, read lazily with its own handle"""
+        self.flush()
+        count = self.frames
+
+        def read():
+            with open(self.path, "rb") as f:
+                for _ in range(count):
+                    (length,) = self._HEADER.unpack(f.read(self._HEADER.size))
+                    frame_idx, packed = pickle.loads(f.read(length))
+                    yield frame_idx, self._unpack({view: packed.get(view, [])})[view]
+
+        return read()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
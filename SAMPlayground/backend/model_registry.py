@@ -0,0 +1,254 @@
+"""
+Model Registry
+Loads models on demand or at startup, shares weights between models that are
+built on top of each other (the SAM 2 image predictor wraps the video
+predictor's model), tracks the resident memory of each model and unloads idle
+ones when a memory budget or the host's free memory runs short.
+"""
+
+import gc
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+
+# psutil is optional - without it only the registry's own budget is enforced
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def module_bytes(obj: Any) -> int:
+    """Bytes held by the parameters and buffers of a model (or of its .model)"""
+    module = obj if isinstance(obj, torch.nn.Module) else getattr(obj, "model", None)
+    if not isinstance(module, torch.nn.Module):
+        return 0
+    seen = set()
+    total = 0
+    for tensor in list(module.parameters()) + list(module.buffers()):
+        if tensor.data_ptr() in seen:
+            continue
+        seen.add(tensor.data_ptr())
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelEntry:
+    """One registered model and its bookkeeping"""
+
+    def __init__(self, name: str, loader: Callable[..., Any], depends_on: Optional[List[str]] = None,
+                 warmup: Optional[Callable[[Any], None]] = None):
+        self.name = name
+        self.loader = loader
+        self.depends_on = depends_on or []
+        self.warmup = warmup
+        self.model = None
+        self.status = "unloaded"  # unloaded / loading / ready / error
+        self.error = None
+        self.memory_bytes = 0  # own weights only, shared weights are counted once on the owner
+        self.load_seconds = 0.0
+        self.last_used = 0.0
+        self.in_use = 0
+        self.warmed = False
+        self.lock = threading.Lock()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "status": self.status, "error": self.error, "memory_bytes": self.memory_bytes,
+            "load_seconds": round(self.load_seconds, 2), "in_use": self.in_use, "warmed": self.warmed,
+            "idle_seconds": round(time.time() - self.last_used, 1) if self.last_used else None,
+            "depends_on": self.depends_on
+        }
+
+
+class ModelRegistry:
+    """
+    register(name, loader, depends_on) then get/use(name).
+    A loader receives the loaded dependencies as arguments and returns the model.
+    memory_budget: bytes of model weights kept resident (0 = unlimited).
+    min_available: free host memory (bytes) below which idle models are unloaded.
+    """
+
+    def __init__(self, memory_budget: int = 0, min_available: int = 0):
+        self.memory_budget = memory_budget
+        self.min_available = min_available
+        self._entries: Dict[str, ModelEntry] = {}
+        self._lock = threading.RLock()
+        self._reaper = None
+
+    def register(self, name: str, loader: Callable[..., Any], depends_on: Optional[List[str]] = None,
+                 warmup: Optional[Callable[[Any], None]] = None):
+        self._entries[name] = ModelEntry(name, loader, depends_on, warmup)
+
+    def _entry(self, name: str) -> ModelEntry:
+        if name not in self._entries:
+            raise KeyError(f"Unknown model '{name}'")
+        return self._entries[name]
+
+    def get(self, name: str) -> Any:
+        """Loaded model (loading it and its dependencies first if needed); None if it failed to load"""
+        entry = self._entry(name)
+        entry.last_used = time.time()
+        if entry.model is not None:
+            return entry.model
+        with entry.lock:
+            if entry.model is not None:
+                return entry.model
+            deps = []
+            for dep in entry.depends_on:
+                model = self.get(dep)
+                if model is None:
+                    entry.status, entry.error = "error", f"Dependency '{dep}' is not available"
+                    return None
+                deps.append(model)
+
+            entry.status, entry.error = "loading", None
+            start = time.time()
+            try:
+                model = entry.loader(*deps)
+                if model is None:
+                    raise RuntimeError("Loader returned no model")
+            except Exception as e:
+                print(f"Failed to load model '{name}': {e}")
+                entry.status, entry.error = "error", str(e)
+                return None
+            entry.load_seconds = time.time() - start
+            shared = sum(module_bytes(self._entries[d].model) for d in entry.depends_on)
+            entry.memory_bytes = max(0, module_bytes(model) - shared)
+            entry.model = model
+            entry.status = "ready"
+            entry.last_used = time.time()
+            print(f"Model '{name}' loaded in {entry.load_seconds:.1f}s ({entry.memory_bytes / 1e6:.0f} MB)")
+        self.relieve_pressure(keep=[name] + entry.depends_on)
+        return entry.model
+
+    def acquire(self, name: str) -> Any:
+        """
+        Like get(), but the model can't be unloaded until release(name) is called.
+        Always pair with release(), even when None (unavailable) is returned.
+        """
+        entry = self._entry(name)
+        with self._lock:
+            entry.in_use += 1
+        return self.get(name)
+
+    def release(self, name: str):
+        entry = self._entry(name)
+        with self._lock:
+            entry.in_use = max(0, entry.in_use - 1)
+            entry.last_used = time.time()
+
+    @contextmanager
+    def use(self, name: str):
+        """Model for the duration of the block; it can't be unloaded meanwhile (None if unavailable)"""
+        try:
+            yield self.acquire(name)
+        finally:
+            self.release(name)
+
+    def _dependents(self, name: str) -> List[str]:
+        return [n for n, e in self._entries.items() if name in e.depends_on]
+
+    def _busy(self, name: str) -> bool:
+        return self._entries[name].in_use > 0 or any(self._busy(d) for d in self._dependents(name))
+
+    def unload(self, name: str, force: bool = False) -> bool:
+        """Drop a model (and models built on it); refuses while in use unless force"""
+        with self._lock:
+            if not force and self._busy(name):
+                return False
+            for dependent in self._dependents(name):
+                self.unload(dependent, force=True)
+            entry = self._entry(name)
+            if entry.model is None:
+                return True
+            entry.model = None
+            entry.status = "unloaded"
+            entry.memory_bytes = 0
+            entry.warmed = False
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print(f"Model '{name}' unloaded")
+        return True
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(e.memory_bytes for e in self._entries.values() if e.model is not None)
+
+    def under_pressure(self) -> bool:
+        if self.memory_budget and self.resident_bytes > self.memory_budget:
+            return True
+        if psutil is not None and self.min_available:
+            return psutil.virtual_memory().available < self.min_available
+        return False
+
+    def relieve_pressure(self, keep: Optional[List[str]] = None, idle_seconds: float = 0) -> List[str]:
+        """Unload least recently used idle models while under memory pressure"""
+        keep = set(keep or [])
+        unloaded = []
+        with self._lock:
+            candidates = sorted(
+                (e for e in self._entries.values() if e.model is not None and e.name not in keep),
+                key=lambda e: e.last_used
+            )
+            for entry in candidates:
+                if not self.under_pressure():
+                    break
+                if time.time() - entry.last_used < idle_seconds or entry.model is None:
+                    continue
+                if self.unload(entry.name):
+                    unloaded.append(entry.name)
+        return unloaded
+
+    def start_reaper(self, interval: float = 30.0, idle_seconds: float = 300.0):
+        """Background thread unloading models idle for idle_seconds whenever memory is short"""
+        if self._reaper is not None:
+            return
+
+        def reap():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.relieve_pressure(idle_seconds=idle_seconds)
+                except Exception as e:
+                    print(f"Model reaper error: {e}")
+
+        self._reaper = threading.Thread(target=reap, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def warm(self, names: List[str], background: bool = True):
+        """Load (and run each model's warm-up on) the given models"""
+        def run():
+            for name in names:
+                model = self.get(name)
+                entry = self._entries[name]
+                if model is None:
+                    continue
+                if entry.warmup is not None:
+                    try:
+                        with self.use(name):
+                            entry.warmup(model)
+                    except Exception as e:
+                        print(f"Warm-up of '{name}' failed: {e}")
+                entry.warmed = True
+
+        if background:
+            threading.Thread(target=run, name="model-warmup", daemon=True).start()
+        else:
+            run()
+
+    def ready(self, names: List[str]) -> bool:
+        """All of names loaded and warmed up"""
+        return all(self._entry(n).status == "ready" and self._entry(n).warmed for n in names)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "models": {name: entry.info() for name, entry in self._entries.items()},
+            "resident_bytes": self.resident_bytes,
+            "memory_budget": self.memory_budget,
+            "available_bytes": psutil.virtual_memory().available if psutil is not None else None
+        }
@@ -0,0 +1,236 @@
+"""
+Array-backed Non-Maximum Suppression
+Vectorized NMS over (N, 5) [x1, y1, x2, y2, score] arrays with hard, soft and
+weighted-merge variants, plus a batched entry point that suppresses many
+frames / stereo views in a single call.
+"""
+
+from typing import List, Dict, Optional, Any, Tuple
+
+import numpy as np
+
+# torchvision is optional - used for the hard NMS fast path when available
+try:
+    import torch
+    import torchvision
+except ImportError:
+    torch = None
+    torchvision = None
+
+NMS_METHODS = ("hard", "soft", "merge")
+
+# Up to this many boxes a full N x N IoU matrix beats one IoU row per kept box
+MATRIX_MAX_BOXES = 256
+
+
+def boxes_to_array(players: List[Dict[str, Any]]) -> np.ndarray:
+    """Convert player dicts (x1, y1, x2, y2, confidence) to an (N, 5) float array"""
+    if not players:
+        return np.zeros((0, 5), dtype=np.float32)
+    return np.array(
+        [[p['x1'], p['y1'], p['x2'], p['y2'], p.get('confidence', 0.0)] for p in players],
+        dtype=np.float32
+    )
+
+
+def array_to_boxes(arr: np.ndarray) -> List[Dict[str, float]]:
+    """Convert an (N, 5) array back to player dicts"""
+    return [
+        {'x1': float(b[0]), 'y1': float(b[1]), 'x2': float(b[2]), 'y2': float(b[3]), 'confidence': float(b[4])}
+        for b in arr
+    ]
+
+
+def box_areas(boxes: np.ndarray) -> np.ndarray:
+    """Areas of (N, >=4) boxes, clipped at zero for degenerate boxes"""
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def iou_one_to_many(box: np.ndarray, boxes: np.ndarray, area: Optional[float] = None,
+                    areas: Optional[np.ndarray] = None) -> np.ndarray:
+    """IoU of a single box against (M, >=4) boxes"""
+    if area is None:
+        area = box_areas(box[None, :])[0]
+    if areas is None:
+        areas = box_areas(boxes)
+    iw = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    ih = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    inter = iw * ih
+    union = area + areas - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-12), 0.0)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (N, >=4) and (M, >=4) boxes -> (N, M)"""
+    area_a = box_areas(a)[:, None]
+    area_b = box_areas(b)[None, :]
+    iw = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    ih = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = iw * ih
+    union = area_a + area_b - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-12), 0.0)
+
+
+def _hard_nms_numpy(boxes: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Greedy hard NMS, returns kept indices in descending score order"""
+    order = np.argsort(-boxes[:, 4], kind='stable')
+    sorted_boxes = boxes[order]
+    n = len(order)
+
+    if n <= MATRIX_MAX_BOXES:
+        # Small enough to precompute every pair; the greedy pass is then just row lookups
+        overlaps = iou_matrix(sorted_boxes, sorted_boxes) >= iou_threshold
+        suppressed = np.zeros(n, dtype=bool)
+        keep = []
+        for i in range(n):
+            if suppressed[i]:
+                continue
+            keep.append(i)
+            suppressed |= overlaps[i]
+        return order[np.array(keep, dtype=np.int64)]
+
+    # Large inputs: one vectorized IoU row per kept box
+    areas = box_areas(sorted_boxes)
+    remaining = np.arange(n)
+    keep = []
+    while remaining.size:
+        i = remaining[0]
+        keep.append(i)
+        rest = remaining[1:]
+        ious = iou_one_to_many(sorted_boxes[i], sorted_boxes[rest], areas[i], areas[rest])
+        remaining = rest[ious < iou_threshold]
+    return order[np.array(keep, dtype=np.int64)]
+
+
+def _hard_nms_torch(boxes: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Hard NMS through torchvision.ops, returns kept indices"""
+    t = torch.from_numpy(np.ascontiguousarray(boxes, dtype=np.float32))
+    keep = torchvision.ops.nms(t[:, :4], t[:, 4], float(iou_threshold))
+    return keep.numpy().astype(np.int64)
+
+
+def _soft_nms(boxes: np.ndarray, iou_threshold: float, sigma: float,
+              score_threshold: float, decay: str) -> np.ndarray:
+    """Soft-NMS (Bodla et al.) - decays overlapping scores instead of dropping boxes"""
+    work = boxes.copy()
+    areas = box_areas(work)
+    remaining = np.arange(len(work))
+    kept = []
+    while remaining.size:
+        best = remaining[np.argmax(work[remaining, 4])]
+        kept.append(best)
+        remaining = remaining[remaining != best]
+        if not remaining.size:
+            break
+        ious = iou_one_to_many(work[best], work[remaining], areas[best], areas[remaining])
+        if decay == 'linear':
+            weights = np.where(ious >= iou_threshold, 1.0 - ious, 1.0)
+        else:
+            weights = np.exp(-(ious * ious) / sigma)
+        work[remaining, 4] *= weights
+        remaining = remaining[work[remaining, 4] >= score_threshold]
+    return work[np.array(kept, dtype=np.int64)]
+
+
+def _merge_nms(boxes: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Weighted box merge - each kept box becomes the score-weighted mean of its cluster"""
+    order = np.argsort(-boxes[:, 4], kind='stable')
+    sorted_boxes = boxes[order]
+    areas = box_areas(sorted_boxes)
+    remaining = np.arange(len(sorted_boxes))
+    merged = []
+    while remaining.size:
+        i = remaining[0]
+        ious = iou_one_to_many(sorted_boxes[i], sorted_boxes[remaining], areas[i], areas[remaining])
+        in_cluster = ious >= iou_threshold
+        in_cluster[0] = True
+        cluster = sorted_boxes[remaining[in_cluster]]
+        weights = cluster[:, 4:5]
+        coords = (cluster[:, :4] * weights).sum(axis=0) / max(float(weights.sum()), 1e-12)
+        merged.append(np.concatenate([coords, [cluster[0, 4]]]))
+        remaining = remaining[~in_cluster]
+    return np.array(merged, dtype=np.float64).reshape(-1, 5)
+
+
+def _run_nms(boxes: np.ndarray, iou_threshold: float, method: str, sigma: float,
+             score_threshold: float, soft_decay: str, use_torch: bool) -> np.ndarray:
+    """Dispatch to the selected NMS variant; works in float64 and returns kept boxes by score"""
+    if method == "soft":
+        out = _soft_nms(boxes, iou_threshold, sigma, score_threshold, soft_decay)
+    elif method == "merge":
+        out = _merge_nms(boxes, iou_threshold)
+    else:
+        if use_torch and torchvision is not None:
+            keep = _hard_nms_torch(boxes, iou_threshold)
+        else:
+            keep = _hard_nms_numpy(boxes, iou_threshold)
+        out = boxes[keep]
+    return out[np.argsort(-out[:, 4], kind='stable')]
+
+
+def nms(boxes: np.ndarray, iou_threshold: float = 0.45, method: str = "hard",
+        sigma: float = 0.5, score_threshold: float = 0.001, soft_decay: str = "gaussian",
+        use_torch: bool = True) -> np.ndarray:
+    """
+    Suppress overlapping boxes in an (N, 5) [x1, y1, x2, y2, score] array.
+    Returns the kept (M, 5) boxes sorted by score, highest first.
+    method: 'hard' (classic greedy), 'soft' (score decay) or 'merge' (weighted box merge)
+    """
+    if method not in NMS_METHODS:
+        raise ValueError(f"Unknown NMS method '{method}', expected one of {NMS_METHODS}")
+
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 5)
+    if len(boxes) == 0:
+        return boxes.astype(np.float32)
+    return _run_nms(boxes, iou_threshold, method, sigma, score_threshold, soft_decay, use_torch).astype(np.float32)
+
+
+def batched_nms(boxes: np.ndarray, group_ids: np.ndarray, iou_threshold: float = 0.45,
+                method: str = "hard", sigma: float = 0.5, score_threshold: float = 0.001,
+                soft_decay: str = "gaussian", use_torch: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Run NMS independently per group (e.g. per frame x view) in a single call.
+    Uses torchvision.ops.batched_nms for hard NMS when available.
+    Returns (kept_boxes (M, 5), kept_group_ids (M,)), ordered by group then score.
+    """
+    if method not in NMS_METHODS:
+        raise ValueError(f"Unknown NMS method '{method}', expected one of {NMS_METHODS}")
+
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 5)
+    group_ids = np.asarray(group_ids, dtype=np.int64).reshape(-1)
+    if len(boxes) != len(group_ids):
+        raise ValueError("boxes and group_ids must have the same length")
+    if len(boxes) == 0:
+        return boxes.astype(np.float32), group_ids
+
+    if method == "hard" and use_torch and torchvision is not None:
+        t = torch.from_numpy(boxes.astype(np.float32))
+        keep = torchvision.ops.batched_nms(t[:, :4], t[:, 4], torch.from_numpy(group_ids), float(iou_threshold)).numpy()
+        order = np.lexsort((-boxes[keep, 4], group_ids[keep]))
+        keep = keep[order]
+        return boxes[keep].astype(np.float32), group_ids[keep]
+
+    # Stable sort by group, then run each group's slice through the same kernel
+    order = np.argsort(group_ids, kind='stable')
+    sorted_boxes, sorted_ids = boxes[order], group_ids[order]
+    unique_ids, starts = np.unique(sorted_ids, return_index=True)
+    bounds = list(starts) + [len(sorted_ids)]
+
+    kept_parts, kept_ids = [], []
+    for gi, gid in enumerate(unique_ids):
+        kept = _run_nms(sorted_boxes[bounds[gi]:bounds[gi + 1]], iou_threshold, method,
+                        sigma, score_threshold, soft_decay, use_torch=False)
+        kept_parts.append(kept)
+        kept_ids.append(np.full(len(kept), gid, dtype=np.int64))
+    return np.concatenate(kept_parts).astype(np.float32), np.concatenate(kept_ids)
+
+
+def nms_per_group(groups: List[List[Dict[str, Any]]], iou_threshold: float = 0.45,
+                  method: str = "hard", **kwargs) -> List[List[Dict[str, float]]]:
+    """Batched NMS over lists of player dicts, e.g. [frame0_top, frame0_bottom, frame1_top, ...]"""
+    arrays = [boxes_to_array(g) for g in groups]
+    if not any(len(a) for a in arrays):
+        return [[] for _ in groups]
+    ids = np.concatenate([np.full(len(a), gi, dtype=np.int64) for gi, a in enumerate(arrays)])
+    kept, kept_ids = batched_nms(np.concatenate(arrays), ids, iou_threshold=iou_threshold, method=method, **kwargs)
+    return [array_to_boxes(kept[kept_ids == gi]) for gi in range(len(groups))]
@@ -0,0 +1,138 @@
+"""
+Propagation Pipeline
+Joins the per-frame mask streams of several views (e.g. the two stereo halves)
+by frame index, so frames can be composited and written while SAM 2 is still
+propagating. Only frames some view has produced but another has not reached
+yet are buffered. Views can run concurrently on their own threads, sharing
+the (read-only) model and splitting torch's intra-op threads between them.
+torch's thread count is process-wide, so it is only ever derived from the core
+budget read at import and the number of propagation threads running, never
+from its current value.
+"""
+
+import os
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
+
+import torch
+
+# torch intra-op threads available to propagation, fixed when the server starts
+CORE_BUDGET = int(os.environ.get("PROPAGATION_CORE_BUDGET", 0)) or torch.get_num_threads()
+
+_cores_lock = threading.Lock()
+_sharing = 0  # propagation threads currently splitting CORE_BUDGET
+
+
+def _share_cores(delta: int):
+    """Register a propagation thread starting (+1) or ending (-1) and split the budget between the running ones"""
+    global _sharing
+    with _cores_lock:
+        _sharing += delta
+        torch.set_num_threads(max(1, CORE_BUDGET // max(_sharing, 1)))
+
+
+def join_views(
+    streams: Dict[str, Iterable[Tuple[int, Any]]],
+    num_frames: int,
+    default: Callable[[], Any] = dict
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yield (frame_idx, {view: item}) for frame_idx 0..num_frames-1 in order.
+    Each stream yields (frame_idx, item) in increasing frame order; it is pulled
+    just far enough to cover the current frame, and its items are held in a
+    reorder buffer until every view has reached that frame. Frames a stream
+    skipped (or never reaches, e.g. a view without prompts) get default().
+    """
+    iterators = {name: iter(stream) for name, stream in streams.items()}
+    buffers: Dict[str, Dict[int, Any]] = {name: {} for name in streams}
+    reached = {name: -1 for name in streams}
+
+    try:
+        for frame_idx in range(num_frames):
+            for name in list(iterators):
+                while reached[name] < frame_idx:
+                    try:
+                        item_idx, item = next(iterators[name])
+                    except StopIteration:
+                        del iterators[name]
+                        break
+                    buffers[name][item_idx] = item
+                    reached[name] = max(reached[name], item_idx)
+
+            yield frame_idx, {
+                name: buffers[name].pop(frame_idx) if frame_idx in buffers[name] else default()
+                for name in streams
+            }
+    finally:
+        # Stop any propagation that is still running (early exit or error downstream)
+        for iterator in iterators.values():
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+
+class _StreamError:
+    """Wraps an exception raised by a background stream so the consumer re-raises it"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_DONE = object()
+
+
+def background_stream(stream: Iterable, maxsize: int = 8, name: str = "stream",
+                      share_cores: bool = False) -> Iterator:
+    """
+    Run an iterable on its own thread, handing items over through a bounded queue.
+    The producer runs at most maxsize items ahead of the consumer. Closing the
+    returned generator stops the producer after its current item.
+    share_cores: split CORE_BUDGET with the other sharing producers while this one runs.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def produce():
+        if share_cores:
+            _share_cores(+1)
+        try:
+            for item in stream:
+                while not stop.is_set():
+                    try:
+                        items.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    break
+        except BaseException as e:
+            items.put(_StreamError(e))
+            return
+        finally:
+            close = getattr(stream, "close", None)
+            if close and stop.is_set():
+                close()
+            if share_cores:
+                _share_cores(-1)
+        items.put(_DONE)
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _StreamError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        # Unblock a producer waiting on a full queue, then wait for it to wind down
+        while thread.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
@@ -0,0 +1,216 @@
+"""
+Player Tracker
+Vectorized IoU + constant-velocity Kalman tracker used by keyframe detection:
+detections on keyframes update the tracks, frames in between are filled from
+the Kalman prediction (or interpolated once the next keyframe is known), and
+every box carries a stable per-view track id.
+"""
+
+from typing import List, Dict, Optional, Any
+
+import numpy as np
+
+from backend.nms import iou_matrix, boxes_to_array
+
+# scipy is optional - Hungarian matching when available, greedy otherwise
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# State is [cx, cy, w, h, vx, vy, vw, vh], measurement is [cx, cy, w, h]
+_F = np.eye(8)
+_F[:4, 4:] = np.eye(4)
+_H = np.eye(4, 8)
+
+# Process / measurement noise relative to box height (as in DeepSORT)
+STD_POSITION = 1.0 / 20
+STD_VELOCITY = 1.0 / 160
+
+
+def xyxy_to_cxcywh(boxes: np.ndarray) -> np.ndarray:
+    w = boxes[:, 2] - boxes[:, 0]
+    h = boxes[:, 3] - boxes[:, 1]
+    return np.stack([boxes[:, 0] + w / 2, boxes[:, 1] + h / 2, w, h], axis=1)
+
+
+def cxcywh_to_xyxy(boxes: np.ndarray) -> np.ndarray:
+    half_w, half_h = boxes[:, 2] / 2, boxes[:, 3] / 2
+    return np.stack([boxes[:, 0] - half_w, boxes[:, 1] - half_h, boxes[:, 0] + half_w, boxes[:, 1] + half_h], axis=1)
+
+
+def match_boxes(cost_iou: np.ndarray, iou_threshold: float):
+    """Match rows (tracks) to columns (detections) maximizing IoU; returns (rows, cols)"""
+    if cost_iou.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(-cost_iou)
+    else:
+        # Greedy: best remaining pair first
+        rows, cols = [], []
+        flat = np.argsort(-cost_iou, axis=None)
+        used_r, used_c = set(), set()
+        for f in flat:
+            r, c = divmod(int(f), cost_iou.shape[1])
+            if cost_iou[r, c] < iou_threshold:
+                break
+            if r in used_r or c in used_c:
+                continue
+            used_r.add(r); used_c.add(c)
+            rows.append(r); cols.append(c)
+        rows, cols = np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+    ok = cost_iou[rows, cols] >= iou_threshold
+    return rows[ok], cols[ok]
+
+
+class PlayerTracker:
+    """
+    Tracks player boxes for one stereo view. All tracks are advanced together:
+    state (T, 8), covariance (T, 8, 8).
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 2, score_decay: float = 0.9,
+                 min_score: float = 0.25):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses  # keyframes a track may go unmatched before it is dropped
+        self.score_decay = score_decay  # per predicted frame, of the reported box confidence
+        self.min_score = min_score  # tracks below this detection score don't count towards confidence
+        self.next_id = 1
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.x = np.zeros((0, 8))
+        self.P = np.zeros((0, 8, 8))
+        self.scores = np.zeros(0)  # detection confidence, decays while only predicted
+        self.quality = np.zeros(0)  # IoU of prediction vs detection at the last keyframe
+        self.misses = np.zeros(0, dtype=np.int64)
+        self.age = 0  # frames predicted since the last update
+        self.last_gap = 0  # frames predicted before the last update, the horizon quality was measured at
+        self.retention = 1.0  # share of the live tracks the last update matched again
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __setstate__(self, state):
+        # Trackers in checkpoints written before confidence tracked last_gap / retention
+        self.__dict__.update({"last_gap": 0, "retention": 1.0, **state})
+
+    def _noise(self, heights: np.ndarray, pos_scale: float, vel_scale: Optional[float]) -> np.ndarray:
+        std = np.empty((len(heights), 8 if vel_scale is not None else 4))
+        std[:, :4] = pos_scale * heights[:, None]
+        if vel_scale is not None:
+            std[:, 4:] = vel_scale * heights[:, None]
+        return std ** 2
+
+    def confidence(self) -> float:
+        """
+        How much the current predictions can be trusted: the median expected IoU of
+        the predicted boxes of confident live tracks, times the expected share of
+        tracks still matched (1.0 when there is nothing to track). Both are what the
+        last keyframe observed after last_gap predicted frames, extrapolated to the
+        current horizon assuming the error grows linearly with it. So after as many
+        frames as the last gap confidence equals what was observed, whatever the
+        keyframe interval: well predicted motion keeps it high, erratic motion or
+        lost tracks bring it down and make the next keyframe come early.
+        """
+        live = (self.misses == 0) & (self.scores >= self.min_score * self.score_decay ** self.age)
+        if not live.any():
+            return 1.0
+        horizon = self.age / max(self.last_gap, 1)
+        expected_iou = np.median(np.clip(1.0 - (1.0 - self.quality[live]) * horizon, 0.0, 1.0))
+        return float(expected_iou * max(0.0, 1.0 - (1.0 - self.retention) * horizon))
+
+    def boxes(self) -> List[Dict[str, Any]]:
+        """Current (predicted or updated) boxes of tracks seen at the last keyframe"""
+        live = self.misses == 0
+        xyxy = cxcywh_to_xyxy(self.x[live, :4])
+        return [
+            {"x1": float(b[0]), "y1": float(b[1]), "x2": float(b[2]), "y2": float(b[3]),
+             "confidence": float(s), "track_id": int(t)}
+            for b, s, t in zip(xyxy, self.scores[live], self.ids[live])
+        ]
+
+    def predict(self) -> List[Dict[str, Any]]:
+        """Advance every track by one frame and return the predicted boxes"""
+        if len(self):
+            self.x = self.x @ _F.T
+            Q = self._noise(np.abs(self.x[:, 3]), STD_POSITION, STD_VELOCITY)
+            self.P = _F @ self.P @ _F.T + Q[:, :, None] * np.eye(8)
+            # Keep widths/heights positive if a velocity overshoots
+            self.x[:, 2:4] = np.maximum(self.x[:, 2:4], 1.0)
+            self.scores = self.scores * self.score_decay
+            self.age += 1
+        return self.boxes()
+
+    def update(self, players: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Correct the tracks with a keyframe's detections (already predicted to this frame).
+        Returns the detections annotated with track_id, in their input order.
+        """
+        dets = boxes_to_array(players).astype(np.float64)
+        track_boxes = cxcywh_to_xyxy(self.x[:, :4]) if len(self) else np.zeros((0, 4))
+        rows, cols = match_boxes(iou_matrix(track_boxes, dets), self.iou_threshold)
+
+        if len(rows):
+            z = xyxy_to_cxcywh(dets[cols, :4])
+            P = self.P[rows]
+            R = self._noise(np.abs(z[:, 3]), STD_POSITION, None)[:, :, None] * np.eye(4)
+            S = _H @ P @ _H.T + R
+            K = P @ _H.T @ np.linalg.inv(S)
+            innovation = z - self.x[rows] @ _H.T
+            self.x[rows] = self.x[rows] + np.einsum('tij,tj->ti', K, innovation)
+            self.P[rows] = (np.eye(8) - K @ _H) @ P
+            self.scores[rows] = dets[cols, 4]
+            self.quality[rows] = iou_matrix(track_boxes[rows], dets[cols, :4]).diagonal()
+
+        self.last_gap, self.age = self.age, 0
+        missed = np.ones(len(self), dtype=bool)
+        missed[rows] = False
+        previously_live = int((self.misses == 0).sum())
+        self.retention = float((self.misses[rows] == 0).sum()) / previously_live if previously_live else 1.0
+        self.misses[missed] += 1
+        self.misses[rows] = 0
+
+        # Unmatched detections start new tracks
+        new = np.setdiff1d(np.arange(len(dets)), cols)
+        if len(new):
+            z = xyxy_to_cxcywh(dets[new, :4])
+            x = np.concatenate([z, np.zeros_like(z)], axis=1)
+            P = self._noise(np.abs(z[:, 3]), 2 * STD_POSITION, 10 * STD_VELOCITY)[:, :, None] * np.eye(8)
+            new_ids = np.arange(self.next_id, self.next_id + len(new))
+            self.next_id += len(new)
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.x = np.concatenate([self.x, x])
+            self.P = np.concatenate([self.P, P])
+            self.scores = np.concatenate([self.scores, dets[new, 4]])
+            self.quality = np.concatenate([self.quality, np.ones(len(new))])
+            self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype=np.int64)])
+
+        det_ids = np.zeros(len(dets), dtype=np.int64)
+        det_ids[cols] = self.ids[rows]
+        det_ids[new] = self.ids[len(self.ids) - len(new):]
+
+        # Drop tracks that have been missing for too long
+        alive = self.misses <= self.max_misses
+        if not alive.all():
+            self.ids, self.x, self.P = self.ids[alive], self.x[alive], self.P[alive]
+            self.scores, self.quality, self.misses = self.scores[alive], self.quality[alive], self.misses[alive]
+
+        return [{**p, "track_id": int(t)} for p, t in zip(players, det_ids)]
+
+
+def interpolate_gap(gap: List[List[Dict[str, Any]]], start: List[Dict[str, Any]], end: List[Dict[str, Any]]):
+    """
+    Replace predicted boxes of frames between two keyframes with a linear
+    interpolation for every track id present at both keyframes (in place).
+    gap: per-frame player lists between the keyframes, in order.
+    """
+    start_by_id = {p["track_id"]: p for p in start}
+    end_by_id = {p["track_id"]: p for p in end}
+    n = len(gap)
+    for k, players in enumerate(gap):
+        t = (k + 1) / (n + 1)
+        for p in players:
+            a, b = start_by_id.get(p["track_id"]), end_by_id.get(p["track_id"])
+            if a is None or b is None:
+                continue
+            for key in ("x1", "y1", "x2", "y2"):
+                p[key] = a[key] + (b[key] - a[key]) * t
@@ -0,0 +1,391 @@
+"""
+Upload Store
+Chunked, resumable uploads. A session splits a file into fixed-size parts
+that can be sent in any order and in parallel; every part is streamed straight
+to its offset in a preallocated file and only counted once complete, so an
+interrupted upload resumes by re-sending the missing parts. The file's SHA-256
+is kept running as the bytes are written: the part next in order feeds it while
+it streams in, and only parts that arrived ahead of it are read back once the
+gap before them closes, so completing the session just moves the file into the
+upload directory. Content hashes are kept in a sidecar index so later stages
+can key caches on them.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Any, BinaryIO, Callable, Optional
+
+# Bytes read/written per I/O call
+CHUNK_SIZE = 8 * 1024 * 1024
+# Default part size for chunked uploads
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+MAX_PART_SIZE = 1024 * 1024 * 1024
+# Incomplete sessions untouched for this long are removed
+SESSION_TTL_SECONDS = 7 * 24 * 3600
+
+_index_lock = threading.Lock()
+_session_locks: Dict[str, threading.Lock] = {}
+
+
+class UploadError(Exception):
+    """Invalid upload request; status_code is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def safe_filename(filename: str) -> str:
+    """Strip any directory components from a client supplied name"""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if not name or name in (".", ".."):
+        raise UploadError("Invalid filename")
+    return name
+
+
+class UploadStore:
+    """
+    Upload sessions under <upload_dir>/.partial/<upload_id>/ and the content
+    hash index at <upload_dir>/.meta/hashes.json
+    """
+
+    def __init__(self, upload_dir: Path):
+        self.upload_dir = Path(upload_dir)
+        self.partial_dir = self.upload_dir / ".partial"
+        self.meta_dir = self.upload_dir / ".meta"
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self.meta_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.meta_dir / "hashes.json"
+        # upload_id -> running hash of the session; in memory only, after a restart
+        # complete() hashes the file from the start
+        self._hashes: Dict[str, _RunningHash] = {}
+
+    # --- single request uploads ---
+
+    def write_stream(self, filename: str, source: BinaryIO) -> Dict[str, Any]:
+        """Copy a file object into the upload dir in large chunks, hashing as it goes (blocking)"""
+        filename = safe_filename(filename)
+        target = self.upload_dir / filename
+        tmp = self.upload_dir / f".{filename}.{uuid.uuid4().hex}.tmp"
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with tmp.open("wb") as out:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp, target)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        sha256 = digest.hexdigest()
+        self.record_hash(filename, sha256, size)
+        return {"filename": filename, "size": size, "sha256": sha256}
+
+    # --- chunked sessions ---
+
+    def _session_dir(self, upload_id: str) -> Path:
+        if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadError("Invalid upload id")
+        path = self.partial_dir / upload_id
+        if not path.is_dir():
+            raise UploadError("Upload not found", status_code=404)
+        return path
+
+    def _lock(self, upload_id: str) -> threading.Lock:
+        with _index_lock:
+            return _session_locks.setdefault(upload_id, threading.Lock())
+
+    def _read_session(self, session_dir: Path) -> Dict[str, Any]:
+        with (session_dir / "session.json").open() as f:
+            return json.load(f)
+
+    def create_session(self, filename: str, size: int, part_size: Optional[int] = None) -> Dict[str, Any]:
+        """Start a chunked upload; returns the session description"""
+        filename = safe_filename(filename)
+        try:
+            size = int(size)
+            part_size = int(part_size or DEFAULT_PART_SIZE)
+        except (TypeError, ValueError):
+            raise UploadError("size and part_size must be integers")
+        if size < 0:
+            raise UploadError("size must not be negative")
+        if part_size <= 0 or part_size > MAX_PART_SIZE:
+            raise UploadError(f"part_size must be between 1 and {MAX_PART_SIZE}")
+        self.cleanup_stale()
+
+        upload_id = uuid.uuid4().hex
+        session_dir = self.partial_dir / upload_id
+        session_dir.mkdir()
+        session = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "size": size,
+            "part_size": part_size,
+            "parts": max(1, (size + part_size - 1) // part_size),
+            "created_at": time.time()
+        }
+        # Parts are written in place, so the file is the finished upload once all have arrived
+        with (session_dir / "data.bin").open("wb") as f:
+            f.truncate(size)
+        with (session_dir / "session.json").open("w") as f:
+            json.dump(session, f)
+        return self.status(upload_id)
+
+    def expected_part_size(self, session: Dict[str, Any], index: int) -> int:
+        if index < 0 or index >= session["parts"]:
+            raise UploadError(f"Part index must be between 0 and {session['parts'] - 1}")
+        if index == session["parts"] - 1:
+            return session["size"] - index * session["part_size"]
+        return session["part_size"]
+
+    def status(self, upload_id: str) -> Dict[str, Any]:
+        """Session info plus the parts already received (for resuming)"""
+        session_dir = self._session_dir(upload_id)
+        session = self._read_session(session_dir)
+        received = sorted(int(p.stem.split("_")[1]) for p in session_dir.glob("part_*.done"))
+        received_set = set(received)
+        return {
+            **session,
+            "received_parts": received,
+            "missing_parts": [i for i in range(session["parts"]) if i not in received_set],
+            "received_bytes": sum(self.expected_part_size(session, i) for i in received)
+        }
+
+    def open_part(self, upload_id: str, index: int) -> "PartWriter":
+        """Writer for one part; the part only counts once PartWriter.commit() succeeds"""
+        session_dir = self._session_dir(upload_id)
+        session = self._read_session(session_dir)
+        expected = self.expected_part_size(session, index)
+        with self._lock(upload_id):
+            running = self._hashes.setdefault(upload_id, _RunningHash())
+            marker = session_dir / f"part_{index}.done"
+            if marker.exists():
+                # Re-sent part: its bytes are about to be overwritten, so it no longer counts
+                # and a running hash that already covers it has to start over
+                marker.unlink()
+                if running.next > index:
+                    running.reset()
+            writer = PartWriter(session_dir / "data.bin", index * session["part_size"], expected,
+                                lambda w: self._part_committed(upload_id, session_dir, session, index, w))
+            running.writers[index] = writer
+            if running.next == index:
+                writer.running = running.digest.copy()
+        return writer
+
+    def _part_committed(self, upload_id: str, session_dir: Path, session: Dict[str, Any], index: int,
+                        writer: "PartWriter"):
+        with self._lock(upload_id):
+            (session_dir / f"part_{index}.done").touch()
+            running = self._hashes.setdefault(upload_id, _RunningHash())
+            if running.writers.get(index) is writer:
+                del running.writers[index]
+                if running.next == index and writer.running is not None:
+                    # The part was hashed as it streamed in
+                    running.digest, running.next = writer.running, index + 1
+            self._advance_hash(running, session_dir, session)
+
+    def _advance_hash(self, running: "_RunningHash", session_dir: Path, session: Dict[str, Any]) -> Any:
+        """
+        Extend the running hash over received parts that follow it (read back, they came
+        early), then hand it to the writer of the next part if one is streaming (call with
+        the session lock). Writers that were dropped stay registered until the part is
+        sent again; adopt() ignores them.
+        """
+        with (session_dir / "data.bin").open("rb") as f:
+            while running.next < session["parts"]:
+                if not (session_dir / f"part_{running.next}.done").exists():
+                    writer = running.writers.get(running.next)
+                    if writer is not None:
+                        writer.adopt(running.digest.copy())
+                    break
+                f.seek(running.next * session["part_size"])
+                _hash_bytes(f, self.expected_part_size(session, running.next), running.digest)
+                running.next += 1
+        return running.digest
+
+    def complete(self, upload_id: str) -> Dict[str, Any]:
+        """Move the finished file into the upload dir, hashing the parts the running hash misses (blocking)"""
+        with self._lock(upload_id):
+            status = self.status(upload_id)
+            if status["missing_parts"]:
+                raise UploadError(f"Missing parts: {status['missing_parts'][:20]}", status_code=409)
+
+            session_dir = self.partial_dir / upload_id
+            filename = status["filename"]
+            running = self._hashes.setdefault(upload_id, _RunningHash())
+            digest = self._advance_hash(running, session_dir, status)
+            os.replace(session_dir / "data.bin", self.upload_dir / filename)
+            shutil.rmtree(session_dir, ignore_errors=True)
+            self._hashes.pop(upload_id, None)
+
+        with _index_lock:
+            _session_locks.pop(upload_id, None)
+        sha256 = digest.hexdigest()
+        self.record_hash(filename, sha256, status["size"])
+        return {"filename": filename, "size": status["size"], "sha256": sha256}
+
+    def abort(self, upload_id: str):
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+        self._hashes.pop(upload_id, None)
+        with _index_lock:
+            _session_locks.pop(upload_id, None)
+
+    def cleanup_stale(self):
+        """Remove sessions nobody has touched for SESSION_TTL_SECONDS"""
+        cutoff = time.time() - SESSION_TTL_SECONDS
+        for session_dir in self.partial_dir.iterdir():
+            try:
+                if session_dir.is_dir() and max(p.stat().st_mtime for p in [session_dir, *session_dir.iterdir()]) < cutoff:
+                    shutil.rmtree(session_dir, ignore_errors=True)
+            except (OSError, ValueError):
+                continue
+
+    # --- content hashes ---
+
+    def _load_index(self) -> Dict[str, Any]:
+        if not self.index_path.exists():
+            return {}
+        try:
+            with self.index_path.open() as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def record_hash(self, filename: str, sha256: str, size: int):
+        path = self.upload_dir / filename
+        with _index_lock:
+            index = self._load_index()
+            index[filename] = {"sha256": sha256, "size": size, "mtime": path.stat().st_mtime}
+            tmp = self.index_path.with_suffix(".tmp")
+            with tmp.open("w") as f:
+                json.dump(index, f)
+            os.replace(tmp, self.index_path)
+
+    def content_hash(self, filename: str) -> Optional[str]:
+        """SHA-256 of an uploaded file; hashed (and recorded) now if it predates the index"""
+        path = self.upload_dir / filename
+        if not path.exists():
+            return None
+        stat = path.stat()
+        with _index_lock:
+            entry = self._load_index().get(filename)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+            return entry["sha256"]
+
+        digest = hashlib.sha256()
+        with path.open("rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        self.record_hash(filename, sha256, stat.st_size)
+        return sha256
+
+    def forget(self, filename: str):
+        with _index_lock:
+            index = self._load_index()
+            if index.pop(filename, None) is not None:
+                with self.index_path.open("w") as f:
+                    json.dump(index, f)
+
+
+def _hash_bytes(f: BinaryIO, length: int, digest: Any):
+    """Feed the next length bytes of f into digest"""
+    while length > 0:
+        chunk = f.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            raise UploadError("Upload data is truncated", status_code=500)
+        digest.update(chunk)
+        length -= len(chunk)
+
+
+class _RunningHash:
+    """SHA-256 of a session's parts before `next`, and the writers of parts still streaming in"""
+
+    def __init__(self):
+        self.next = 0
+        self.digest = hashlib.sha256()
+        self.writers: Dict[int, "PartWriter"] = {}
+
+    def reset(self):
+        self.next = 0
+        self.digest = hashlib.sha256()
+        # Writers hashing on top of the old digest would carry it on
+        for writer in self.writers.values():
+            writer.running = None
+
+
+class PartWriter:
+    """
+    Streams one part to its offset in the session's data file; commit() checks
+    the size and checksum and only then marks the part as received. When the
+    part is next in order, running (the session's hash so far) is fed the same
+    bytes, so it needs no second pass.
+    """
+
+    def __init__(self, data_path: Path, offset: int, expected_size: int, on_commit: Callable[["PartWriter"], None]):
+        self.data_path = Path(data_path)
+        self.offset = offset
+        self.expected_size = expected_size
+        self.on_commit = on_commit
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.running = None
+        self._lock = threading.Lock()
+        self.file = self.data_path.open("r+b")
+        self.file.seek(offset)
+
+    def write(self, data: bytes):
+        with self._lock:
+            if self.size + len(data) > self.expected_size:
+                raise UploadError(f"Part larger than expected {self.expected_size} bytes")
+            self.size += len(data)
+            self.digest.update(data)
+            self.file.write(data)
+            if self.running is not None:
+                self.running.update(data)
+
+    def adopt(self, running: Any):
+        """Take over the session's hash mid-part: catch up on the bytes written so far, then stream"""
+        with self._lock:
+            if self.file.closed:
+                # Dropped, or committing: a committed part is read back instead
+                return
+            self.file.flush()
+            with self.data_path.open("rb") as f:
+                f.seek(self.offset)
+                _hash_bytes(f, self.size, running)
+            self.running = running
+
+    def _close(self):
+        with self._lock:
+            if not self.file.closed:
+                self.file.close()
+
+    def commit(self, sha256: Optional[str] = None) -> Dict[str, Any]:
+        self._close()
+        if self.size != self.expected_size:
+            self.discard()
+            raise UploadError(f"Part is {self.size} bytes, expected {self.expected_size}")
+        if sha256 and sha256.lower() != self.digest.hexdigest():
+            self.discard()
+            raise UploadError("Part checksum mismatch", status_code=422)
+        self.on_commit(self)
+        return {"size": self.size, "sha256": self.digest.hexdigest()}
+
+    def discard(self):
+        """Drop the part; whatever it wrote is overwritten when it is sent again"""
+        self._close()
@@ -0,0 +1,218 @@
+"""
+Threaded Video Decoder
+Decodes frames on a background thread into a bounded prefetch queue so decoding
+the next frames overlaps inference on the current one. Backends: OpenCV
+(always available) and PyAV (optional, multithreaded codec).
+"""
+
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# PyAV is optional - only needed for the 'pyav' backend
+try:
+    import av
+except ImportError:
+    av = None
+
+# Backend used when callers don't ask for one ('opencv' or 'pyav')
+DEFAULT_BACKEND = os.environ.get("VIDEO_DECODER_BACKEND", "opencv")
+DEFAULT_PREFETCH = 8
+
+_END = object()  # queue sentinel
+
+
+class OpenCVBackend:
+    """cv2.VideoCapture reader"""
+
+    name = "opencv"
+
+    def __init__(self, path: Path, threads: int = 0):
+        self.cap = cv2.VideoCapture(str(path))
+        if not self.cap.isOpened():
+            raise IOError(f"Failed to open video: {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def frames(self, start: int, end: Optional[int], stride: int) -> Iterator[Tuple[int, np.ndarray]]:
+        if start > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        idx = start
+        while end is None or idx < end:
+            if (idx - start) % stride:
+                # Skipped frames only need demuxing, not a full decode + colour convert
+                if not self.cap.grab():
+                    break
+            else:
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                yield idx, frame
+            idx += 1
+
+    def close(self):
+        self.cap.release()
+
+
+class PyAVBackend:
+    """PyAV (FFmpeg) reader with codec-level frame/slice threading"""
+
+    name = "pyav"
+
+    def __init__(self, path: Path, threads: int = 0):
+        if av is None:
+            raise RuntimeError("PyAV is not installed")
+        self.container = av.open(str(path))
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        if threads:
+            self.stream.codec_context.thread_count = threads
+        rate = self.stream.average_rate or self.stream.guessed_rate
+        self.fps = float(rate) if rate else 30.0
+        self.width = self.stream.codec_context.width
+        self.height = self.stream.codec_context.height
+        self.frame_count = int(self.stream.frames or 0)
+
+    def frames(self, start: int, end: Optional[int], stride: int) -> Iterator[Tuple[int, np.ndarray]]:
+        if start > 0 and self.stream.time_base:
+            # Seek to the keyframe before start, then decode forward to it
+            target = int(start / self.fps / self.stream.time_base)
+            self.container.seek(target, stream=self.stream, backward=True, any_frame=False)
+        idx = None
+        for frame in self.container.decode(self.stream):
+            if idx is None:
+                # Frame index of the first decoded frame after a (possible) seek
+                idx = int(round(float(frame.time or 0) * self.fps)) if start > 0 else 0
+            if end is not None and idx >= end:
+                break
+            if idx >= start and (idx - start) % stride == 0:
+                yield idx, frame.to_ndarray(format="bgr24")
+            idx += 1
+
+    def close(self):
+        self.container.close()
+
+
+BACKENDS = {
+    "opencv": OpenCVBackend,
+    "pyav": PyAVBackend,
+}
+
+
+class VideoDecoder:
+    """
+    Iterates (frame_idx, BGR frame) over [start, end) every stride frames.
+    A producer thread decodes ahead into a queue of at most `prefetch` frames.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        backend: Optional[str] = None,
+        start: int = 0,
+        end: Optional[int] = None,
+        stride: int = 1,
+        prefetch: int = DEFAULT_PREFETCH,
+        threads: int = 0
+    ):
+        backend = backend or DEFAULT_BACKEND
+        if backend == "pyav" and av is None:
+            print("PyAV not installed, falling back to OpenCV decoder")
+            backend = "opencv"
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown decoder backend '{backend}'")
+
+        self.reader = BACKENDS[backend](path, threads=threads)
+        self.backend = backend
+        self.fps = self.reader.fps
+        self.width = self.reader.width
+        self.height = self.reader.height
+        self.frame_count = self.reader.frame_count
+        self.start = max(0, start)
+        self.end = end
+        self.stride = max(1, stride)
+
+        self._queue = queue.Queue(maxsize=max(1, prefetch))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        """Number of frames this decoder will yield, per the container's frame count"""
+        end = self.frame_count if self.end is None else min(self.end, self.frame_count)
+        return max(0, (end - self.start + self.stride - 1) // self.stride)
+
+    def _produce(self):
+        try:
+            for item in self.reader.frames(self.start, self.end, self.stride):
+                while not self._stop.is_set():
+                    try:
+                        self._queue.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if self._stop.is_set():
+                    return
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            self._queue.put(_END)
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        if self._thread is not None:
+            raise RuntimeError("VideoDecoder can only be iterated once")
+        self._thread = threading.Thread(target=self._produce, name="video-decoder", daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the producer and release the underlying reader"""
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            # Drain so a producer blocked on a full queue can see the stop flag
+            while self._thread.is_alive():
+                try:
+                    self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self._thread.join()
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_video(path: Path, **kwargs) -> VideoDecoder:
+    """Open a video for threaded, prefetched decoding"""
+    return VideoDecoder(path, **kwargs)
+
+
+def read_frame(path: Path, index: int = 0, backend: Optional[str] = None) -> Optional[np.ndarray]:
+    """Decode a single frame, or None if it can't be read"""
+    try:
+        with VideoDecoder(path, backend=backend, start=index, end=index + 1, prefetch=1) as decoder:
+            for _, frame in decoder:
+                return frame
+    except IOError:
+        return None
+    return None
@@ -0,0 +1,158 @@
+"""
+Video Encoder
+Writes rendered BGR frames to an MP4. Backends: an ffmpeg subprocess fed raw
+frames over a pipe (multithreaded libx264 with preset/CRF control and a
+faststart MP4), and cv2.VideoWriter with the mp4v fourcc as the fallback.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import cv2
+import numpy as np
+
+# Backend used when callers don't ask for one ('ffmpeg', 'opencv' or 'auto')
+DEFAULT_BACKEND = os.environ.get("VIDEO_ENCODER_BACKEND", "auto")
+FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
+
+# libx264 settings: lower CRF = higher quality / bigger file, slower preset = smaller file
+DEFAULT_PRESET = os.environ.get("VIDEO_ENCODER_PRESET", "veryfast")
+DEFAULT_CRF = int(os.environ.get("VIDEO_ENCODER_CRF", "23"))
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which(FFMPEG_BIN) is not None
+
+
+class OpenCVWriter:
+    """cv2.VideoWriter with the mp4v fourcc (single-threaded, no tuning)"""
+
+    name = "opencv"
+
+    def __init__(self, path: Path, fps: float, width: int, height: int, **settings):
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self.writer = cv2.VideoWriter(str(path), fourcc, fps, (width, height))
+        if not self.writer.isOpened():
+            raise IOError(f"Failed to open video writer: {path}")
+
+    def write(self, frame: np.ndarray):
+        self.writer.write(frame)
+
+    def close(self):
+        self.writer.release()
+
+
+class FFmpegWriter:
+    """
+    Streams raw BGR frames into an ffmpeg process encoding H.264.
+    Encoding runs in ffmpeg's own threads, overlapping with rendering.
+    """
+
+    name = "ffmpeg"
+
+    def __init__(self, path: Path, fps: float, width: int, height: int,
+                 preset: str = DEFAULT_PRESET, crf: int = DEFAULT_CRF, threads: int = 0):
+        if not ffmpeg_available():
+            raise RuntimeError("ffmpeg is not installed")
+        self.path = Path(path)
+        self.frame_shape = (height, width, 3)
+        command = [
+            FFMPEG_BIN, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps}",
+            "-i", "-", "-an",
+        ]
+        if width % 2 or height % 2:
+            # yuv420p needs even dimensions
+            command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        command += [
+            "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-threads", str(threads),
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            str(self.path),
+        ]
+        # ffmpeg errors go to a temp file so a full stderr pipe can never block it
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+
+    def write(self, frame: np.ndarray):
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match encoder {self.frame_shape}")
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            self._check()
+            raise
+
+    def _check(self):
+        returncode = self.process.wait()
+        if returncode != 0:
+            self._stderr.seek(0)
+            message = self._stderr.read().decode(errors="replace").strip()
+            raise RuntimeError(f"ffmpeg exited with code {returncode}: {message}")
+
+    def close(self):
+        if self.process.stdin and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        try:
+            self._check()
+        finally:
+            self._stderr.close()
+
+
+BACKENDS = {
+    "ffmpeg": FFmpegWriter,
+    "opencv": OpenCVWriter,
+}
+
+
+class VideoEncoder:
+    """
+    Frame sink for rendered videos: write(frame) then release().
+    backend: 'ffmpeg', 'opencv' or 'auto' (ffmpeg when installed).
+    Extra settings (preset, crf, threads) are passed to the ffmpeg backend.
+    """
+
+    def __init__(self, path: Path, fps: float, width: int, height: int,
+                 backend: Optional[str] = None, **settings):
+        backend = backend or DEFAULT_BACKEND
+        if backend == "auto":
+            backend = "ffmpeg" if ffmpeg_available() else "opencv"
+        elif backend == "ffmpeg" and not ffmpeg_available():
+            print("ffmpeg not installed, falling back to OpenCV encoder")
+            backend = "opencv"
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown encoder backend '{backend}'")
+
+        # Replace rather than overwrite in place: a previous output may be hard-linked from the artifact cache
+        if Path(path).exists():
+            Path(path).unlink()
+        self.writer = BACKENDS[backend](path, fps, width, height, **settings)
+        self.backend = backend
+        self.frames_written = 0
+
+    def write(self, frame: np.ndarray):
+        self.writer.write(frame)
+        self.frames_written += 1
+
+    def release(self):
+        """Flush and finalize the file"""
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def open_writer(path: Path, fps: float, width: int, height: int, **kwargs) -> VideoEncoder:
+    """Open an encoder for a rendered video"""
+    return VideoEncoder(path, fps, width, height, **kwargs)
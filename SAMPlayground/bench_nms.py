@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: legacy pure-Python apply_nms vs the array-backed NMS engine
+
+Run from the SAMPlayground root:
+    python bench_nms.py
+    python bench_nms.py --sizes 100 1000 --repeats 10
+"""
+import argparse
+import time
+
+import numpy as np
+
+from backend import nms
+
+
+def legacy_apply_nms(boxes, iou_threshold=0.45):
+    """The original list-of-dicts O(n^2) implementation, kept here as the baseline"""
+    if not boxes:
+        return []
+    boxes = sorted(boxes, key=lambda x: x['confidence'], reverse=True)
+    keep = []
+    while boxes:
+        best = boxes.pop(0)
+        keep.append(best)
+        remaining = []
+        for box in boxes:
+            ix1 = max(best['x1'], box['x1'])
+            iy1 = max(best['y1'], box['y1'])
+            ix2 = min(best['x2'], box['x2'])
+            iy2 = min(best['y2'], box['y2'])
+            inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+            area1 = (best['x2'] - best['x1']) * (best['y2'] - best['y1'])
+            area2 = (box['x2'] - box['x1']) * (box['y2'] - box['y1'])
+            union = area1 + area2 - inter
+            iou = inter / union if union > 0 else 0
+            if iou < iou_threshold:
+                remaining.append(box)
+        boxes = remaining
+    return keep
+
+
+def make_boxes(n, rng, width=3840, height=1080):
+    """Player-sized boxes clustered around a few hundred 'players', like overlapping grid bands produce"""
+    players = max(1, n // 8)
+    centers = np.stack([rng.uniform(0, width, players), rng.uniform(0, height, players)], axis=1)
+    idx = rng.integers(0, players, n)
+    jitter = rng.normal(0, 4, (n, 2))
+    cx, cy = (centers[idx] + jitter).T
+    w = rng.uniform(20, 40, n)
+    h = rng.uniform(50, 90, n)
+    conf = rng.uniform(0.05, 1.0, n)
+    return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2, conf], axis=1).astype(np.float32)
+
+
+def timeit(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--groups', type=int, default=60, help="frames x views for the batched run")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"torchvision available: {nms.torchvision is not None}")
+    print(f"{'boxes':>7} {'legacy':>10} {'numpy':>10} {'torch':>10} {'soft':>10} {'merge':>10} {'speedup':>8}")
+
+    for n in args.sizes:
+        arr = make_boxes(n, rng)
+        dicts = nms.array_to_boxes(arr)
+
+        # The legacy loop is quadratic in Python, don't repeat it at large sizes
+        legacy_t = timeit(lambda: legacy_apply_nms(dicts), 1 if n > 1000 else args.repeats)
+        numpy_t = timeit(lambda: nms.nms(arr, method="hard", use_torch=False), args.repeats)
+        torch_t = timeit(lambda: nms.nms(arr, method="hard"), args.repeats) if nms.torchvision is not None else float('nan')
+        soft_t = timeit(lambda: nms.nms(arr, method="soft"), args.repeats)
+        merge_t = timeit(lambda: nms.nms(arr, method="merge"), args.repeats)
+
+        assert len(legacy_apply_nms(dicts)) == len(nms.nms(arr, use_torch=False)), "kept counts differ"
+        fastest = min(t for t in (numpy_t, torch_t) if t == t)
+        print(f"{n:>7} {legacy_t * 1e3:>9.2f}ms {numpy_t * 1e3:>9.2f}ms {torch_t * 1e3:>9.2f}ms "
+              f"{soft_t * 1e3:>9.2f}ms {merge_t * 1e3:>9.2f}ms {legacy_t / fastest:>7.1f}x")
+
+    # Many frames x both views: one batched call against a per-group loop
+    per_group = 200
+    groups = [make_boxes(per_group, rng) for _ in range(args.groups)]
+    flat = np.concatenate(groups)
+    ids = np.repeat(np.arange(args.groups), per_group)
+    loop_t = timeit(lambda: [legacy_apply_nms(nms.array_to_boxes(g)) for g in groups], 1)
+    batched_t = timeit(lambda: nms.batched_nms(flat, ids, use_torch=False), args.repeats)
+    print(f"\nbatched: {args.groups} groups x {per_group} boxes  legacy loop {loop_t * 1e3:.1f}ms  "
+          f"batched_nms {batched_t * 1e3:.1f}ms  ({loop_t / batched_t:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
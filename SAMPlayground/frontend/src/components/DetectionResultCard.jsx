@@ -1,8 +1,35 @@
-import React from 'react'
+import React, { useState } from 'react'
 import './SequentialResults.css' // Reusing existing styles for now
 
+// Frames fetched per page of the full clip preview
+const PREVIEW_FRAMES = 30
+
 function DetectionResultCard({ entry, boundsEntry, duration }) {
     const method = entry.data.method || 'Unknown'
+    const [preview, setPreview] = useState(null)
+    const [previewError, setPreviewError] = useState(null)
+    const [fullData, setFullData] = useState(null) // Whole entry data, when the timeline only sent a summary
+
+    // The experiment's timeline carries summaries; fields listed in entry.omitted are fetched per entry
+    const data = fullData || entry.data
+    const playersOmitted = !fullData && (entry.omitted || []).some(k => k === 'top_players' || k === 'bottom_players')
+
+    const loadFullData = async () => {
+        if (fullData || !(entry.omitted || []).length) return fullData || entry.data
+        const response = await fetch(`http://localhost:8000/experiments/${entry.experiment_id}/timeline/${entry.id}`)
+        if (!response.ok) throw new Error(`Fetch failed: ${response.status}`)
+        const full = (await response.json()).data
+        setFullData(full)
+        return full
+    }
+
+    const handleShowPlayers = async () => {
+        try {
+            await loadFullData()
+        } catch (error) {
+            console.error('Failed to load players:', error)
+        }
+    }
     const isFOP = method.toLowerCase().includes('fop')
     const isFull = method.toLowerCase().includes('full')
 
@@ -36,6 +63,7 @@ function DetectionResultCard({ entry, boundsEntry, duration }) {
 
         // Case 2: Single frame detection (Generate from data)
         try {
+            const full = await loadFullData()
             const transformPlayer = (p) => ({
                 centerX: Math.round((p.x1 + p.x2) / 2),
                 centerY: Math.round((p.y1 + p.y2) / 2),
@@ -44,7 +72,7 @@ function DetectionResultCard({ entry, boundsEntry, duration }) {
                 confidence: parseFloat((p.confidence || 0).toFixed(4))
             })
 
-            const data = {
+            const payload = {
                 timestamp: entry.timestamp,
                 method: entry.data.method,
                 fop_corners: {
@@ -54,12 +82,12 @@ function DetectionResultCard({ entry, boundsEntry, duration }) {
                 frame: {
                     videoTimestamp: entry.data.video_timestamp ?? 0.0,
                     frameNumber: entry.data.frame_number ?? 0,
-                    left_view: (entry.data.top_players || []).map(transformPlayer),
-                    right_view: (entry.data.bottom_players || []).map(transformPlayer)
+                    left_view: (full.top_players || []).map(transformPlayer),
+                    right_view: (full.bottom_players || []).map(transformPlayer)
                 }
             }
 
-            const blob = new Blob([JSON.stringify(data, null, 2)], { type: 'application/json' })
+            const blob = new Blob([JSON.stringify(payload, null, 2)], { type: 'application/json' })
             const url = URL.createObjectURL(blob)
             const a = document.createElement('a')
             a.href = url
@@ -75,6 +103,21 @@ function DetectionResultCard({ entry, boundsEntry, duration }) {
     }
     const isFullClip = entry.step_type === 'full_clip_detection_completed'
 
+    // Only a window of frames is fetched from the columnar result, never the whole clip
+    const loadPreview = async (startFrame) => {
+        const params = new URLSearchParams({ max_frames: PREVIEW_FRAMES })
+        if (startFrame !== undefined && startFrame !== null) params.set('start_frame', startFrame)
+        try {
+            const response = await fetch(`${entry.data.query_url}?${params}`)
+            if (!response.ok) throw new Error(`Fetch failed: ${response.status}`)
+            setPreview(await response.json())
+            setPreviewError(null)
+        } catch (error) {
+            console.error('Failed to load detections:', error)
+            setPreviewError(error.message)
+        }
+    }
+
     return (
         <div className={`result-entry ${isFullClip ? 'detection-entry full-clip-entry' : 'players-entry'}`}>
             <div className="entry-header" style={{ flexDirection: 'column', alignItems: 'center', gap: '0.25rem', padding: '0.5rem' }}>
@@ -107,7 +150,7 @@ function DetectionResultCard({ entry, boundsEntry, duration }) {
                     <button
                         className="download-json-btn"
                         onClick={handleDownloadJSON}
-                        title="Download detection data as JSON"
+                        title={isFullClip ? "Download detection results" : "Download detection data as JSON"}
                         style={{
                             marginLeft: 'auto',
                             background: '#28a745',
@@ -133,11 +176,42 @@ function DetectionResultCard({ entry, boundsEntry, duration }) {
             </div>
             <div className="entry-content">
                 {isFullClip ? (
-                    <div className="summary-stats" style={{ display: 'flex', gap: '8px', flexWrap: 'wrap', marginBottom: '12px', justifyContent: 'center' }}>
-                        <span className="stat-pill" style={{ padding: '2px 8px', background: 'rgba(255,255,255,0.1)', borderRadius: '4px', fontSize: '0.85rem' }}>Method: {entry.data.method}</span>
-                        <span className="stat-pill" style={{ padding: '2px 8px', background: 'rgba(255,255,255,0.1)', borderRadius: '4px', fontSize: '0.85rem' }}>Frames: {entry.data.total_frames}</span>
-                        <span className="stat-pill" style={{ padding: '2px 8px', background: 'rgba(255,255,255,0.1)', borderRadius: '4px', fontSize: '0.85rem' }}>Size: {(entry.data.file_size / 1024 / 1024).toFixed(2)} MB</span>
-                    </div>
+                    <>
+                        <div className="summary-stats" style={{ display: 'flex', gap: '8px', flexWrap: 'wrap', marginBottom: '12px', justifyContent: 'center' }}>
+                            <span className="stat-pill" style={{ padding: '2px 8px', background: 'rgba(255,255,255,0.1)', borderRadius: '4px', fontSize: '0.85rem' }}>Method: {entry.data.method}</span>
+                            <span className="stat-pill" style={{ padding: '2px 8px', background: 'rgba(255,255,255,0.1)', borderRadius: '4px', fontSize: '0.85rem' }}>Frames: {entry.data.total_frames}</span>
+                            <span className="stat-pill" style={{ padding: '2px 8px', background: 'rgba(255,255,255,0.1)', borderRadius: '4px', fontSize: '0.85rem' }}>Size: {(entry.data.file_size / 1024 / 1024).toFixed(2)} MB</span>
+                            {entry.data.query_url && !preview && (
+                                <button onClick={() => loadPreview()} style={{ padding: '2px 8px', fontSize: '0.85rem', cursor: 'pointer' }}>
+                                    Preview Frames
+                                </button>
+                            )}
+                            {previewError && <span style={{ fontSize: '0.85rem', color: '#e66' }}>{previewError}</span>}
+                        </div>
+                        {preview && (
+                            <div className="detection-preview">
+                                <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', marginBottom: '0.5rem', fontSize: '0.85rem' }}>
+                                    <button
+                                        disabled={preview.start_frame <= preview.meta.first_frame}
+                                        onClick={() => loadPreview(Math.max(preview.meta.first_frame, preview.start_frame - PREVIEW_FRAMES * preview.meta.frame_stride))}
+                                    >
+                                        ◀
+                                    </button>
+                                    <span>
+                                        Frames {preview.results[0]?.frameNumber ?? preview.start_frame}–{preview.results[preview.results.length - 1]?.frameNumber ?? preview.end_frame}
+                                    </span>
+                                    <button disabled={preview.next_frame === null} onClick={() => loadPreview(preview.next_frame)}>▶</button>
+                                </div>
+                                <div className="player-items-scroll" style={{ maxHeight: '200px', overflowY: 'auto', background: '#222', padding: '0.5rem', borderRadius: '4px' }}>
+                                    {preview.results.map((frame) => (
+                                        <div key={frame.frameNumber} style={{ fontSize: '0.8rem', color: '#aaa', marginBottom: '0.25rem' }}>
+                                            #{frame.frameNumber} ({frame.videoTimestamp.toFixed(2)}s): {frame.left_view.length} left, {frame.right_view.length} right
+                                        </div>
+                                    ))}
+                                </div>
+                            </div>
+                        )}
+                    </>
                 ) : (
                     /* Detailed Player Lists with Counts merged in */
                     <div className="player-lists-detail" style={{ marginTop: '0', display: 'grid', gridTemplateColumns: '1fr 1fr', gap: '1rem' }}>
@@ -157,12 +231,15 @@ function DetectionResultCard({ entry, boundsEntry, duration }) {
                             </div>
 
                             <div className="player-items-scroll" style={{ maxHeight: '200px', overflowY: 'auto', background: '#222', padding: '0.5rem', borderRadius: '4px' }}>
-                                {(entry.data.top_players || []).map((p, i) => (
+                                {playersOmitted && (
+                                    <button onClick={handleShowPlayers} style={{ fontSize: '0.8rem', cursor: 'pointer' }}>Show players</button>
+                                )}
+                                {(data.top_players || []).map((p, i) => (
                                     <div key={i} style={{ fontSize: '0.8rem', color: '#aaa', marginBottom: '0.25rem' }}>
                                         #{i + 1}: ({Math.round(p.x1)}, {Math.round(p.y1)}) → ({Math.round(p.x2)}, {Math.round(p.y2)}) <span style={{ color: '#666' }}>[{p.confidence?.toFixed(2)}]</span>
                                     </div>
                                 ))}
-                                {(!entry.data.top_players || entry.data.top_players.length === 0) && <div style={{ fontSize: '0.8rem', color: '#666' }}>No players</div>}
+                                {!playersOmitted && (!data.top_players || data.top_players.length === 0) && <div style={{ fontSize: '0.8rem', color: '#666' }}>No players</div>}
                             </div>
                         </div>
 
@@ -181,12 +258,15 @@ function DetectionResultCard({ entry, boundsEntry, duration }) {
                             </div>
 
                             <div className="player-items-scroll" style={{ maxHeight: '200px', overflowY: 'auto', background: '#222', padding: '0.5rem', borderRadius: '4px' }}>
-                                {(entry.data.bottom_players || []).map((p, i) => (
+                                {playersOmitted && (
+                                    <button onClick={handleShowPlayers} style={{ fontSize: '0.8rem', cursor: 'pointer' }}>Show players</button>
+                                )}
+                                {(data.bottom_players || []).map((p, i) => (
                                     <div key={i} style={{ fontSize: '0.8rem', color: '#aaa', marginBottom: '0.25rem' }}>
                                         #{i + 1}: ({Math.round(p.x1)}, {Math.round(p.y1)}) → ({Math.round(p.x2)}, {Math.round(p.y2)}) <span style={{ color: '#666' }}>[{p.confidence?.toFixed(2)}]</span>
                                     </div>
                                 ))}
-                                {(!entry.data.bottom_players || entry.data.bottom_players.length === 0) && <div style={{ fontSize: '0.8rem', color: '#666' }}>No players</div>}
+                                {!playersOmitted && (!data.bottom_players || data.bottom_players.length === 0) && <div style={{ fontSize: '0.8rem', color: '#666' }}>No players</div>}
                             </div>
                         </div>
                     </div>
@@ -1,9 +1,14 @@
 import React, { useState, useEffect, useRef } from 'react'
 import './ExperimentList.css'
 
+// Experiments fetched per page
+const PAGE_SIZE = 50
+
 function ExperimentList({ onSelectExperiment }) {
     const [experiments, setExperiments] = useState([])
+    const [nextCursor, setNextCursor] = useState(null) // Where the next page starts, null when all are loaded
     const [loading, setLoading] = useState(true)
+    const [loadingMore, setLoadingMore] = useState(false)
     const [error, setError] = useState(null)
     const [deleteConfirm, setDeleteConfirm] = useState(null)
     const deleteTimeoutRef = useRef(null)
@@ -17,15 +22,22 @@ function ExperimentList({ onSelectExperiment }) {
         }
     }, [])
 
+    const fetchPage = async (cursor) => {
+        const params = new URLSearchParams({ limit: PAGE_SIZE })
+        if (cursor) params.set('cursor', cursor)
+        const response = await fetch(`http://localhost:8000/experiments?${params}`)
+        if (!response.ok) {
+            throw new Error('Failed to load experiments')
+        }
+        return response.json()
+    }
+
     const loadExperiments = async () => {
         try {
             setLoading(true)
-            const response = await fetch('http://localhost:8000/experiments')
-            if (!response.ok) {
-                throw new Error('Failed to load experiments')
-            }
-            const data = await response.json()
+            const data = await fetchPage(null)
             setExperiments(data.experiments || [])
+            setNextCursor(data.next_cursor || null)
         } catch (err) {
             setError(err.message)
         } finally {
@@ -33,6 +45,19 @@ function ExperimentList({ onSelectExperiment }) {
         }
     }
 
+    const loadMoreExperiments = async () => {
+        try {
+            setLoadingMore(true)
+            const data = await fetchPage(nextCursor)
+            setExperiments(prev => [...prev, ...(data.experiments || [])])
+            setNextCursor(data.next_cursor || null)
+        } catch (err) {
+            setError(err.message)
+        } finally {
+            setLoadingMore(false)
+        }
+    }
+
     const generateDefaultName = () => {
         const now = new Date()
         const month = now.toLocaleString('default', { month: 'short' }).toLowerCase()
@@ -182,6 +207,14 @@ function ExperimentList({ onSelectExperiment }) {
                 </div>
             )
             }
+
+            {nextCursor && (
+                <div className="load-more">
+                    <button onClick={loadMoreExperiments} className="create-button" disabled={loadingMore}>
+                        {loadingMore ? 'Loading...' : 'Load more'}
+                    </button>
+                </div>
+            )}
         </div >
     )
 }
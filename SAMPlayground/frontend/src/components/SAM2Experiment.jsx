@@ -13,6 +13,54 @@ const methodLabels = {
     'grid_1280': 'FOP Bands 1280 (Dynamic)'
 }
 
+// Pushes a backend job's progress events (stage, frame, fps, ETA, per-view status) to onProgress
+// over server-sent events, closing the stream once the job has finished. A job may report
+// status 'completed' while it is still saving its result, so onProgress gets a second argument
+// that is true only for the final event - act on completion there, it comes exactly once.
+function watchJobProgress(jobId, onProgress) {
+    const source = new EventSource(`http://localhost:8000/jobs/${jobId}/events`)
+    source.onmessage = (event) => {
+        const progressData = JSON.parse(event.data)
+        const finished = progressData.job_status !== 'queued' && progressData.job_status !== 'running'
+        if (finished) {
+            source.close()
+        }
+        onProgress(progressData, finished)
+    }
+    source.onerror = (error) => console.error('Job progress stream error:', error)
+    return source
+}
+
+// Streams a full-video detection job's per-frame records (NDJSON) to onFrame as they are produced.
+// The stream ends when the job has finished; after a dropped connection it resumes from the next frame.
+async function followDetections(jobId, onFrame, fromFrame = 0) {
+    let nextFrame = fromFrame
+    for (let attempt = 0; attempt < 3; attempt++) {
+        try {
+            const response = await fetch(`http://localhost:8000/jobs/${jobId}/detections?from_frame=${nextFrame}`)
+            if (!response.ok) throw new Error(`Stream failed: ${response.status}`)
+            const reader = response.body.getReader()
+            const decoder = new TextDecoder()
+            let buffered = ''
+            for (;;) {
+                const { done, value } = await reader.read()
+                if (done) return
+                buffered += decoder.decode(value, { stream: true })
+                const lines = buffered.split('\n')
+                buffered = lines.pop()
+                for (const line of lines) {
+                    if (!line) continue
+                    const frame = JSON.parse(line)
+                    nextFrame = frame.frameNumber + 1
+                    onFrame(frame)
+                }
+            }
+        } catch (error) {
+            console.error('Detection stream error:', error)
+        }
+    }
+}
+
 function SAM2Experiment({ experimentId }) {
     const [experiment, setExperiment] = useState(null)
     const [experimentName, setExperimentName] = useState('unnamed experiment')
@@ -32,6 +80,7 @@ function SAM2Experiment({ experimentId }) {
     const [fullVideoResult, setFullVideoResult] = useState(null) // Result URL when complete
     const [fullClipDetectionProgress, setFullClipDetectionProgress] = useState(null) // {percent, message, status}
     const [fullClipDetectionResult, setFullClipDetectionResult] = useState(null) // Download JSON info
+    const [liveDetection, setLiveDetection] = useState(null) // Latest streamed frame of a running detection
     const [error, setError] = useState(null) // Global error state
     const [errorLog, setErrorLog] = useState([]) // Track all errors
     const [draggingBound, setDraggingBound] = useState(null)
@@ -788,23 +837,27 @@ function SAM2Experiment({ experimentId }) {
                 const errorText = await response.text()
                 throw new Error(`Failed to start full video detection: ${errorText}`)
             }
+            const { job_id: jobId } = await response.json()
 
-            // Start polling for progress
-            const pollInterval = setInterval(async () => {
-                try {
-                    const progressResponse = await fetch(`http://localhost:8000/detection-progress/${filename}`)
-                    const progressData = await progressResponse.json()
+            // Show detections as they come in, well before the whole clip is done
+            setLiveDetection(null)
+            followDetections(jobId, setLiveDetection)
 
+            // Follow progress as the backend pushes it
+            watchJobProgress(jobId, async (progressData, finished) => {
+                try {
                     setFullClipDetectionProgress({
                         percent: progressData.percent || 0,
                         message: progressData.message || 'Processing...',
                         status: progressData.status,
                         current_frame: progressData.current_frame,
-                        total_frames: progressData.total_frames
+                        total_frames: progressData.total_frames,
+                        fps: progressData.fps,
+                        eta_seconds: progressData.eta_seconds
                     })
 
+                    if (!finished) return
                     if (progressData.status === 'completed') {
-                        clearInterval(pollInterval)
                         setFullClipDetectionResult(progressData)
 
                         // Map mode to readable label
@@ -822,16 +875,16 @@ function SAM2Experiment({ experimentId }) {
                             file_size: progressData.file_size,
                             execution_time: progressData.execution_time,
                             result_url: progressData.result_url,
+                            query_url: progressData.query_url,
                             filename: progressData.filename
                         })
                     } else if (progressData.status === 'error') {
-                        clearInterval(pollInterval)
                         setError(`❌ Detection error: ${progressData.message}`)
                     }
                 } catch (error) {
-                    console.error('Error polling detection progress:', error)
+                    console.error('Error handling detection progress:', error)
                 }
-            }, 1000)
+            })
 
         } catch (error) {
             console.error('Error starting full video detection:', error)
@@ -929,34 +982,30 @@ function SAM2Experiment({ experimentId }) {
                 setFullVideoProgress({ percent: 0, message: `Error: ${errorText}`, status: 'error' })
                 return
             }
+            const { job_id: jobId } = await response.json()
+
+            // Follow progress as the backend pushes it
+            watchJobProgress(jobId, (progressData, finished) => {
+                setFullVideoProgress({
+                    percent: progressData.percent || 0,
+                    message: progressData.message || 'Processing...',
+                    status: progressData.status,
+                    current_frame: progressData.current_frame,
+                    total_frames: progressData.total_frames,
+                    fps: progressData.fps,
+                    eta_seconds: progressData.eta_seconds,
+                    views: progressData.views
+                })
 
-            // Start polling for progress
-            const pollInterval = setInterval(async () => {
-                try {
-                    const progressResponse = await fetch(`http://localhost:8000/segment-progress/${filename}`)
-                    const progressData = await progressResponse.json()
-
-                    setFullVideoProgress({
-                        percent: progressData.percent || 0,
-                        message: progressData.message || 'Processing...',
-                        status: progressData.status,
-                        current_frame: progressData.current_frame,
-                        total_frames: progressData.total_frames
-                    })
-
-                    if (progressData.status === 'completed') {
-                        clearInterval(pollInterval)
-                        setFullVideoResult(progressData.result_url)
-                        setFullVideoMessage('✅ Full video segmentation complete!')
-                        setTimeout(() => setFullVideoMessage(''), 4000)
-                    } else if (progressData.status === 'error') {
-                        clearInterval(pollInterval)
-                        setFullVideoMessage(`❌ Error: ${progressData.message}`)
-                    }
-                } catch (error) {
-                    console.error('Error polling progress:', error)
+                if (!finished) return
+                if (progressData.status === 'completed') {
+                    setFullVideoResult(progressData.result_url)
+                    setFullVideoMessage('✅ Full video segmentation complete!')
+                    setTimeout(() => setFullVideoMessage(''), 4000)
+                } else if (progressData.status === 'error') {
+                    setFullVideoMessage(`❌ Error: ${progressData.message}`)
                 }
-            }, 1000) // Poll every second
+            })
 
         } catch (error) {
             console.error('Error starting full video segmentation:', error)
@@ -1284,6 +1333,13 @@ function SAM2Experiment({ experimentId }) {
                                 {fullVideoProgress.current_frame && (
                                     <div className="progress-detail">
                                         Frame {fullVideoProgress.current_frame} / {fullVideoProgress.total_frames}
+                                        {fullVideoProgress.fps && ` · ${fullVideoProgress.fps.toFixed(1)} fps`}
+                                        {fullVideoProgress.eta_seconds != null && ` · ${Math.ceil(fullVideoProgress.eta_seconds)}s left`}
+                                    </div>
+                                )}
+                                {fullVideoProgress.views && (
+                                    <div className="progress-detail">
+                                        {Object.entries(fullVideoProgress.views).map(([name, view]) => `${name}: ${view.status} ${view.percent}%`).join(' · ')}
                                     </div>
                                 )}
                             </div>
@@ -1478,6 +1534,11 @@ function SAM2Experiment({ experimentId }) {
                                                 <div style={{ textAlign: 'center' }}>
                                                     <div style={{ fontSize: '0.8rem', color: '#646cff', fontWeight: 'bold' }}>{fullClipDetectionProgress.percent}%</div>
                                                     <div style={{ fontSize: '0.6rem', color: '#ccc', whiteSpace: 'nowrap' }}>{fullClipDetectionProgress.message}</div>
+                                                    {liveDetection && (
+                                                        <div style={{ fontSize: '0.6rem', color: '#8f8', whiteSpace: 'nowrap' }}>
+                                                            Frame {liveDetection.frameNumber}: {liveDetection.left_view.length} left, {liveDetection.right_view.length} right
+                                                        </div>
+                                                    )}
                                                 </div>
                                             </div>
                                         )}
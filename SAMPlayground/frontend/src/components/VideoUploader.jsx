@@ -1,9 +1,69 @@
 import React, { useState, useRef } from 'react'
 import './VideoUploader.css'
 
+const API_URL = 'http://localhost:8000'
+const PART_SIZE = 64 * 1024 * 1024 // matches the backend default
+const PARALLEL_PARTS = 4
+const MAX_PART_RETRIES = 3
+
+// Resumable session for this exact file, if a previous upload was interrupted
+const sessionKey = (file) => `upload:${file.name}:${file.size}:${file.lastModified}`
+
+async function uploadInParts(file, onProgress) {
+    let session = null
+    const savedId = localStorage.getItem(sessionKey(file))
+    if (savedId) {
+        const res = await fetch(`${API_URL}/uploads/${savedId}`)
+        if (res.ok) session = await res.json()
+    }
+    if (!session) {
+        const res = await fetch(`${API_URL}/uploads`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size, part_size: PART_SIZE }),
+        })
+        if (!res.ok) throw new Error('Could not start upload')
+        session = await res.json()
+        localStorage.setItem(sessionKey(file), session.upload_id)
+    }
+
+    const { upload_id, part_size } = session
+    const queue = [...session.missing_parts]
+    let done = session.parts - queue.length
+    onProgress(done / session.parts)
+
+    const sendPart = async (index) => {
+        const blob = file.slice(index * part_size, Math.min(file.size, (index + 1) * part_size))
+        for (let attempt = 1; ; attempt++) {
+            try {
+                const res = await fetch(`${API_URL}/uploads/${upload_id}/parts/${index}`, { method: 'PUT', body: blob })
+                if (res.ok) return
+                if (res.status < 500 || attempt >= MAX_PART_RETRIES) throw new Error(`Part ${index} failed`)
+            } catch (error) {
+                if (attempt >= MAX_PART_RETRIES) throw error
+            }
+        }
+    }
+
+    const worker = async () => {
+        while (queue.length > 0) {
+            await sendPart(queue.shift())
+            done += 1
+            onProgress(done / session.parts)
+        }
+    }
+    await Promise.all(Array.from({ length: Math.min(PARALLEL_PARTS, queue.length) }, worker))
+
+    const res = await fetch(`${API_URL}/uploads/${upload_id}/complete`, { method: 'POST' })
+    if (!res.ok) throw new Error('Could not complete upload')
+    localStorage.removeItem(sessionKey(file))
+    return res.json()
+}
+
 function VideoUploader({ onUploadComplete }) {
     const [isDragging, setIsDragging] = useState(false)
     const [uploading, setUploading] = useState(false)
+    const [progress, setProgress] = useState(0)
     const fileInputRef = useRef(null)
 
     const handleDragOver = (e) => {
@@ -37,22 +97,28 @@ function VideoUploader({ onUploadComplete }) {
         }
 
         setUploading(true)
-        const formData = new FormData()
-        formData.append('file', file)
+        setProgress(0)
 
         try {
-            const response = await fetch('http://localhost:8000/upload', {
-                method: 'POST',
-                body: formData,
-            })
-
-            if (!response.ok) throw new Error('Upload failed')
+            let data
+            if (file.size > PART_SIZE) {
+                // Large recordings go up in parallel parts and resume after a dropped connection
+                data = await uploadInParts(file, setProgress)
+            } else {
+                const formData = new FormData()
+                formData.append('file', file)
+                const response = await fetch(`${API_URL}/upload`, {
+                    method: 'POST',
+                    body: formData,
+                })
+                if (!response.ok) throw new Error('Upload failed')
+                data = await response.json()
+            }
 
-            const data = await response.json()
             onUploadComplete(data.url)
         } catch (error) {
             console.error('Error uploading video:', error)
-            alert('Failed to upload video')
+            alert('Failed to upload video. Drop the same file again to resume.')
         } finally {
             setUploading(false)
         }
@@ -78,6 +144,7 @@ function VideoUploader({ onUploadComplete }) {
             {uploading ? (
                 <div className="upload-status-compact">
                     <div className="spinner-small"></div>
+                    {progress > 0 && <span className="upload-text">{Math.round(progress * 100)}%</span>}
                 </div>
             ) : (
                 <div className="upload-content-compact">